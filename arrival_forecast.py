@@ -0,0 +1,59 @@
+import time
+
+# ==========================================
+# PREVISIÓN DE LLEGADAS (PRE-ESCALADO)
+# ==========================================
+# Un Pod nuevo tarda minutos en arrancar: si esperamos a ver la cola llena, cada
+# ráfaga paga el arranque entero. Aquí contamos llegadas por intervalos fijos y
+# suavizamos la tasa con Holt (nivel + tendencia), así el pool puede pedir GPUs
+# cuando la tasa prevista para dentro de "lo que tarda un Pod" lo justifica.
+# Los intervalos sin llegadas cuentan como 0: la previsión decae sola en calma.
+
+FORECAST_BUCKET_S = 10.0     # Tamaño del intervalo de conteo
+FORECAST_ALPHA = 0.5         # Peso del último intervalo en el nivel
+FORECAST_BETA = 0.2          # Peso del último cambio en la tendencia
+MAX_IDLE_BUCKETS = 60        # Tras tanto tiempo sin llegadas, se reinicia a cero
+
+
+class ArrivalForecaster:
+    def __init__(self, bucket_s=FORECAST_BUCKET_S, alpha=FORECAST_ALPHA, beta=FORECAST_BETA, clock=time.monotonic):
+        self.bucket_s = bucket_s
+        self.alpha = alpha
+        self.beta = beta
+        self.clock = clock
+        self.level = 0.0           # Llegadas/s suavizadas
+        self.trend = 0.0           # Cambio de la tasa por intervalo
+        self.total = 0
+        self._bucket_start = clock()
+        self._bucket_count = 0
+
+    def _roll(self, now):
+        """Cierra los intervalos terminados y actualiza nivel y tendencia."""
+        elapsed = int((now - self._bucket_start) // self.bucket_s)
+        if elapsed <= 0:
+            return
+        if elapsed > MAX_IDLE_BUCKETS:
+            self.level = self.trend = 0.0
+        else:
+            for i in range(elapsed):
+                rate = self._bucket_count / self.bucket_s if i == 0 else 0.0
+                previous = self.level
+                self.level = self.alpha * rate + (1 - self.alpha) * (self.level + self.trend)
+                self.trend = self.beta * (self.level - previous) + (1 - self.beta) * self.trend
+        self._bucket_count = 0
+        self._bucket_start += elapsed * self.bucket_s
+
+    def record(self, count=1):
+        now = self.clock()
+        self._roll(now)
+        self._bucket_count += count
+        self.total += count
+
+    def rate(self):
+        self._roll(self.clock())
+        return max(0.0, self.level)
+
+    def forecast(self, horizon_s):
+        """Tasa (llegadas/s) prevista dentro de horizon_s segundos."""
+        self._roll(self.clock())
+        return max(0.0, self.level + self.trend * horizon_s / self.bucket_s)
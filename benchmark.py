@@ -1,23 +1,40 @@
+import argparse
+import asyncio
+import csv
 import json
+import random
+import sys
 import time
-import numpy as np
-import random 
-from urllib import request, error
 
-# --- CONFIGURACIÓN ---
-ITERACIONES = 10               
+import numpy as np
 
-# --- CONFIGURACIÓN DE URL ---
-url_input = input("Introduce la URL del Pod (Enter para local 127.0.0.1:8188): ").strip()
+from comfy_client import ComfyClient, ComfyError, ConnectionStats, new_session, execution_seconds
 
-if not url_input:
-    COMFY_URL = "http://127.0.0.1:8188"
-else:
-    COMFY_URL = url_input.rstrip("/")
-    if not COMFY_URL.startswith("http"):
-        COMFY_URL = f"https://{COMFY_URL}"
+# ==========================================
+# GENERADOR DE CARGA CONTRA UN POD DE COMFYUI
+# ==========================================
+# Antes: 10 peticiones en serie, URL por input() y solo la media. Ahora:
+#  - CLI sin preguntas (sirve en CI y en scripts de comparación entre Pods/GPUs).
+#  - Bucle cerrado: N clientes, cada uno envía el siguiente prompt al terminar el anterior.
+#  - Bucle abierto: llegadas a una tasa objetivo (Poisson o uniformes) aunque el Pod no
+#    dé abasto; así se ve cómo crece la cola, cosa que el bucle cerrado esconde.
+#  - Las primeras --warmup peticiones (carga del modelo en VRAM, conexiones) no cuentan.
+#  - p50/p90/p99/máx de latencia, imágenes/min y desglose cola vs GPU a partir de los
+#    eventos execution_start / execution_success de /history.
+#  - Exportación a JSON (resumen + peticiones) y CSV (una fila por petición).
+#  - --fake levanta un ComfyUI falso local (fake_comfyui.py) para CI.
+#
+# Cola = desde el envío hasta execution_start; GPU = execution_start -> execution_success;
+# el resto de la latencia es red + detección del fin (polling de /history). Contra un
+# Pod remoto la cola depende de que los relojes estén razonablemente sincronizados.
 
-print(f"🎯 Apuntando a: {COMFY_URL}")
+COMFY_URL = "http://127.0.0.1:8188"
+ITERACIONES = 10               # Peticiones medidas por defecto
+WARMUP = 1                     # Peticiones iniciales que no cuentan
+CLIENTES = 1                   # Clientes concurrentes (bucle cerrado)
+POLL_INTERVAL_S = 0.1          # Cada cuánto se pregunta por /history de cada petición
+REQUEST_TIMEOUT_S = 600        # Máximo por petición
+PERCENTILES = (50, 90, 99)
 
 # HEADERS (Disfraz de navegador)
 HEADERS = {
@@ -26,23 +43,29 @@ HEADERS = {
     "Accept": "*/*"
 }
 
-def get_available_model():
+CSV_FIELDS = ["index", "warmup", "ok", "sent_at_s", "latency_s", "queue_s", "gpu_s", "overhead_s", "images", "error"]
+
+
+def normalize_url(url):
+    url = (url or COMFY_URL).strip().rstrip("/")
+    return url if url.startswith("http") else f"https://{url}"
+
+
+async def get_available_model(client):
     """Pregunta al servidor qué modelos tiene instalados."""
     try:
-        req = request.Request(f"{COMFY_URL}/object_info/CheckpointLoaderSimple", headers=HEADERS)
-        with request.urlopen(req) as response:
-            data = json.loads(response.read())
-            # RunPod suele tener SDXL o v1.5. Cogemos el primero de la lista.
-            modelos = data['CheckpointLoaderSimple']['input']['required']['ckpt_name'][0]
-            if modelos:
-                print(f"✅ Modelo detectado en servidor: {modelos[0]}")
-                return modelos[0]
-            return None
+        modelos = await client.get_checkpoints()
+        # RunPod suele tener SDXL o v1.5. Cogemos el primero de la lista.
+        if modelos:
+            print(f"✅ Modelo detectado en servidor: {modelos[0]}")
+            return modelos[0]
+        return None
     except Exception as e:
         print(f"⚠️ No pude detectar modelos automáticamente: {e}")
         return None
 
-def build_workflow(model_name):
+
+def build_workflow(model_name, steps=20, width=512, height=512):
     """Crea un workflow básico en memoria usando el modelo detectado."""
     # Este es un flujo estándar Txt2Img que funciona en cualquier ComfyUI
     return {
@@ -51,7 +74,7 @@ def build_workflow(model_name):
             "inputs": {
                 "cfg": 8, "denoise": 1, "latent_image": ["5", 0], "model": ["4", 0],
                 "negative": ["7", 0], "positive": ["6", 0], "sampler_name": "euler",
-                "scheduler": "normal", "seed": 0, "steps": 20
+                "scheduler": "normal", "seed": 0, "steps": steps
             }
         },
         "4": {
@@ -60,7 +83,7 @@ def build_workflow(model_name):
         },
         "5": {
             "class_type": "EmptyLatentImage",
-            "inputs": { "batch_size": 1, "height": 512, "width": 512 }
+            "inputs": { "batch_size": 1, "height": height, "width": width }
         },
         "6": {
             "class_type": "CLIPTextEncode",
@@ -80,74 +103,270 @@ def build_workflow(model_name):
         }
     }
 
-def queue_prompt(workflow):
-    p = {"prompt": workflow}
-    data = json.dumps(p).encode('utf-8')
-    req = request.Request(f"{COMFY_URL}/prompt", data=data, headers=HEADERS)
-    try:
-        response = request.urlopen(req)
-        return json.loads(response.read())
-    except error.HTTPError as e:
-        print(f"❌ Error HTTP {e.code}: {e.read().decode('utf-8')}")
-        return None
-    except Exception as e:
-        print(f"❌ Error conexión: {e}")
+
+def request_workflow(base, index):
+    """Copia del workflow con semilla y texto únicos (anti-caché de ComfyUI)."""
+    workflow = json.loads(json.dumps(base))
+    semilla = int(time.time() * 1000) + index
+    workflow["3"]["inputs"]["seed"] = semilla
+    workflow["6"]["inputs"]["text"] = f"landscape of a futuristic city, high quality --no_cache_{semilla}"
+    return workflow
+
+
+def event_times(entry):
+    """Timestamps (s de época) de execution_start y del fin según los mensajes de /history."""
+    stamps = {}
+    for event, data in entry.get("status", {}).get("messages", []):
+        if "timestamp" in data:
+            stamps[event] = data["timestamp"] / 1000
+    return stamps.get("execution_start"), stamps.get("execution_success") or stamps.get("execution_error")
+
+
+class LoadGenerator:
+    def __init__(self, client, workflow, total, warmup=WARMUP, poll_interval=POLL_INTERVAL_S,
+                 timeout=REQUEST_TIMEOUT_S):
+        self.client = client
+        self.workflow = workflow
+        self.total = total             # Peticiones totales (incluido el calentamiento)
+        self.warmup = warmup
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.results = []
+        self.started = None
+        self.max_send_lag_s = 0.0      # Retraso máximo del generador en bucle abierto
+
+    async def one_request(self, index):
+        """Envía un prompt y espera a que aparezca en /history. Devuelve su registro."""
+        record = {"index": index, "warmup": index < self.warmup, "ok": False, "sent_at_s": None,
+                  "latency_s": None, "queue_s": None, "gpu_s": None, "overhead_s": None, "images": 0, "error": None}
+        workflow = request_workflow(self.workflow, index)
+        sent_wall = time.time()
+        sent = time.perf_counter()
+        record["sent_at_s"] = round(sent - self.started, 4)
+        try:
+            response = await self.client.queue_prompt(workflow)
+            prompt_id = response["prompt_id"]
+            deadline = sent + self.timeout
+            while True:
+                history = await self.client.get_history(prompt_id)
+                if prompt_id in history:
+                    entry = history[prompt_id]
+                    break
+                if time.perf_counter() > deadline:
+                    raise ComfyError(f"Timeout esperando el prompt {prompt_id}")
+                await asyncio.sleep(self.poll_interval)
+            latency = time.perf_counter() - sent
+            record["latency_s"] = round(latency, 4)
+            status = entry.get("status", {}).get("status_str", "success")
+            if status != "success":
+                raise ComfyError(f"Ejecución fallida en ComfyUI: {status}")
+            exec_start, _exec_end = event_times(entry)
+            gpu = execution_seconds(entry)
+            if exec_start is not None:
+                record["queue_s"] = round(max(0.0, exec_start - sent_wall), 4)
+            if gpu is not None:
+                record["gpu_s"] = round(gpu, 4)
+                record["overhead_s"] = round(max(0.0, latency - gpu - (record["queue_s"] or 0.0)), 4)
+            record["images"] = sum(len(output.get("images", [])) for output in entry.get("outputs", {}).values())
+            record["ok"] = True
+        except (ComfyError, asyncio.TimeoutError, OSError, KeyError, ValueError) as e:
+            record["error"] = str(e) or type(e).__name__
+            print(f"❌ Petición {index}: {record['error']}")
+        record["finished_at_s"] = round(time.perf_counter() - self.started, 4)
+        self.results.append(record)
+        etiqueta = " (calentamiento)" if record["warmup"] else ""
+        if record["ok"]:
+            print(f"   Petición {index + 1}/{self.total}: {record['latency_s']:.2f}s{etiqueta}")
+        return record
+
+    async def run_closed(self, clients):
+        """Bucle cerrado: cada cliente encadena peticiones hasta completar el total."""
+        self.started = time.perf_counter()
+        pending = iter(range(self.total))
+
+        async def worker():
+            for index in pending:
+                await self.one_request(index)
+
+        await asyncio.gather(*(worker() for _ in range(clients)))
+
+    async def run_open(self, rate, arrivals="poisson", seed=None):
+        """Bucle abierto: una petición nueva cada 1/rate s de media, termine o no la anterior."""
+        rng = random.Random(seed)
+        self.started = time.perf_counter()
+        tasks = []
+        next_send = 0.0
+        for index in range(self.total):
+            delay = next_send - (time.perf_counter() - self.started)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            else:
+                self.max_send_lag_s = max(self.max_send_lag_s, -delay)
+            tasks.append(asyncio.create_task(self.one_request(index)))
+            next_send += rng.expovariate(rate) if arrivals == "poisson" else 1 / rate
+        await asyncio.gather(*tasks)
+
+
+def describe(values):
+    if not values:
         return None
+    stats = {f"p{q}": round(float(np.percentile(values, q)), 4) for q in PERCENTILES}
+    stats["mean"] = round(float(np.mean(values)), 4)
+    stats["max"] = round(float(np.max(values)), 4)
+    return stats
+
+
+def summarize(results, warmup):
+    measured = [r for r in results if not r["warmup"]]
+    ok = [r for r in measured if r["ok"]]
+    summary = {
+        "requests": len(measured),
+        "warmup_excluded": sum(r["warmup"] for r in results),
+        "errors": len(measured) - len(ok),
+        "latency_s": describe([r["latency_s"] for r in ok]),
+        "queue_s": describe([r["queue_s"] for r in ok if r["queue_s"] is not None]),
+        "gpu_s": describe([r["gpu_s"] for r in ok if r["gpu_s"] is not None]),
+        "overhead_s": describe([r["overhead_s"] for r in ok if r["overhead_s"] is not None]),
+        "images": sum(r["images"] for r in ok),
+    }
+    # Ventana medida: del primer envío medido al último fin medido
+    if ok:
+        window = max(r["finished_at_s"] for r in ok) - min(r["sent_at_s"] for r in measured)
+        summary["window_s"] = round(window, 3)
+        summary["images_per_min"] = round(summary["images"] / window * 60, 2) if window > 0 else None
+    return summary
+
+
+def print_summary(summary, label):
+    print("\n" + "=" * 50)
+    print(f"📊 RESULTADOS FINALES ({label})")
+    print("=" * 50)
+    print(f"Peticiones:     {summary['requests']} medidas (+{summary['warmup_excluded']} de calentamiento), "
+          f"{summary['errors']} errores")
+    for name, key in (("Latencia", "latency_s"), ("En cola", "queue_s"), ("En GPU", "gpu_s"),
+                      ("Red/detección", "overhead_s")):
+        stats = summary.get(key)
+        if stats:
+            print(f"{name + ':':<16}p50 {stats['p50']:.2f}s  p90 {stats['p90']:.2f}s  p99 {stats['p99']:.2f}s  "
+                  f"máx {stats['max']:.2f}s")
+    if summary.get("images_per_min") is not None:
+        print(f"Rendimiento:    {summary['images_per_min']:.1f} imágenes/min ({summary['images']} en {summary['window_s']:.1f}s)")
+    print("=" * 50)
+
+
+def export(report, json_path=None, csv_path=None):
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"💾 Resultados en {json_path}")
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            writer.writeheader()
+            writer.writerows(sorted(report["requests"], key=lambda r: r["index"]))
+        print(f"💾 Peticiones en {csv_path}")
+
+
+def compare(paths):
+    """Tabla comparativa de varios JSON exportados (p. ej. un Pod 4090 contra un A100)."""
+    print(f"{'etiqueta':<24}{'modo':>8}{'img/min':>10}{'p50 (s)':>9}{'p90 (s)':>9}{'p99 (s)':>9}"
+          f"{'GPU p50':>9}{'cola p50':>9}{'errores':>9}")
+    for path in paths:
+        with open(path) as f:
+            report = json.load(f)
+        summary, config = report["summary"], report["config"]
+        latency = summary.get("latency_s") or {}
+        gpu = summary.get("gpu_s") or {}
+        queue = summary.get("queue_s") or {}
+        print(f"{config.get('label') or path:<24}{config['mode']:>8}{summary.get('images_per_min') or 0:>10}"
+              f"{latency.get('p50', '-'):>9}{latency.get('p90', '-'):>9}{latency.get('p99', '-'):>9}"
+              f"{gpu.get('p50', '-'):>9}{queue.get('p50', '-'):>9}{summary['errors']:>9}")
 
-def get_history(prompt_id):
+
+async def run_benchmark(url, mode="closed", clients=CLIENTES, requests=ITERACIONES, warmup=WARMUP, rate=1.0,
+                        arrivals="poisson", seed=None, model=None, steps=20, label=None,
+                        poll_interval=POLL_INTERVAL_S):
+    stats = ConnectionStats()
+    async with new_session(limit_per_host=max(clients, 1) if mode == "closed" else 0, stats=stats,
+                           headers=HEADERS) as session:
+        client = ComfyClient(session, url)
+        print(f"🎯 Apuntando a: {client.base_url}")
+        print("🔍 Analizando servidor remoto...")
+        model_name = model or await get_available_model(client)
+        if not model_name:
+            print("❌ No encontré ningún modelo checkpoints en el servidor. ¿Está vacío?")
+            return None
+
+        # Generamos el workflow dinámicamente
+        generator = LoadGenerator(client, build_workflow(model_name, steps=steps), requests + warmup,
+                                  warmup=warmup, poll_interval=poll_interval)
+        if mode == "closed":
+            print(f"🚀 Bucle cerrado: {clients} cliente(s), {requests} peticiones (+{warmup} de calentamiento)...")
+            await generator.run_closed(clients)
+        else:
+            print(f"🚀 Bucle abierto: {rate} peticiones/s ({arrivals}), {requests} peticiones (+{warmup} de calentamiento)...")
+            await generator.run_open(rate, arrivals=arrivals, seed=seed)
+            if generator.max_send_lag_s > 0.1:
+                print(f"⚠️ El generador se retrasó hasta {generator.max_send_lag_s:.2f}s respecto a la tasa objetivo.")
+
+    summary = summarize(generator.results, warmup)
+    summary["connections"] = stats.summary()
+    config = {"label": label or client.base_url, "url": client.base_url, "model": model_name, "mode": mode,
+              "clients": clients if mode == "closed" else None, "rate": rate if mode == "open" else None,
+              "arrivals": arrivals if mode == "open" else None, "requests": requests, "warmup": warmup,
+              "steps": steps, "timestamp": time.time()}
+    print_summary(summary, label or model_name)
+    print(f"Conexiones:     {stats.summary()}")
+    return {"config": config, "summary": summary,
+            "requests": sorted(generator.results, key=lambda r: r["index"])}
+
+
+async def run_against_fake(render_time, **options):
+    """Mismo benchmark contra un ComfyUI falso local (CI, sin GPU)."""
+    from fake_comfyui import FakeComfyUI
+
+    fake = FakeComfyUI(render_time=render_time, seed=42)
+    url = await fake.start()
     try:
-        req = request.Request(f"{COMFY_URL}/history/{prompt_id}", headers=HEADERS)
-        with request.urlopen(req) as response:
-            return json.loads(response.read())
-    except:
-        return {}
-
-def run_benchmark():
-    print("🔍 Analizando servidor remoto...")
-    model_name = get_available_model()
-    
-    if not model_name:
-        print("❌ No encontré ningún modelo checkpoints en el servidor. ¿Está vacío?")
-        return
-
-    # Generamos el workflow dinámicamente
-    workflow = build_workflow(model_name)
-    
-    print(f"🚀 Iniciando Benchmark ({ITERACIONES} iteraciones)...")
-    tiempos = []
-
-    for i in range(ITERACIONES):
-        # Anti-Caché: Cambiar semilla y texto
-        semilla = int(time.time() * 1000) + i
-        workflow["3"]["inputs"]["seed"] = semilla
-        workflow["6"]["inputs"]["text"] = f"landscape of a futuristic city, high quality --no_cache_{semilla}"
-
-        start_time = time.time()
-        
-        response = queue_prompt(workflow)
-        if not response: 
-            print("❌ Fallo al enviar prompt. Abortando.")
-            break
-            
-        prompt_id = response['prompt_id']
-        
-        while True:
-            history = get_history(prompt_id)
-            if prompt_id in history:
-                break
-            time.sleep(0.1)
-            
-        duration = time.time() - start_time
-        tiempos.append(duration)
-        print(f"   Iteración {i+1}: {duration:.2f}s")
-
-    if tiempos:
-        avg_time = np.mean(tiempos)
-        print("\n" + "="*40)
-        print(f"📊 RESULTADOS FINALES ({model_name})")
-        print("="*40)
-        print(f"Tiempo Medio:   {avg_time:.2f} s")
-        print("="*40)
+        return await run_benchmark(url, **options)
+    finally:
+        await fake.stop()
+
 
 if __name__ == "__main__":
-    run_benchmark()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generador de carga contra un Pod de ComfyUI")
+    parser.add_argument("--url", default=COMFY_URL, help="URL del Pod (ip:puerto o proxy https de RunPod)")
+    parser.add_argument("--fake", action="store_true", help="Levanta un ComfyUI falso local (CI)")
+    parser.add_argument("--render-time", type=float, default=0.2, help="Segundos por imagen del ComfyUI falso")
+    parser.add_argument("--mode", choices=("closed", "open"), default="closed")
+    parser.add_argument("--clients", type=int, default=CLIENTES, help="Clientes concurrentes (bucle cerrado)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Peticiones/s objetivo (bucle abierto)")
+    parser.add_argument("--arrivals", choices=("poisson", "uniform"), default="poisson")
+    parser.add_argument("--requests", type=int, default=ITERACIONES, help="Peticiones medidas")
+    parser.add_argument("--warmup", type=int, default=WARMUP, help="Peticiones iniciales que no cuentan")
+    parser.add_argument("--model", help="Checkpoint a usar (por defecto el primero del servidor)")
+    parser.add_argument("--steps", type=int, default=20)
+    parser.add_argument("--seed", type=int, help="Semilla de las llegadas del bucle abierto")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL_S)
+    parser.add_argument("--label", help="Nombre del Pod/GPU en los resultados (p. ej. 4090-community)")
+    parser.add_argument("--json", dest="json_path", help="Exporta resumen y peticiones a JSON")
+    parser.add_argument("--csv", dest="csv_path", help="Exporta una fila por petición a CSV")
+    parser.add_argument("--compare", nargs="+", metavar="JSON", help="Compara resultados exportados y sale")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(args.compare)
+        sys.exit(0)
+
+    options = dict(mode=args.mode, clients=args.clients, requests=args.requests, warmup=args.warmup,
+                   rate=args.rate, arrivals=args.arrivals, seed=args.seed, model=args.model, steps=args.steps,
+                   label=args.label, poll_interval=args.poll_interval)
+    if args.fake:
+        report = asyncio.run(run_against_fake(args.render_time, **options))
+    else:
+        report = asyncio.run(run_benchmark(normalize_url(args.url), **options))
+    if report is None:
+        sys.exit(1)
+    export(report, args.json_path, args.csv_path)
+    # En CI: fallar si no salió ninguna petición medida
+    sys.exit(0 if report["summary"]["requests"] > report["summary"]["errors"] else 1)
@@ -0,0 +1,86 @@
+import argparse
+import random
+import string
+import time
+
+from prompt_filter import PromptFilter, normalize
+
+# ==========================================
+# MICROBENCHMARK: FILTRO DE PALABRAS PROHIBIDAS
+# ==========================================
+# Compara el bucle original (un "bad_word in prompt.lower()" por término) con el
+# filtro compilado de prompt_filter.py. Con miles de términos el bucle original
+# es demasiado lento para pasar el millón de prompts, así que se mide sobre una
+# muestra y se extrapola.
+
+TERMINOS = 10_000
+PROMPTS = 1_000_000
+MUESTRA_BUCLE = 2_000
+PALABRAS_BASE = ("un", "astronauta", "en", "marte", "paisaje", "ciudad", "noche", "retrato",
+                 "estilo", "acuarela", "bosque", "luz", "dorada", "gato", "robot", "antiguo")
+
+
+def random_word(rng, min_len=4, max_len=10):
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len)))
+
+
+def make_prompts(rng, count, terms, banned_ratio=0.01):
+    prompts = []
+    for _ in range(count):
+        words = [rng.choice(PALABRAS_BASE) for _ in range(rng.randint(6, 16))]
+        if rng.random() < banned_ratio:
+            words.insert(rng.randrange(len(words)), rng.choice(terms))
+        prompts.append(" ".join(words))
+    return prompts
+
+
+def naive_check(prompt, terms):
+    lowered = prompt.lower()
+    for bad_word in terms:
+        if bad_word in lowered:
+            return bad_word
+    return None
+
+
+def run(n_terms, n_prompts, muestra, seed=1):
+    rng = random.Random(seed)
+    terms = sorted({random_word(rng) for _ in range(n_terms)})
+    prompts = make_prompts(rng, n_prompts, terms)
+
+    start = time.perf_counter()
+    prompt_filter = PromptFilter(terms)
+    t_compile = time.perf_counter() - start
+
+    start = time.perf_counter()
+    flagged = sum(bad_word is not None for bad_word in prompt_filter.validate_many(prompts))
+    t_filter = time.perf_counter() - start
+
+    sample = prompts[:muestra]
+    start = time.perf_counter()
+    naive_flagged = sum(naive_check(prompt, terms) is not None for prompt in sample)
+    t_naive = (time.perf_counter() - start) / len(sample)
+
+    # Coste solo de normalizar (cota inferior de cualquier filtro con normalización)
+    start = time.perf_counter()
+    for prompt in sample:
+        normalize(prompt)
+    t_normalize = (time.perf_counter() - start) / len(sample)
+
+    per_prompt = t_filter / len(prompts)
+    print(f"📊 Filtro de prompts ({len(terms):,} términos, {len(prompts):,} prompts)")
+    print(f"   Compilación de la lista:         {t_compile * 1e3:8.1f} ms")
+    print(f"   Bucle original (muestra {len(sample):,}):  {t_naive * 1e6:8.1f} µs/prompt "
+          f"-> ~{t_naive * len(prompts):,.0f} s para todos (detectados en muestra: {naive_flagged})")
+    print(f"   Filtro compilado:                {per_prompt * 1e6:8.1f} µs/prompt "
+          f"-> {t_filter:,.1f} s para todos ({flagged:,} detectados)")
+    print(f"   (de los cuales normalizar:       {t_normalize * 1e6:8.1f} µs/prompt)")
+    print(f"   Aceleración: x{t_naive / per_prompt:.0f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rendimiento del filtro de palabras prohibidas")
+    parser.add_argument("--terminos", type=int, default=TERMINOS)
+    parser.add_argument("--prompts", type=int, default=PROMPTS)
+    parser.add_argument("--muestra", type=int, default=MUESTRA_BUCLE, help="Prompts medidos con el bucle original")
+    args = parser.parse_args()
+    run(args.terminos, args.prompts, args.muestra)
@@ -0,0 +1,87 @@
+import argparse
+import io
+import json
+import os
+import random
+import time
+
+# ==========================================
+# BENCHMARK: INGESTA MASIVA VS NÚCLEOS
+# ==========================================
+# Mide submissions/s de bulk_ingest.ingest (parseo JSONL + validación + hash +
+# deduplicación + encolado) con la validación en el propio proceso y con
+# 2, 4... procesos (ingest_pool.py). Cada medida usa un orquestador nuevo con la
+# cola vacía y presupuesto de sobra, así que se aceptan todos los prompts limpios.
+# El techo del escalado lo marca la parte secuencial del proceso principal
+# (parseo del fichero, creación de los Job y la cola): ver la columna "speedup".
+
+LINEAS = 200_000
+PALABRAS = ("un", "astronauta", "en", "marte", "paisaje", "ciudad", "noche", "retrato", "estilo",
+            "acuarela", "bosque", "luz", "dorada", "gato", "robot", "antiguo", "montaña", "río", "óleo")
+PROHIBIDOS = ("sangre", "v10lencia", "drogas")
+RATIO_PROHIBIDOS = 0.01
+RATIO_DUPLICADOS = 0.05
+
+
+def make_jsonl(n, seed=1):
+    """Fichero JSONL en memoria con prompts realistas, algunos prohibidos y algunos repetidos."""
+    rng = random.Random(seed)
+    lines = []
+    for i in range(n):
+        if lines and rng.random() < RATIO_DUPLICADOS:
+            lines.append(rng.choice(lines))
+            continue
+        words = [rng.choice(PALABRAS) for _ in range(rng.randint(12, 40))]
+        if rng.random() < RATIO_PROHIBIDOS:
+            words.insert(rng.randrange(len(words)), rng.choice(PROHIBIDOS))
+        lines.append(json.dumps({"prompt": " ".join(words) + f" #{i}"}, ensure_ascii=False))
+    return "\n".join(lines)
+
+
+def worker_counts(max_workers):
+    counts, workers = [1], 2
+    while workers <= max_workers:
+        counts.append(workers)
+        workers *= 2
+    if counts[-1] != max_workers:
+        counts.append(max_workers)
+    return counts
+
+
+def bench(data, workers, batch_size):
+    from bulk_ingest import ingest, iter_jsonl
+    from fake_comfyui import LocalBackend
+    from queue_system import QueueOrchestrator
+
+    sistema = QueueOrchestrator(backend=LocalBackend("127.0.0.1:1"), budget=1e9)
+    start = time.perf_counter()
+    totals = ingest(sistema, iter_jsonl(io.StringIO(data)), batch_size=batch_size, progress=False, workers=workers)
+    elapsed = time.perf_counter() - start
+    return totals, elapsed
+
+
+def run(lines, max_workers, batch_size):
+    data = make_jsonl(lines)
+    print(f"📦 {lines:,} líneas JSONL, lotes de {batch_size}, hasta {max_workers} procesos "
+          f"({os.cpu_count()} núcleos en esta máquina)\n")
+    print(f"{'Procesos':>9} | {'Aceptadas':>10} | {'Rechazadas':>10} | {'Tiempo':>8} | {'Envíos/s':>10} | {'Speedup':>7}")
+    print("-" * 69)
+    results = []
+    base = None
+    for workers in worker_counts(max_workers):
+        totals, elapsed = bench(data, workers, batch_size)
+        rate = lines / elapsed
+        base = base or rate
+        results.append((workers, rate))
+        print(f"{workers:>9} | {totals['accepted']:>10,} | {totals['rejected']:>10,} | {elapsed:>7.2f}s | "
+              f"{rate:>10,.0f} | {rate / base:>6.2f}x")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envíos por segundo de la ingesta masiva según nº de procesos")
+    parser.add_argument("--lines", type=int, default=LINEAS)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+    run(args.lines, max(1, args.max_workers), args.batch_size)
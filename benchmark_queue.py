@@ -0,0 +1,72 @@
+import argparse
+import random
+import time
+
+from job_queue import PriorityJobQueue, PRIORIDAD_BAJA, PRIORIDAD_NORMAL, PRIORIDAD_ALTA
+
+# ==========================================
+# MICROBENCHMARK: COSTE DE DESPACHO VS PROFUNDIDAD DE COLA
+# ==========================================
+# Mide el coste por operación (pop + push, régimen estacionario) de la lista
+# original (pop(0)/append) frente a PriorityJobQueue con la cola a distintas
+# profundidades. Con la lista crece lineal; con PriorityJobQueue debe ser plano.
+
+PROFUNDIDADES = [1_000, 10_000, 100_000, 500_000]
+OPERACIONES = 20_000
+TENANTS = [f"tenant-{i}" for i in range(16)]
+PRIORIDADES = [PRIORIDAD_BAJA, PRIORIDAD_NORMAL, PRIORIDAD_ALTA]
+
+
+class _BenchJob:
+    __slots__ = ("priority", "tenant")
+
+    def __init__(self, priority, tenant):
+        self.priority = priority
+        self.tenant = tenant
+
+
+def make_jobs(n, rng):
+    return [_BenchJob(rng.choice(PRIORIDADES), rng.choice(TENANTS)) for _ in range(n)]
+
+
+def bench_list(depth, ops, rng):
+    queue = make_jobs(depth, rng)
+    incoming = make_jobs(ops, rng)
+    start = time.perf_counter()
+    for job in incoming:
+        queue.pop(0)
+        queue.append(job)
+    return (time.perf_counter() - start) / ops
+
+
+def bench_priority_queue(depth, ops, rng):
+    queue = PriorityJobQueue()
+    for job in make_jobs(depth, rng):
+        queue.push(job)
+    incoming = make_jobs(ops, rng)
+    start = time.perf_counter()
+    for job in incoming:
+        queue.pop()
+        queue.push(job)
+    return (time.perf_counter() - start) / ops
+
+
+def run(depths, ops, seed=1234):
+    rng = random.Random(seed)
+    print(f"{'Profundidad':>12} | {'list.pop(0)':>14} | {'PriorityJobQueue':>17}")
+    print("-" * 50)
+    results = []
+    for depth in depths:
+        t_list = bench_list(depth, ops, rng)
+        t_pq = bench_priority_queue(depth, ops, rng)
+        results.append((depth, t_list, t_pq))
+        print(f"{depth:>12,} | {t_list * 1e9:>11.0f} ns | {t_pq * 1e9:>14.0f} ns")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Coste de despacho por operación según profundidad de cola")
+    parser.add_argument("--depths", type=int, nargs="+", default=PROFUNDIDADES)
+    parser.add_argument("--ops", type=int, default=OPERACIONES)
+    args = parser.parse_args()
+    run(args.depths, args.ops)
@@ -0,0 +1,105 @@
+import argparse
+import json
+import random
+import time
+
+from workflow_templates import WorkflowTemplate, SEED_MAX
+
+# ==========================================
+# MICROBENCHMARK: CONSTRUCCIÓN DEL PAYLOAD POR JOB
+# ==========================================
+# Compara el método original (abrir workflow_api.json, json.load, tocar los nodos
+# "6"/"3" y json.dumps) con la plantilla precompilada (fragmentos de bytes).
+# Lo mismo para el camino por lotes (micro-batching, el que se usa por defecto):
+# render_batch frente a construir el grafo de cada job como dict, renombrar su rama y
+# volver a serializar todo el lote.
+
+ITERACIONES = 20_000
+TAMANO_LOTE = 4
+WORKFLOW_FILE = "workflow_api.json"
+
+
+def build_legacy(prompt, path=WORKFLOW_FILE):
+    with open(path, "r") as f:
+        workflow = json.load(f)
+    workflow["6"]["inputs"]["text"] = prompt
+    workflow["3"]["inputs"]["seed"] = random.randint(1, SEED_MAX)
+    return json.dumps({"prompt": workflow}).encode("utf-8")
+
+
+def build_compiled(template, prompt):
+    return template.render({"prompt": prompt, "seed": random.randint(1, SEED_MAX)}, client_id="bench")
+
+
+def build_batch_dicts(template, prompts, seeds):
+    """Lote a base de dicts: build_graph por job, rama renombrada a mano y json.dumps del conjunto."""
+    merged = {}
+    for index, (prompt, seed) in enumerate(zip(prompts, seeds)):
+        graph = template.build_graph({"prompt": prompt, "seed": seed})
+        if index == 0:
+            merged.update(graph)
+            continue
+        rename = {node_id: f"{node_id}_b{index}" for node_id in template.branch}
+        for node_id in template.branch:
+            inputs = {
+                name: [rename[value[0]], value[1]]
+                if isinstance(value, list) and len(value) == 2 and value[0] in rename else value
+                for name, value in graph[node_id]["inputs"].items()
+            }
+            merged[rename[node_id]] = {**graph[node_id], "inputs": inputs}
+    return json.dumps({"prompt": merged, "client_id": "bench"}).encode("utf-8")
+
+
+def build_batch_compiled(template, prompts, seeds):
+    values = [{"prompt": prompt, "seed": seed} for prompt, seed in zip(prompts, seeds)]
+    return template.render_batch(values, client_id="bench")[0]
+
+
+def timeit(fn, prompts):
+    start = time.perf_counter()
+    for prompt in prompts:
+        fn(prompt)
+    return (time.perf_counter() - start) / len(prompts)
+
+
+def run(iteraciones, path=WORKFLOW_FILE, lote=TAMANO_LOTE):
+    template = WorkflowTemplate.from_file("imagen", path)
+    prompts = [f"Un astronauta en marte, variante {i}" for i in range(iteraciones)]
+
+    # Mismo grafo resultante (salvo semilla y client_id)
+    legacy = json.loads(build_legacy(prompts[0], path))["prompt"]
+    compiled = json.loads(build_compiled(template, prompts[0]))["prompt"]
+    for graph in (legacy, compiled):
+        for node in graph.values():
+            node["inputs"].pop("seed", None)
+    assert legacy == compiled, "La plantilla compilada no produce el mismo grafo"
+
+    t_legacy = timeit(lambda p: build_legacy(p, path), prompts)
+    t_compiled = timeit(lambda p: build_compiled(template, p), prompts)
+    print(f"📊 Construcción de payload ({iteraciones} jobs, {path})")
+    print(f"   Original (open + json.load + json.dumps): {t_legacy * 1e6:8.1f} µs/job")
+    print(f"   Plantilla precompilada:                   {t_compiled * 1e6:8.1f} µs/job")
+    print(f"   Aceleración: x{t_legacy / t_compiled:.1f}")
+
+    # Camino por lotes: mismo cuerpo (con las mismas semillas) y tiempo por lote
+    lotes = [prompts[i:i + lote] for i in range(0, len(prompts) - lote + 1, lote)]
+    seeds = [random.randint(1, SEED_MAX) for _ in range(lote)]
+    dicts = json.loads(build_batch_dicts(template, lotes[0], seeds))
+    compiled = json.loads(build_batch_compiled(template, lotes[0], seeds))
+    assert dicts == compiled, "render_batch no produce el mismo lote que la versión con dicts"
+
+    t_dicts = timeit(lambda batch: build_batch_dicts(template, batch, seeds), lotes)
+    t_batch = timeit(lambda batch: build_batch_compiled(template, batch, seeds), lotes)
+    print(f"📦 Lotes de {lote} jobs ({len(lotes)} lotes)")
+    print(f"   Dicts (build_graph + renombrado + json.dumps): {t_dicts * 1e6:8.1f} µs/lote")
+    print(f"   render_batch precompilado:                     {t_batch * 1e6:8.1f} µs/lote")
+    print(f"   Aceleración: x{t_dicts / t_batch:.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tiempo de construcción del payload por job")
+    parser.add_argument("--iteraciones", type=int, default=ITERACIONES)
+    parser.add_argument("--workflow", default=WORKFLOW_FILE)
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Jobs por lote en el camino por lotes")
+    args = parser.parse_args()
+    run(args.iteraciones, args.workflow, max(2, args.lote))
@@ -0,0 +1,167 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import sys
+import time
+
+# ==========================================
+# INGESTA MASIVA DESDE JSONL / CSV
+# ==========================================
+# Lee el fichero de forma perezosa (generadores, línea a línea), agrupa en lotes
+# y los pasa a QueueOrchestrator.submit_many: validación y deduplicación por lote
+# y un único cambio de estado persistido por lote. La memoria usada por la
+# ingesta no depende del tamaño del fichero (solo crece la cola con lo aceptado).
+#
+# Formatos:
+#   JSONL: una línea por prompt, o bien un string JSON o bien un objeto
+#          {"prompt": ..., "priority": 5, "tenant": "cliente-a", "template": "imagen"}
+#   CSV:   cabecera con al menos la columna "prompt" (el resto opcionales)
+#
+# Con workers > 1 la validación y el hash de cada lote se hacen en un pool de procesos
+# (ingest_pool.py) mientras el proceso principal sigue leyendo y encolando.
+
+BATCH_SIZE = 1000
+PROGRESS_EVERY = 100          # Imprime progreso cada N lotes
+
+
+def _parse_jsonl_line(line):
+    data = json.loads(line)
+    if isinstance(data, str):
+        return {"prompt": data}
+    if isinstance(data, dict):
+        return data
+    raise ValueError("línea JSONL sin prompt")
+
+
+def iter_jsonl(stream):
+    """Genera dicts desde un JSONL; las líneas corruptas salen como {"prompt": None}."""
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield _parse_jsonl_line(line)
+        except ValueError:
+            yield {"prompt": None}
+
+
+def iter_csv(stream):
+    for row in csv.DictReader(stream):
+        item = {key: value for key, value in row.items() if value not in (None, "")}
+        if "priority" in item:
+            try:
+                item["priority"] = int(item["priority"])
+            except ValueError:
+                item["prompt"] = None
+        yield item
+
+
+def iter_records(path, fmt=None):
+    """Abre el fichero (o stdin con "-") y devuelve el generador adecuado según extensión."""
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "jsonl")
+    stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8") if path == "-" else open(path, encoding="utf-8", newline="")
+    try:
+        yield from (iter_csv(stream) if fmt == "csv" else iter_jsonl(stream))
+    finally:
+        if path != "-":
+            stream.close()
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def apply_defaults(records, tenant=None, priority=None, template=None):
+    for record in records:
+        if tenant and "tenant" not in record:
+            record["tenant"] = tenant
+        if priority is not None and "priority" not in record:
+            record["priority"] = priority
+        if template and "template" not in record:
+            record["template"] = template
+        yield record
+
+
+def ingest(orchestrator, records, batch_size=BATCH_SIZE, progress=True, workers=1):
+    """Ingesta completa. Devuelve el informe agregado (contadores, no guarda los jobs)."""
+    totals = {"lines": 0, "accepted": 0, "rejected": 0, "duplicates": 0, "cached": 0, "reasons": {}, "batches": 0,
+              "workers": workers}
+    start = time.perf_counter()
+    pool = orchestrator.ingest_pool(workers) if workers > 1 else None
+    try:
+        checked = pool.checked_batches(batched(records, batch_size)) if pool else \
+            ((batch, None) for batch in batched(records, batch_size))
+        for batch, checks in checked:
+            _add_report(totals, batch, orchestrator.submit_many(batch, checks=checks), progress)
+    finally:
+        if pool:
+            pool.close()
+    totals["elapsed_s"] = round(time.perf_counter() - start, 3)
+    logging.info(json.dumps({"event": "BULK_INGEST", **totals}))
+    return totals
+
+
+def _add_report(totals, batch, report, progress):
+    totals["lines"] += len(batch)
+    totals["batches"] += 1
+    for key in ("accepted", "rejected", "duplicates", "cached"):
+        totals[key] += report[key]
+    for reason, count in report["reasons"].items():
+        totals["reasons"][reason] = totals["reasons"].get(reason, 0) + count
+    if progress and totals["batches"] % PROGRESS_EVERY == 0:
+        print(f"   ... {totals['lines']:,} líneas ({totals['accepted']:,} aceptadas)", end="\r")
+
+
+def print_report(totals):
+    rate = totals["lines"] / totals["elapsed_s"] if totals["elapsed_s"] else 0
+    print("\n" + "=" * 40)
+    print("📦 INGESTA MASIVA")
+    print("=" * 40)
+    print(f"Líneas leídas:  {totals['lines']:,}")
+    print(f"Aceptadas:      {totals['accepted']:,}")
+    print(f"Rechazadas:     {totals['rejected']:,} {totals['reasons'] or ''}")
+    print(f"Duplicadas:     {totals['duplicates']:,} (adjuntadas al job ya en cola)")
+    print(f"Desde caché:    {totals['cached']:,} (ya completadas, sin GPU)")
+    print(f"Tiempo:         {totals['elapsed_s']:.2f} s ({rate:,.0f} líneas/s, {totals['workers']} proceso(s) de validación)")
+    print("=" * 40)
+
+
+if __name__ == "__main__":
+    from queue_system import QueueOrchestrator
+    from job_store import JobStore, JOB_DB_FILE
+    from result_cache import ResultCache, RESULT_CACHE_DIR
+
+    parser = argparse.ArgumentParser(description="Ingesta masiva de prompts desde JSONL/CSV")
+    parser.add_argument("path", help="Fichero .jsonl/.csv, o '-' para stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="Fuerza el formato (por defecto, por extensión)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--tenant", help="Tenant por defecto para líneas que no lo indiquen")
+    parser.add_argument("--priority", type=int, help="Prioridad por defecto")
+    parser.add_argument("--template", help="Plantilla por defecto")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos de validación en paralelo (1 = en el propio proceso)")
+    parser.add_argument("--db", default=JOB_DB_FILE, help="Almacén persistente donde se encolan los jobs")
+    parser.add_argument("--procesar", action="store_true", help="Arranca el orquestador tras la ingesta")
+    args = parser.parse_args()
+
+    almacen = JobStore(args.db)
+    sistema = QueueOrchestrator(job_store=almacen, result_cache=ResultCache(RESULT_CACHE_DIR))
+    sistema.recover()   # Para deduplicar también contra lo que ya estaba en cola
+    sistema.meter.prices.refresh()   # Sin event loop todavía: el presupuesto se mide con precios reales
+
+    records = apply_defaults(iter_records(args.path, args.format), args.tenant, args.priority, args.template)
+    totals = ingest(sistema, records, batch_size=args.batch_size, workers=args.workers)
+    almacen.flush()
+    print_report(totals)
+
+    if args.procesar:
+        sistema.process_queue()
+    almacen.close()
@@ -0,0 +1,310 @@
+import asyncio
+import http.client
+import json
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+# ==========================================
+# CLIENTE HTTP PARA COMFYUI (CONEXIONES PERSISTENTES)
+# ==========================================
+# Una sola sesión aiohttp (orquestador, benchmark) o una conexión http.client (scripts síncronos)
+# por Pod, con keep-alive: contra el proxy HTTPS de RunPod nos ahorramos el
+# handshake TCP+TLS de cada petición. ConnectionStats mide cuántas peticiones
+# reutilizan una conexión abierta.
+
+COMFY_TIMEOUT_S = 30          # Timeout total por petición HTTP
+CONNECT_TIMEOUT_S = 10        # Timeout de conexión (TCP + TLS)
+KEEPALIVE_S = 60              # Tiempo que una conexión ociosa sigue abierta en el pool
+HISTORY_POLL_INTERVAL = 0.5   # Cada cuánto preguntamos por /history (s)
+JOB_TIMEOUT_S = 600           # Máximo que esperamos a que termine una generación
+READINESS_TIMEOUT_S = 3       # Timeout de la comprobación de que ComfyUI ya responde
+VIEW_TIMEOUT_S = 300          # Timeout total de la descarga de un fichero generado (/view)
+
+HEADERS = {
+    "Content-Type": "application/json",
+    "Accept": "*/*"
+}
+
+
+class ComfyError(Exception):
+    """Error devuelto por ComfyUI (HTTP != 200 o ejecución fallida)."""
+
+
+class InfraError(ComfyError):
+    """Falla el Pod o la red (HTTP 5xx, timeouts, /history caído): el job no tiene la culpa."""
+
+
+class JobError(ComfyError):
+    """ComfyUI rechazó o no pudo ejecutar el workflow del job (HTTP 4xx, execution_error)."""
+
+
+def _http_error(status, detail):
+    """4xx: el workflow es inválido (culpa del job); 5xx: el servidor está mal (culpa del Pod)."""
+    return (InfraError if status >= 500 else JobError)(f"HTTP {status}: {detail}")
+
+
+class ConnectionStats:
+    """Contadores de conexiones nuevas vs reutilizadas (keep-alive)."""
+
+    def __init__(self):
+        self.created = 0
+        self.reused = 0
+
+    @property
+    def requests(self):
+        return self.created + self.reused
+
+    @property
+    def reuse_rate(self):
+        return self.reused / self.requests if self.requests else 0.0
+
+    def summary(self):
+        return (f"{self.requests} peticiones, {self.created} conexiones nuevas, "
+                f"reutilización {self.reuse_rate:.0%}")
+
+    def trace_config(self):
+        trace = aiohttp.TraceConfig()
+
+        async def on_create(session, ctx, params):
+            self.created += 1
+
+        async def on_reuse(session, ctx, params):
+            self.reused += 1
+
+        trace.on_connection_create_end.append(on_create)
+        trace.on_connection_reuseconn.append(on_reuse)
+        return trace
+
+
+def new_session(limit_per_host=0, stats=None, headers=HEADERS):
+    """Crea la sesión aiohttp compartida (pool de conexiones keep-alive por host)."""
+    return aiohttp.ClientSession(
+        headers=headers,
+        timeout=aiohttp.ClientTimeout(total=COMFY_TIMEOUT_S, connect=CONNECT_TIMEOUT_S),
+        connector=aiohttp.TCPConnector(limit_per_host=limit_per_host, keepalive_timeout=KEEPALIVE_S),
+        trace_configs=[stats.trace_config()] if stats else None,
+    )
+
+
+def base_url(address):
+    """Normaliza ip:puerto o URL completa (proxy https de RunPod) a URL base."""
+    return address.rstrip("/") if address.startswith("http") else f"http://{address}"
+
+
+class ComfyClient:
+    """Habla con la API de ComfyUI de un Pod concreto (ip:puerto o URL completa)."""
+
+    def __init__(self, session, address):
+        self.session = session
+        self.base_url = base_url(address)
+
+    async def queue_prompt(self, workflow, client_id=None):
+        payload = {"prompt": workflow}
+        if client_id:
+            payload["client_id"] = client_id
+        async with self.session.post(f"{self.base_url}/prompt", json=payload) as response:
+            if response.status != 200:
+                raise _http_error(response.status, await response.text())
+            return await response.json()
+
+    async def queue_prompt_raw(self, body):
+        """POST /prompt con el cuerpo ya serializado (plantillas precompiladas)."""
+        async with self.session.post(f"{self.base_url}/prompt", data=body) as response:
+            if response.status != 200:
+                raise _http_error(response.status, await response.text())
+            return await response.json()
+
+    async def get_history(self, prompt_id):
+        async with self.session.get(f"{self.base_url}/history/{prompt_id}") as response:
+            if response.status != 200:
+                raise InfraError(f"HTTP {response.status} en /history")
+            return await response.json()
+
+    async def get_recent_history(self, max_items):
+        """Últimas max_items entradas de /history en una sola petición (polling por lotes)."""
+        async with self.session.get(f"{self.base_url}/history", params={"max_items": max_items}) as response:
+            if response.status != 200:
+                raise InfraError(f"HTTP {response.status} en /history")
+            return await response.json()
+
+    async def is_ready(self, timeout=READINESS_TIMEOUT_S):
+        """Readiness: ComfyUI ya atiende en el 8188 (RunPod da IP antes de que arranque el servidor)."""
+        try:
+            async with self.session.get(f"{self.base_url}/queue",
+                                        timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def get_system_stats(self):
+        """GET /system_stats: versión, RAM y VRAM libre/total de cada GPU."""
+        async with self.session.get(f"{self.base_url}/system_stats") as response:
+            if response.status != 200:
+                raise InfraError(f"HTTP {response.status} en /system_stats")
+            return await response.json()
+
+    async def get_queue(self):
+        """Prompts en la cola de ComfyUI del Pod (ejecutándose + pendientes), de cualquier cliente."""
+        async with self.session.get(f"{self.base_url}/queue") as response:
+            if response.status != 200:
+                raise InfraError(f"HTTP {response.status} en /queue")
+            data = await response.json()
+        return len(data.get("queue_running", [])) + len(data.get("queue_pending", []))
+
+    async def get_checkpoints(self):
+        """Checkpoints instalados en el Pod (opciones de CheckpointLoaderSimple.ckpt_name)."""
+        async with self.session.get(f"{self.base_url}/object_info/CheckpointLoaderSimple") as response:
+            if response.status != 200:
+                raise ComfyError(f"HTTP {response.status} en /object_info")
+            data = await response.json()
+        return list(data["CheckpointLoaderSimple"]["input"]["required"]["ckpt_name"][0])
+
+    def view(self, image, timeout=VIEW_TIMEOUT_S):
+        """GET /view de un fichero generado ({"filename", "subfolder", "type"} de /history).
+        Devuelve la respuesta como context manager para leerla en trozos, sin cargarla entera."""
+        params = {"filename": image["filename"], "subfolder": image.get("subfolder", ""),
+                  "type": image.get("type", "output")}
+        return self.session.get(f"{self.base_url}/view", params=params,
+                                timeout=aiohttp.ClientTimeout(total=timeout, connect=CONNECT_TIMEOUT_S))
+
+    async def wait_for_completion(self, prompt_id, poll_interval=HISTORY_POLL_INTERVAL, timeout=JOB_TIMEOUT_S):
+        """Espera (sin bloquear el event loop) a que el prompt aparezca en /history."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            history = await self.get_history(prompt_id)
+            if prompt_id in history:
+                entry = history[prompt_id]
+                status = entry.get("status", {})
+                if status.get("status_str", "success") != "success":
+                    raise JobError(f"Ejecución fallida en ComfyUI: {status.get('status_str')}")
+                return entry
+            await asyncio.sleep(poll_interval)
+        raise InfraError(f"Timeout esperando el prompt {prompt_id}")
+
+
+class PodClients:
+    """Capa compartida: una sesión con pool keep-alive y un ComfyClient por Pod."""
+
+    def __init__(self, limit_per_host=0, headers=HEADERS):
+        self.limit_per_host = limit_per_host
+        self.headers = headers
+        self.stats = ConnectionStats()
+        self.session = None
+        self.clients = {}       # base_url -> ComfyClient
+
+    async def __aenter__(self):
+        self.session = new_session(self.limit_per_host, stats=self.stats, headers=self.headers)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.session.close()
+        self.session = None
+        self.clients.clear()
+
+    def get(self, address):
+        url = base_url(address)
+        client = self.clients.get(url)
+        if client is None:
+            client = self.clients[url] = ComfyClient(self.session, url)
+        return client
+
+    def forget(self, address):
+        self.clients.pop(base_url(address), None)
+
+
+class SyncComfyClient:
+    """Cliente síncrono con una conexión persistente (para scripts sin event loop)."""
+
+    def __init__(self, url, headers=HEADERS, timeout=COMFY_TIMEOUT_S):
+        parts = urlsplit(base_url(url))
+        self.base_url = base_url(url)
+        self.host = parts.netloc
+        self.prefix = parts.path.rstrip("/")
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.headers = headers
+        self.timeout = timeout
+        self.stats = ConnectionStats()
+        self._conn = None
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def request(self, method, path, body=None):
+        """Devuelve (status, bytes). Si la conexión reutilizada estaba muerta, reintenta una vez."""
+        for attempt in range(2):
+            reused = self._conn is not None
+            if not reused:
+                self._conn = self.connection_class(self.host, timeout=self.timeout)
+                self.stats.created += 1
+            else:
+                self.stats.reused += 1
+            try:
+                self._conn.request(method, self.prefix + path, body=body, headers=self.headers)
+                response = self._conn.getresponse()
+                data = response.read()
+                if response.will_close:
+                    self.close()
+                return response.status, data
+            except (http.client.HTTPException, OSError):
+                self.close()
+                if not reused or attempt:
+                    raise
+        raise ComfyError("Conexión perdida")
+
+    def get_json(self, path):
+        status, data = self.request("GET", path)
+        if status != 200:
+            raise ComfyError(f"HTTP {status} en {path}: {data.decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def queue_prompt(self, workflow, client_id=None):
+        payload = {"prompt": workflow}
+        if client_id:
+            payload["client_id"] = client_id
+        status, data = self.request("POST", "/prompt", json.dumps(payload).encode("utf-8"))
+        if status != 200:
+            raise ComfyError(f"HTTP {status}: {data.decode('utf-8', 'replace')}")
+        return json.loads(data)
+
+    def get_history(self, prompt_id):
+        return self.get_json(f"/history/{prompt_id}")
+
+
+def output_images(history_entry, node_ids=None):
+    """Ficheros generados (SaveImage) de una entrada de /history: {"filename", "subfolder", "type"}.
+    Con node_ids solo los de esos nodos (reparto de las salidas de un lote por job)."""
+    images = []
+    outputs = history_entry.get("outputs", {})
+    for node_id in (outputs if node_ids is None else node_ids):
+        images.extend(outputs.get(node_id, {}).get("images", []))
+    return images
+
+
+def output_filenames(history_entry, node_ids=None):
+    """Solo los nombres de fichero de output_images."""
+    return [image["filename"] for image in output_images(history_entry, node_ids)]
+
+
+def loaded_checkpoint(history):
+    """Checkpoint del último prompt ejecutado según /history (el que sigue en VRAM), o None."""
+    for entry in reversed(list(history.values())):
+        workflow = entry.get("prompt", [None, None, {}])[2]
+        for node in workflow.values():
+            if node.get("class_type") == "CheckpointLoaderSimple":
+                return node.get("inputs", {}).get("ckpt_name")
+    return None
+
+
+def execution_seconds(history_entry):
+    """Tiempo real en GPU según los eventos execution_start/execution_success de ComfyUI."""
+    stamps = {}
+    for event, data in history_entry.get("status", {}).get("messages", []):
+        if "timestamp" in data:
+            stamps[event] = data["timestamp"]
+    if "execution_start" in stamps and "execution_success" in stamps:
+        return max(0.0, (stamps["execution_success"] - stamps["execution_start"]) / 1000)
+    return None
@@ -0,0 +1,230 @@
+import asyncio
+import json
+import time
+import uuid
+from collections import OrderedDict
+
+import aiohttp
+
+from comfy_client import ComfyClient, InfraError, JobError, JOB_TIMEOUT_S, base_url
+
+# ==========================================
+# SEGUIMIENTO DE FINALIZACIÓN (WEBSOCKET + POLLING DE RESPALDO)
+# ==========================================
+# Una conexión persistente por Pod a /ws?clientId=... de ComfyUI. Los eventos
+# "executed"/"executing"/"execution_*" se casan con los jobs por prompt_id, así:
+#   - sabemos la latencia real de cada generación,
+#   - el hueco de concurrencia se libera en cuanto la GPU termina,
+#   - desaparece el tráfico de polling.
+# Si el WebSocket cae (o el proxy no lo soporta) se pasa a polling por lotes de
+# /history con intervalo adaptativo hasta que la reconexión funcione.
+
+POLL_MIN_S = 0.25            # Intervalo de polling justo tras ver terminar algo
+POLL_MAX_S = 5.0             # Intervalo máximo cuando no termina nada
+POLL_GROWTH = 1.5            # Factor de crecimiento del intervalo
+HISTORY_BATCH_MARGIN = 64    # Entradas extra pedidas a /history?max_items=
+WS_RECONNECT_MAX_S = 30.0    # Backoff máximo entre reconexiones del WebSocket
+EARLY_RESULTS_MAX = 1000     # Resultados que llegan antes de que alguien espere por ellos
+
+
+def _ws_url(url, client_id):
+    if url.startswith("https://"):
+        url = "wss://" + url[len("https://"):]
+    elif url.startswith("http://"):
+        url = "ws://" + url[len("http://"):]
+    return f"{url}/ws?clientId={client_id}"
+
+
+class PodCompletionTracker:
+    """Escucha los eventos de ejecución de un Pod y resuelve los futures de cada prompt."""
+
+    def __init__(self, session, address, client_id=None, clock=time.time):
+        self.client = ComfyClient(session, address)
+        self.session = session
+        self.client_id = client_id or uuid.uuid4().hex
+        self.clock = clock                # El del orquestador: marca la llegada de cada evento
+        self.connected = False
+        self.waiters = {}                 # prompt_id -> Future
+        self.started_at = {}              # prompt_id -> (timestamp de execution_start en ms, llegada en ms)
+        self.partial_outputs = {}         # prompt_id -> {node_id: output}
+        self.early_results = OrderedDict()
+        self.poll_interval = POLL_MIN_S
+        self.ws_events = 0
+        self.history_polls = 0
+        self._task = None
+
+    # --- CICLO DE VIDA ---
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for future in self.waiters.values():
+            if not future.done():
+                future.cancel()
+        self.waiters.clear()
+
+    # --- API PARA EL ORQUESTADOR ---
+    async def wait(self, prompt_id, timeout=JOB_TIMEOUT_S):
+        """Espera a que ComfyUI termine el prompt. Devuelve una entrada estilo /history."""
+        if prompt_id in self.early_results:
+            return self._unwrap(self.early_results.pop(prompt_id))
+        future = asyncio.get_running_loop().create_future()
+        self.waiters[prompt_id] = future
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            raise InfraError(f"Timeout esperando el prompt {prompt_id}")
+        finally:
+            self.waiters.pop(prompt_id, None)
+
+    @staticmethod
+    def _unwrap(result):
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _resolve(self, prompt_id, result):
+        self.partial_outputs.pop(prompt_id, None)
+        self.started_at.pop(prompt_id, None)
+        future = self.waiters.get(prompt_id)
+        if future is None:
+            # Llegó antes de que nadie esperase (carrera entre el POST y el evento)
+            self.early_results[prompt_id] = result
+            while len(self.early_results) > EARLY_RESULTS_MAX:
+                self.early_results.popitem(last=False)
+        elif not future.done():
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    # --- BUCLE WEBSOCKET / POLLING ---
+    async def _run(self):
+        reconnect_delay = 1.0
+        while True:
+            try:
+                async with self.session.ws_connect(_ws_url(self.client.base_url, self.client_id),
+                                                   heartbeat=30) as ws:
+                    self.connected = True
+                    reconnect_delay = 1.0
+                    # Lo que terminó mientras estábamos desconectados no llegará por el WS
+                    await self._poll_history_once()
+                    async for msg in ws:
+                        if msg.type == aiohttp.WSMsgType.TEXT:
+                            self._handle_event(json.loads(msg.data))
+                        elif msg.type == aiohttp.WSMsgType.ERROR:
+                            break
+                        # Los mensajes binarios son previews de imagen: los ignoramos
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                pass
+            self.connected = False
+            await self._poll_until(time.monotonic() + reconnect_delay)
+            reconnect_delay = min(reconnect_delay * 2, WS_RECONNECT_MAX_S)
+
+    def _handle_event(self, message):
+        event = message.get("type")
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        self.ws_events += 1
+        now_ms = int(self.clock() * 1000)
+
+        if event == "execution_start":
+            self.started_at[prompt_id] = (data.get("timestamp", now_ms), now_ms)
+        elif event == "executed":
+            self.partial_outputs.setdefault(prompt_id, {})[data.get("node")] = data.get("output") or {}
+        elif event == "execution_error":
+            message = data.get("exception_message", "error")
+            self._resolve(prompt_id, JobError(f"Ejecución fallida en ComfyUI: {message}"))
+        elif event == "execution_interrupted":
+            # Nadie interrumpe a propósito nuestros prompts: reinicio o fallo del servidor
+            self._resolve(prompt_id, InfraError("Ejecución interrumpida en ComfyUI"))
+        elif (event == "executing" and data.get("node") is None) or event == "execution_success":
+            if prompt_id in self.partial_outputs or prompt_id in self.started_at or prompt_id in self.waiters:
+                started, received = self.started_at.get(prompt_id, (now_ms, now_ms))
+                # "executing" con node null no trae timestamp: el fin se mide con nuestro reloj desde que
+                # llegó el inicio, nunca restando una marca del servidor a una de este proceso
+                finished = data.get("timestamp", started + (now_ms - received))
+                self._resolve(prompt_id, {
+                    "outputs": self.partial_outputs.get(prompt_id, {}),
+                    "status": {
+                        "status_str": "success",
+                        "completed": True,
+                        "messages": [
+                            ["execution_start", {"prompt_id": prompt_id, "timestamp": started}],
+                            ["execution_success", {"prompt_id": prompt_id, "timestamp": finished}],
+                        ],
+                    },
+                })
+
+    async def _poll_until(self, deadline):
+        """Polling adaptativo de /history mientras no haya WebSocket."""
+        while time.monotonic() < deadline:
+            if self.waiters:
+                finished = await self._poll_history_once()
+                if finished:
+                    self.poll_interval = POLL_MIN_S
+                else:
+                    self.poll_interval = min(self.poll_interval * POLL_GROWTH, POLL_MAX_S)
+            await asyncio.sleep(min(self.poll_interval, max(0.0, deadline - time.monotonic())))
+
+    async def _poll_history_once(self):
+        """Una sola petición /history?max_items=N para todos los prompts pendientes."""
+        if not self.waiters:
+            return 0
+        self.history_polls += 1
+        try:
+            history = await self.client.get_recent_history(len(self.waiters) + HISTORY_BATCH_MARGIN)
+        except Exception:
+            return 0
+        finished = 0
+        for prompt_id in list(self.waiters):
+            entry = history.get(prompt_id)
+            if entry is None:
+                continue
+            status = entry.get("status", {})
+            if status.get("status_str", "success") != "success":
+                self._resolve(prompt_id, JobError(f"Ejecución fallida en ComfyUI: {status.get('status_str')}"))
+            else:
+                self._resolve(prompt_id, entry)
+            finished += 1
+        return finished
+
+
+class CompletionHub:
+    """Un PodCompletionTracker por Pod, creados bajo demanda y cerrados al apagar el Pod."""
+
+    def __init__(self, session, clock=time.time):
+        self.session = session
+        self.clock = clock
+        self.trackers = {}     # pod_id -> PodCompletionTracker
+        self.closing = set()   # Referencias fuertes a los cierres de trackers sustituidos
+
+    def for_pod(self, pod_id, address):
+        tracker = self.trackers.get(pod_id)
+        if tracker is None or tracker.client.base_url != base_url(address):
+            if tracker is not None:
+                # El Pod cambió de dirección: el tracker viejo se cierra sin frenar el despacho
+                task = asyncio.create_task(tracker.close())
+                self.closing.add(task)
+                task.add_done_callback(self.closing.discard)
+            tracker = self.trackers[pod_id] = PodCompletionTracker(self.session, address, clock=self.clock)
+            tracker.start()
+        return tracker
+
+    async def retain(self, pod_ids):
+        """Cierra los trackers de Pods que ya no están en la flota."""
+        for pod_id in [p for p in self.trackers if p not in pod_ids]:
+            await self.trackers.pop(pod_id).close()
+
+    async def close(self):
+        await self.retain(())
+        await asyncio.gather(*self.closing, return_exceptions=True)
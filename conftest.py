@@ -0,0 +1,3 @@
+# pytest recoge los test_*.py de la raíz. test_infra.py no es un test automático: es la
+# prueba manual contra RunPod real (crea un Pod de pago y necesita la librería runpod).
+collect_ignore = ["test_infra.py"]
@@ -0,0 +1,188 @@
+import json
+import logging
+import math
+import time
+
+# ==========================================
+# MEDIDOR DE COSTES (FINOPS)
+# ==========================================
+# Antes el coste de un job era PRECIO_GPU_HORA x (finished_at - created_at): cobraba
+# como GPU el tiempo en cola, ignoraba los huecos ociosos de los Pods y usaba el precio
+# de una 3090 aunque creamos 4090/A100. Ahora:
+#  - Lo que RunPod factura es el tiempo ENCENDIDO de cada Pod: se mide desde que se
+#    crea/reanuda hasta que se para/elimina, al precio de SU tipo de GPU.
+#  - Al terminar un job se le imputa su tiempo real de GPU (execution_time de ComfyUI).
+#    Cuando el Pod se apaga, su factura completa (incluidos arranque y huecos) se reparte
+#    entre los jobs que ejecutó en proporción a ese tiempo: evento POD_BILLED.
+#  - Precios por GPU de runpod.get_gpus. La consulta es bloqueante: el motor la lanza en un
+#    hilo al arrancar y cada PRICE_REFRESH_S; price() solo mira lo ya cargado (o el de
+#    por defecto), así que nunca frena el event loop.
+#  - Proyección: gasto actual + coste estimado del trabajo ya aceptado (tiempo de GPU por
+#    job / utilización medida de los Pods). Con ella se rechaza ANTES de pasarse del
+#    presupuesto, no cuando ya se ha pasado.
+
+PRECIO_GPU_POR_DEFECTO = 0.29   # $/h si RunPod no da precio para la GPU
+PRICE_RETRY_S = 600             # Si falla la consulta de precios, no reintentar hasta pasado esto
+PRICE_REFRESH_S = 3600          # Cada cuánto se vuelven a pedir los precios
+JOB_GPU_S_INICIAL = 10.0        # Estimación de segundos de GPU por job hasta tener medidas
+JOB_GPU_S_ALPHA = 0.2           # Peso de cada medida en la EWMA
+MIN_BUSY_S_UTILIZATION = 30.0   # Segundos de GPU medidos antes de fiarnos de la utilización
+MIN_UTILIZATION = 0.2           # Suelo de la utilización (evita proyecciones absurdas)
+
+
+class GpuPriceCatalog:
+    """
+    $/h por tipo de GPU. fetch_fn() -> {gpu_type: precio} es una llamada a RunPod: solo la
+    hace refresh() (desde un hilo, ver DispatchEngine.run); price() es una consulta en memoria.
+    """
+
+    def __init__(self, fetch_fn, default_price=PRECIO_GPU_POR_DEFECTO, clock=time.monotonic):
+        self.fetch_fn = fetch_fn
+        self.default_price = default_price
+        self.clock = clock
+        self.prices = None
+        self.fetched_at = None
+        self._failed_at = None
+
+    def due(self):
+        """¿Toca pedir los precios? (nunca cargados, caducados, y sin un fallo reciente)."""
+        now = self.clock()
+        if self._failed_at is not None and now - self._failed_at < PRICE_RETRY_S:
+            return False
+        return self.fetched_at is None or now - self.fetched_at >= PRICE_REFRESH_S
+
+    def refresh(self):
+        """Pide el catálogo (bloqueante). Si falla se siguen usando los últimos precios conocidos."""
+        try:
+            prices = dict(self.fetch_fn() or {})
+        except Exception as e:
+            self._failed_at = self.clock()
+            fallback = "los últimos conocidos" if self.prices else f"${self.default_price}/h"
+            print(f"⚠️ No se pudieron consultar los precios de GPU ({e}); usando {fallback}.")
+            return False
+        self.prices = prices or self.prices
+        self.fetched_at = self.clock()
+        self._failed_at = None
+        print(f"💲 Precios de GPU cargados ({len(prices)} tipos).")
+        return True
+
+    def price(self, gpu_type):
+        return (self.prices or {}).get(gpu_type) or self.default_price
+
+
+class _PodBill:
+    __slots__ = ("gpu_type", "price", "started", "busy_s", "jobs")
+
+    def __init__(self, gpu_type, price, started):
+        self.gpu_type = gpu_type
+        self.price = price            # $/h de este Pod
+        self.started = started        # Reloj al crearlo/reanudarlo (empieza a facturar)
+        self.busy_s = 0.0             # Segundos de GPU de los jobs terminados en él
+        self.jobs = []                # [(job, segundos de GPU)]
+
+
+class CostMeter:
+    def __init__(self, prices, clock=time.monotonic, spent=0.0):
+        self.prices = prices
+        self.clock = clock
+        self.base_spent = spent       # Gasto del día anterior a este proceso (JobStore)
+        self.pods = {}                # pod_id -> _PodBill (encendidos)
+        self.closed_cost = 0.0
+        self.closed_uptime_s = 0.0
+        self.closed_busy_s = 0.0
+        self.idle_cost = 0.0          # Tiempo encendido sin renderizar (arranques y huecos)
+        self.unattributed_cost = 0.0  # Facturas de Pods que no llegaron a ejecutar ningún job
+        self.job_gpu_s = JOB_GPU_S_INICIAL
+        self.on_bill = None           # Callback(bill, jobs) al cerrar la factura de un Pod
+
+    # --- EVENTOS DE PODS ---
+    def pod_started(self, pod_id, gpu_type):
+        self.pods[pod_id] = _PodBill(gpu_type, self.prices.price(gpu_type), self.clock())
+
+    def pod_stopped(self, pod_id):
+        """Cierra la factura del Pod y reparte su coste entre sus jobs. Devuelve el resumen (o None)."""
+        pod = self.pods.pop(pod_id, None)
+        if pod is None:
+            return None
+        uptime_s = self.clock() - pod.started
+        cost = pod.price * uptime_s / 3600
+        idle = max(0.0, cost - pod.price * pod.busy_s / 3600)
+        self.closed_cost += cost
+        self.closed_uptime_s += uptime_s
+        self.closed_busy_s += pod.busy_s
+        self.idle_cost += idle
+
+        # Reparto por tiempo de GPU (a partes iguales si ComfyUI no reportó tiempos)
+        jobs = [job for job, _seconds in pod.jobs]
+        if not jobs:
+            self.unattributed_cost += cost
+        total_s = sum(seconds for _job, seconds in pod.jobs)
+        for job, seconds in pod.jobs:
+            job.cost = cost * (seconds / total_s if total_s else 1 / len(pod.jobs))
+
+        bill = {
+            "event": "POD_BILLED",
+            "pod_id": pod_id,
+            "gpu": pod.gpu_type,
+            "price_per_hour": pod.price,
+            "uptime_s": round(uptime_s, 2),
+            "busy_s": round(pod.busy_s, 2),
+            "utilization": round(pod.busy_s / uptime_s, 4) if uptime_s else 0.0,
+            "cost_usd": round(cost, 6),
+            "idle_usd": round(idle, 6),
+            "jobs": len(jobs),
+        }
+        logging.info(json.dumps(bill))
+        if self.on_bill:
+            self.on_bill(bill, jobs)
+        return bill
+
+    # --- EVENTOS DE JOBS ---
+    def job_finished(self, pod_id, job, gpu_seconds):
+        """Imputa al job su tiempo de GPU (provisional hasta POD_BILLED). Devuelve su coste."""
+        pod = self.pods.get(pod_id)
+        if gpu_seconds is None:
+            gpu_seconds = self.job_gpu_s
+        else:
+            self.job_gpu_s += JOB_GPU_S_ALPHA * (gpu_seconds - self.job_gpu_s)
+        if pod is None:
+            return self.prices.price(None) * gpu_seconds / 3600
+        pod.busy_s += gpu_seconds
+        pod.jobs.append((job, gpu_seconds))
+        return pod.price * gpu_seconds / 3600
+
+    def gpu_of(self, pod_id):
+        pod = self.pods.get(pod_id)
+        return pod.gpu_type if pod else None
+
+    # --- GASTO Y PROYECCIÓN ---
+    def total(self):
+        """Gasto del día: facturas cerradas + lo que llevan encendidos los Pods actuales."""
+        now = self.clock()
+        running = sum(pod.price * (now - pod.started) / 3600 for pod in self.pods.values())
+        return self.base_spent + self.closed_cost + running
+
+    def utilization(self):
+        """Fracción del tiempo encendido que los Pods pasan renderizando (1.0 hasta tener datos)."""
+        now = self.clock()
+        busy = self.closed_busy_s + sum(pod.busy_s for pod in self.pods.values())
+        uptime = self.closed_uptime_s + sum(now - pod.started for pod in self.pods.values())
+        if busy < MIN_BUSY_S_UTILIZATION or not uptime:
+            return 1.0
+        return max(MIN_UTILIZATION, min(1.0, busy / uptime))
+
+    def job_cost_estimate(self, gpu_type):
+        """$ que costará un job más: su tiempo de GPU más la parte proporcional de arranques y huecos."""
+        return self.prices.price(gpu_type) * self.job_gpu_s / 3600 / self.utilization()
+
+    def projected(self, queued_jobs, gpu_type):
+        """Gasto previsto del día si se ejecuta todo lo aceptado (queued_jobs)."""
+        return self.total() + queued_jobs * self.job_cost_estimate(gpu_type)
+
+    def headroom_jobs(self, budget, queued_jobs, gpu_type):
+        """Cuántos jobs nuevos caben aún en el presupuesto contando los ya aceptados."""
+        remaining = budget - self.projected(queued_jobs, gpu_type)
+        if remaining < 0:
+            return 0
+        per_job = self.job_cost_estimate(gpu_type)
+        return math.floor(remaining / per_job) if per_job > 0 else math.inf
@@ -0,0 +1,258 @@
+import asyncio
+
+import aiohttp
+
+from comfy_client import PodClients, ComfyError, loaded_checkpoint
+from completion_tracker import CompletionHub
+from worker_pool import READY
+
+# ==========================================
+# MOTOR DE DESPACHO ASÍNCRONO
+# ==========================================
+# Sustituye al "while True + time.sleep(1)" de process_queue.
+# Todas las llamadas de red (envíos, polling de /history, búsqueda de IP del Pod)
+# corren como tareas en un único event loop, así que MAX_CONCURRENT_JOBS deja de
+# estar limitado a una petición HTTP en vuelo.
+#
+# El bucle no revisa la cola por tiempo: duerme hasta que pasa algo que puede liberar
+# trabajo (un submit, una tarea que termina -> hueco libre, reintento o fallo) o hasta
+# el primer plazo conocido (reintento que vence, ventana del micro-batcher, auto-scaling).
+# notify() se puede llamar desde otros hilos (p. ej. un servidor web que hace submit).
+
+SCALING_TICK = 1.0        # Cada cuánto se evalúa el auto-scaling (s)
+
+
+class DispatchEngine:
+    def __init__(self, orchestrator, tick=None, clients=None, hub_factory=CompletionHub):
+        self.orchestrator = orchestrator
+        self.pool = orchestrator.pool
+        self.tick = tick          # Espera máxima entre pasadas; None = solo por eventos y plazos
+        # Por defecto HTTP/WebSocket reales; el simulador (orchestrator_sim.py) pasa Pods en memoria
+        self.client_pool = clients
+        self.hub_factory = hub_factory
+        self.tasks = set()      # Referencias fuertes a las tareas lanzadas
+        self.clients = None       # PodClients: pool keep-alive + un ComfyClient por Pod
+        self.session = None
+        self.completions = None   # CompletionHub: un WebSocket de eventos por Pod
+        self.loop = None
+        self.woken = False        # Hubo un aviso mientras el bucle trabajaba
+        self._waiter = None       # Future en el que duerme el bucle
+        self.wakeups = 0          # Pasadas provocadas por un aviso
+        self.timeouts = 0         # Pasadas provocadas por un plazo
+
+    def dispatch(self, jobs, pod, model=None):
+        """Lanza el lote (uno o varios jobs, un solo prompt de ComfyUI) y reserva un hueco en el Pod."""
+        self.pool.acquire(pod, model)
+        return self.spawn(self._run(jobs, pod))
+
+    def spawn(self, coro):
+        """Tarea ligada al motor: se espera antes de terminar y se cancela al parar."""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task):
+        # Un lote, una descarga o una sonda terminados pueden dejar hueco o trabajo nuevo
+        self.tasks.discard(task)
+        self._wake()
+
+    # --- DESPERTAR DEL BUCLE ---
+    def notify(self):
+        """Despierta el bucle principal (seguro desde cualquier hilo)."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._wake()
+        else:
+            loop.call_soon_threadsafe(self._wake)
+
+    def _wake(self):
+        self.woken = True
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(True)
+
+    def _timeout(self):
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(False)
+
+    async def _wait(self, timeout):
+        """Duerme hasta un aviso o hasta timeout segundos. Los avisos previos no se pierden."""
+        if self.woken:
+            self.woken = False
+            self.wakeups += 1
+            return
+        self._waiter = self.loop.create_future()
+        handle = self.loop.call_later(max(timeout, 0.0), self._timeout)
+        try:
+            woken = await self._waiter
+        finally:
+            handle.cancel()
+            self._waiter = None
+        self.woken = False
+        if woken:
+            self.wakeups += 1
+        else:
+            self.timeouts += 1
+
+    def _next_deadline(self, next_scaling):
+        """Segundos hasta el primer plazo conocido: auto-scaling, reintento o ventana de lote."""
+        orch = self.orchestrator
+        timeout = next_scaling - self.loop.time()
+        for pending in (orch.retry_scheduler.next_due_in(), orch.batcher.next_ready_in(), self.tick):
+            if pending is not None:
+                timeout = min(timeout, pending)
+        return timeout
+
+    async def _run(self, jobs, pod):
+        completed = 0
+        try:
+            await self.orchestrator.run_batch_async(jobs, pod.pod_id, self)
+            for job in jobs:
+                # FETCHING: la GPU ya terminó y sus imágenes se están descargando
+                if job.status in ("COMPLETED", "FETCHING"):
+                    completed += 1
+                    # Tiempo de GPU por job: real si ComfyUI lo reporta (en un lote, su parte)
+                    finished_at = job.finished_at or self.orchestrator.clock()
+                    service_time = job.execution_time or (finished_at - job.dispatched_at) / len(jobs)
+                    self.pool.record_service_time(service_time)
+        finally:
+            self.pool.release(pod, completed=completed)
+
+    def dispatch_ready_jobs(self):
+        orch = self.orchestrator
+        batcher = orch.batcher
+        launched = 0
+        while (orch.pending_queue or batcher) and len(orch.active_jobs) < orch.max_concurrent_jobs:
+            # Los jobs pasan por grupos compatibles: micro-batching y margen para reordenar por modelo
+            while orch.pending_queue and len(batcher) < batcher.max_staged:
+                job = orch.pending_queue.pop()
+                batcher.add(job, orch.batch_key(job), model=orch.job_model(job))
+            ready = batcher.ready_keys()
+            if not ready:
+                break
+            # Pod para el grupo más antiguo (mejor si ya tiene su checkpoint en VRAM y, con
+            # shards, si es del grupo dueño del shard de su prompt)...
+            prefer = orch.shards.pods_for(batcher.head(ready[0]).prompt_hash) if orch.shards else None
+            pod = self.pool.pick_pod(model=batcher.model_of(ready[0]), prefer=prefer)
+            if pod is None:
+                break
+            # ...y si ese Pod tiene otro modelo cargado, quizá otro grupo listo le encaje mejor
+            key = batcher.pick(ready, pod.loaded_model)
+            model = batcher.model_of(key)
+            owned = orch.shards.owned_by(pod.pod_id) if orch.shards else None
+            batch = batcher.take(key, max_jobs=orch.max_concurrent_jobs - len(orch.active_jobs), prefer=owned)
+            self.dispatch(batch, pod, model)
+            launched += len(batch)
+        return launched
+
+    def probe_new_pods(self):
+        """Lanza la consulta de modelos de cada Pod que acaba de quedar listo."""
+        for pod in self.pool.pods.values():
+            if pod.status == READY and not pod.probed:
+                pod.probed = True
+                self.spawn(self._probe(pod))
+
+    async def _probe(self, pod):
+        """Checkpoints instalados (/object_info) y el que dejó en VRAM su último prompt (/history)."""
+        client = self.clients.get(pod.address)
+        try:
+            pod.available_models = await client.get_checkpoints()
+            if pod.loaded_model is None:
+                pod.loaded_model = loaded_checkpoint(await client.get_recent_history(1))
+        except (aiohttp.ClientError, asyncio.TimeoutError, ComfyError, KeyError, IndexError) as e:
+            print(f"⚠️ No se pudieron consultar los modelos del Pod {pod.pod_id}: {e}")
+
+    def probe_health(self):
+        """Lanza /system_stats + /queue en los Pods listos que toca revisar (cada HEALTH_PROBE_S)."""
+        health = self.pool.health
+        for pod in self.pool.pods.values():
+            if pod.status == READY and health.due_probe(pod.pod_id):
+                health.mark_probed(pod.pod_id)
+                self.spawn(self._health_check(pod))
+
+    async def _health_check(self, pod):
+        client = self.clients.get(pod.address)
+        try:
+            stats = await client.get_system_stats()
+            queued = await client.get_queue()
+        except (aiohttp.ClientError, asyncio.TimeoutError, ComfyError, ValueError) as e:
+            self.pool.health.record_failure(pod.pod_id, f"health check: {e or type(e).__name__}")
+            return
+        self.pool.health.record_probe(pod.pod_id, stats, queued, pod.outstanding)
+
+    async def run(self, stop_when_idle=False):
+        """Bucle principal. Con stop_when_idle=True termina cuando no queda trabajo (tests/demos)."""
+        orch = self.orchestrator
+        loop = self.loop = asyncio.get_running_loop()
+        next_scaling = 0.0
+
+        # +1 por Pod para el WebSocket de eventos, que ocupa una conexión fija
+        async with self.client_pool or PodClients(limit_per_host=self.pool.max_jobs_por_pod * 2 + 1) as clients:
+            self.clients = clients
+            self.session = session = clients.session
+            self.completions = self.hub_factory(session, clock=orch.clock)
+            self.pool.endpoints.start()
+            self.pool.attach_events(loop)
+            # Precios de GPU antes de crear ningún Pod; la consulta a RunPod va a un hilo
+            prices = orch.meter.prices
+            if prices.due():
+                await asyncio.to_thread(prices.refresh)
+            price_refresh = None
+            # Un Pod arrancando solo pasa a READY cuando ComfyUI responde en el 8188
+            self.pool.readiness_probe = lambda address: clients.get(address).is_ready()
+            try:
+                while True:
+                    # 1. Auto-Scaling (las llamadas a RunPod van a un hilo, no bloquean el loop)
+                    if loop.time() >= next_scaling:
+                        await orch.check_auto_scaling()
+                        await self.completions.retain(set(self.pool.pods))
+                        self.probe_new_pods()
+                        self.probe_health()
+                        if prices.due() and (price_refresh is None or price_refresh.done()):
+                            price_refresh = self.spawn(asyncio.to_thread(prices.refresh))
+                        next_scaling = loop.time() + SCALING_TICK
+
+                        # Feedback visual si está ocioso
+                        if not orch.pending_queue and not orch.batcher and not orch.active_jobs and not orch.retry_scheduler:
+                            print(f"💤 Ocioso (Gasto hoy: ${orch.total_spent_today:.4f})...", end="\r")
+
+                    # 2. Reintentos cuyo backoff ya venció vuelven a la cola
+                    orch.release_due_retries()
+
+                    # 3. Asignación de trabajos
+                    self.dispatch_ready_jobs()
+
+                    # 4. Condición de salida para ejecuciones finitas
+                    if (stop_when_idle and not orch.pending_queue and not orch.active_jobs
+                            and not orch.batcher and not orch.retry_scheduler and not self.tasks):
+                        break
+
+                    # 5. Dormir hasta que llegue trabajo, termine algo o venza un plazo
+                    await self._wait(self._next_deadline(next_scaling))
+            finally:
+                for task in list(self.tasks):
+                    task.cancel()
+                if self.tasks:
+                    await asyncio.gather(*self.tasks, return_exceptions=True)
+                await self.completions.close()
+                await self.pool.endpoints.close()
+                self.pool.detach_events()
+                self.pool.readiness_probe = None
+                print(f"\n🔌 Conexiones HTTP: {clients.stats.summary()}")
+                if self.pool.model_swaps or orch.batcher.affinity_reorders:
+                    print(f"🔁 Cambios de modelo en los Pods: {self.pool.model_swaps} "
+                          f"(lotes adelantados por afinidad: {orch.batcher.affinity_reorders})")
+                if orch.batcher.batches_sent and orch.batcher.enabled:
+                    print(f"📦 Micro-batching: {orch.batcher.jobs_sent} jobs en {orch.batcher.batches_sent} prompts "
+                          f"(media {orch.batcher.average_size:.1f} jobs/prompt)")
+                print(f"💲 Gasto hoy: ${orch.total_spent_today:.4f} "
+                      f"(utilización de GPU: {orch.meter.utilization():.0%}, ~${orch.meter.job_cost_estimate(self.pool.gpu_type):.5f}/job)")
+                print(f"⏰ Pasadas del motor: {self.wakeups} por eventos, {self.timeouts} por plazos")
+                self.session = None
+                self.loop = None
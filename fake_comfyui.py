@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import os
+import random
+import time
+import uuid
+
+from aiohttp import web
+
+# ==========================================
+# SERVIDOR COMFYUI FALSO (PARA PRUEBAS LOCALES)
+# ==========================================
+# Imita la parte de la API de ComfyUI que usa el orquestador:
+#   POST /prompt, GET /history, GET /history/{prompt_id}, GET /queue,
+#   GET /object_info/CheckpointLoaderSimple, GET /system_stats, GET /ws?clientId= (eventos de ejecución),
+#   GET /view?filename= (las "imágenes": bytes pseudoaleatorios deterministas, en streaming)
+# Las "generaciones" se ejecutan en serie (una GPU) con un tiempo de render configurable,
+# así podemos probar concurrencia, reintentos y latencias sin gastar dinero en RunPod.
+
+RENDER_TIME_S = 0.2          # Tiempo simulado por imagen
+PROMPT_OVERHEAD_S = 0.0      # Coste fijo por prompt (validación del grafo, carga/comprobación de modelos)
+MODEL_LOAD_S = 0.0           # Cargar en VRAM un checkpoint distinto del último usado
+FAILURE_RATE = 0.0           # Probabilidad de que una ejecución termine en error
+HTTP_ERROR_RATE = 0.0        # Probabilidad de que POST /prompt responda 503 (Pod "enfermo")
+OUTPUT_BYTES = 64 * 1024     # Tamaño de cada imagen falsa servida por /view
+VIEW_CHUNK = 16 * 1024
+MODELOS_FALSOS = ["sd_xl_base_1.0.safetensors", "v1-5-pruned-emaonly.safetensors"]
+
+
+class FakeComfyUI:
+    def __init__(self, render_time=RENDER_TIME_S, failure_rate=FAILURE_RATE, models=None, seed=None,
+                 websocket=True, overhead=PROMPT_OVERHEAD_S, model_load_time=MODEL_LOAD_S, clock=time.time,
+                 output_bytes=OUTPUT_BYTES, http_error_rate=HTTP_ERROR_RATE):
+        self.render_time = render_time
+        self.clock = clock
+        self.overhead = overhead
+        self.model_load_time = model_load_time
+        self.loaded_model = None
+        self.model_loads = 0
+        self.failure_rate = failure_rate
+        self.http_error_rate = http_error_rate
+        self.models = models or list(MODELOS_FALSOS)
+        self.random = random.Random(seed)
+        self.websocket = websocket
+        self.sockets = {}           # client_id -> WebSocketResponse
+        self.history = {}
+        self.history_requests = 0
+        self.queue = None
+        self.prompts_received = 0
+        self.images_saved = 0       # Contador global de ficheros (como el de SaveImage)
+        self.output_bytes = output_bytes
+        self.files = set()          # Ficheros "en disco" que se pueden pedir a /view
+        self.view_requests = 0
+        self.runner = None
+        self.worker = None
+        self.url = None
+
+    # --- CICLO DE VIDA ---
+    async def start(self, host="127.0.0.1", port=0):
+        """Arranca el servidor en el event loop actual. Devuelve la URL base."""
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.create_task(self._gpu_worker())
+        self.runner = web.AppRunner(self.build_app(), access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        real_port = self.runner.addresses[0][1]     # El puerto real si se pidió el 0
+        self.url = f"http://{host}:{real_port}"
+        return self.url
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+            await asyncio.gather(self.worker, return_exceptions=True)
+        if self.runner:
+            await self.runner.cleanup()
+
+    @property
+    def address(self):
+        """ip:puerto, el mismo formato que devuelve main.get_pod_addr."""
+        return self.url.replace("http://", "")
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_post("/prompt", self.handle_prompt)
+        app.router.add_get("/history", self.handle_history_all)
+        app.router.add_get("/history/{prompt_id}", self.handle_history)
+        app.router.add_get("/queue", self.handle_queue)
+        app.router.add_get("/object_info/CheckpointLoaderSimple", self.handle_object_info)
+        app.router.add_get("/system_stats", self.handle_system_stats)
+        app.router.add_get("/ws", self.handle_ws)
+        app.router.add_get("/view", self.handle_view)
+        return app
+
+    # --- "GPU" ---
+    async def _gpu_worker(self):
+        while True:
+            prompt_id, number, workflow, client_id = await self.queue.get()
+            started = self.clock()
+            await self._emit(client_id, "execution_start", {"prompt_id": prompt_id, "timestamp": int(started * 1000)})
+            # Cambio de checkpoint: hay que cargarlo en VRAM antes de generar
+            for node in workflow.values():
+                if node.get("class_type") == "CheckpointLoaderSimple":
+                    model = node.get("inputs", {}).get("ckpt_name")
+                    if model != self.loaded_model:
+                        self.loaded_model = model
+                        self.model_loads += 1
+                        await asyncio.sleep(self.model_load_time)
+            # Overhead fijo por prompt + una imagen por SaveImage del grafo (lotes = varias ramas)
+            images = sum(1 for node in workflow.values() if node.get("class_type") == "SaveImage")
+            await asyncio.sleep(self.render_seconds(images))
+            failed = self.random.random() < self.failure_rate
+            entry = self._history_entry(prompt_id, number, workflow, started, failed)
+            self.history[prompt_id] = entry
+            if failed:
+                await self._emit(client_id, "execution_error",
+                                 {"prompt_id": prompt_id, "exception_message": "Fallo simulado"})
+                continue
+            for node_id, output in entry["outputs"].items():
+                await self._emit(client_id, "executed", {"node": node_id, "output": output, "prompt_id": prompt_id})
+            await self._emit(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    def render_seconds(self, images):
+        """Duración de un prompt con images imágenes (el simulador la cambia por una distribución)."""
+        return self.overhead + self.render_time * max(images, 1)
+
+    async def _emit(self, client_id, event, data):
+        ws = self.sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_json({"type": event, "data": data})
+
+    def _history_entry(self, prompt_id, number, workflow, started, failed):
+        outputs = {}
+        if not failed:
+            for node_id, node in workflow.items():
+                if node.get("class_type") == "SaveImage":
+                    prefix = node.get("inputs", {}).get("filename_prefix", "ComfyUI")
+                    filename = f"{prefix}_{self.images_saved:05d}_.png"
+                    outputs[node_id] = {"images": [{"filename": filename, "subfolder": "", "type": "output"}]}
+                    self.files.add(filename)
+                    self.images_saved += 1
+        end_event = "execution_error" if failed else "execution_success"
+        return {
+            "prompt": [number, prompt_id, workflow, {}, list(outputs)],
+            "outputs": outputs,
+            "status": {
+                "status_str": "error" if failed else "success",
+                "completed": not failed,
+                "messages": [
+                    ["execution_start", {"prompt_id": prompt_id, "timestamp": int(started * 1000)}],
+                    [end_event, {"prompt_id": prompt_id, "timestamp": int(self.clock() * 1000)}],
+                ],
+            },
+        }
+
+    # --- HANDLERS HTTP ---
+    async def handle_prompt(self, request):
+        if self.http_error_rate and self.random.random() < self.http_error_rate:
+            return web.json_response({"error": "Service Unavailable"}, status=503)
+        body = await request.json()
+        workflow = body.get("prompt")
+        if not isinstance(workflow, dict) or not workflow:
+            return web.json_response({"error": "invalid prompt", "node_errors": {}}, status=400)
+        prompt_id = str(uuid.uuid4())
+        number = self.prompts_received
+        self.prompts_received += 1
+        await self.queue.put((prompt_id, number, workflow, body.get("client_id")))
+        return web.json_response({"prompt_id": prompt_id, "number": number, "node_errors": {}})
+
+    async def handle_history(self, request):
+        self.history_requests += 1
+        prompt_id = request.match_info["prompt_id"]
+        if prompt_id in self.history:
+            return web.json_response({prompt_id: self.history[prompt_id]})
+        return web.json_response({})
+
+    async def handle_history_all(self, request):
+        self.history_requests += 1
+        max_items = int(request.query.get("max_items", len(self.history)))
+        items = list(self.history.items())[-max_items:] if max_items else []
+        return web.json_response(dict(items))
+
+    async def handle_queue(self, request):
+        return web.json_response({"queue_running": [], "queue_pending": [None] * self.queue.qsize()})
+
+    def system_stats(self):
+        return {
+            "system": {"os": "posix", "comfyui_version": "fake", "python_version": "3"},
+            "devices": [{"name": "cuda:0 Fake GPU", "type": "cuda", "index": 0,
+                         "vram_total": 24 * 1024 ** 3, "vram_free": 20 * 1024 ** 3}],
+        }
+
+    async def handle_system_stats(self, request):
+        return web.json_response(self.system_stats())
+
+    async def handle_object_info(self, request):
+        return web.json_response({
+            "CheckpointLoaderSimple": {"input": {"required": {"ckpt_name": [self.models]}}}
+        })
+
+    @staticmethod
+    def image_bytes(filename, size):
+        """Contenido de una imagen falsa: siempre el mismo para el mismo nombre (checksums comprobables)."""
+        return b"\x89PNG\r\n\x1a\n" + random.Random(filename).randbytes(max(0, size - 8))
+
+    async def handle_view(self, request):
+        self.view_requests += 1
+        filename = request.query.get("filename")
+        if filename not in self.files or request.query.get("type", "output") != "output":
+            raise web.HTTPNotFound()
+        data = self.image_bytes(filename, self.output_bytes)
+        response = web.StreamResponse(headers={"Content-Type": "image/png"})
+        response.content_length = len(data)
+        await response.prepare(request)
+        for start in range(0, len(data), VIEW_CHUNK):
+            await response.write(data[start:start + VIEW_CHUNK])
+        await response.write_eof()
+        return response
+
+    async def handle_ws(self, request):
+        if not self.websocket:
+            raise web.HTTPNotFound()
+        client_id = request.query.get("clientId") or str(uuid.uuid4())
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets[client_id] = ws
+        await ws.send_json({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": self.queue.qsize()}},
+                                                       "sid": client_id}})
+        try:
+            async for _ in ws:
+                pass
+        finally:
+            if self.sockets.get(client_id) is ws:
+                del self.sockets[client_id]
+        return ws
+
+
+class LocalBackend:
+    """Backend de infraestructura que apunta a un FakeComfyUI (sustituye a main.py en local)."""
+
+    def __init__(self, address):
+        self.address = address
+        self.created = 0
+        self.stopped = []
+
+    def create_worker_pod(self, tipo_trabajo="imagen"):
+        self.created += 1
+        return f"POD-LOCAL-{self.created}"
+
+    def stop_worker_pod(self, pod_id):
+        self.stopped.append(pod_id)
+
+    def resume_worker_pod(self, pod_id):
+        return pod_id in self.stopped
+
+    def terminate_worker_pod(self, pod_id):
+        self.stopped.append(pod_id)
+
+    def gpu_type_for(self, tipo_trabajo="imagen"):
+        return "local"
+
+    def get_gpu_prices(self):
+        return {}      # Sin precios: el medidor usa el precio por defecto
+
+    def get_pod_addr(self, pod_id):
+        return self.address
+
+
+# ==========================================
+# ZONA DE TEST
+# ==========================================
+async def demo(num_jobs, render_time, failure_rate, websocket=True, overhead=PROMPT_OVERHEAD_S, batch_tradeoff=None,
+               outputs_dir=None):
+    from queue_system import QueueOrchestrator
+    from micro_batcher import BATCH_TRADEOFF
+    from output_store import LocalStorage
+
+    fake = FakeComfyUI(render_time=render_time, failure_rate=failure_rate, seed=42, websocket=websocket,
+                       overhead=overhead)
+    await fake.start()
+    print(f"🧪 ComfyUI falso escuchando en {fake.url}")
+    try:
+        sistema = QueueOrchestrator(backend=LocalBackend(fake.address),
+                                    batch_tradeoff=BATCH_TRADEOFF if batch_tradeoff is None else batch_tradeoff,
+                                    metrics_port=0, tracing=True,   # Puerto libre cualquiera para /metrics
+                                    output_store=LocalStorage(outputs_dir) if outputs_dir else None)
+        for i in range(num_jobs):
+            sistema.submit_job(f"Un astronauta en marte #{i}")
+        start = time.time()
+        await sistema.process_queue_async(stop_when_idle=True)
+        elapsed = time.time() - start
+        print(f"\n📊 {num_jobs} jobs en {elapsed:.2f}s "
+              f"(completados: {len(sistema.completed_jobs)}, DLQ: {len(sistema.dead_letter_queue)}, "
+              f"prompts en ComfyUI: {fake.prompts_received}, peticiones /history: {fake.history_requests})")
+        m = sistema.metrics
+        mean = lambda h: h.sum / h.count if h.count else 0.0
+        print(f"📈 Medias: despacho {mean(m.dispatch_latency):.3f}s, espera en Pod {mean(m.first_gpu):.3f}s, "
+              f"render {mean(m.render_time):.3f}s; reintentos {m.retries.value}, "
+              f"spans de traza {len(sistema.tracer.spans)}")
+        if sistema.fetcher:
+            # Cada fichero guardado debe ser idéntico al que sirvió el "Pod"
+            corruptos = sum(
+                1 for job in sistema.completed_jobs for image in job.result
+                if open(image, "rb").read() != fake.image_bytes(os.path.basename(image), fake.output_bytes)
+            )
+            print(f"💾 {sistema.fetcher.files} imágenes ({sistema.fetcher.bytes / 1e6:.1f} MB) en {outputs_dir}, "
+                  f"peticiones /view: {fake.view_requests}, ficheros corruptos: {corruptos}")
+        return sistema      # Para los tests (test_fake_comfyui.py)
+    finally:
+        await fake.stop()
+
+
+async def serve(host, port, render_time, failure_rate, websocket=True, overhead=PROMPT_OVERHEAD_S):
+    fake = FakeComfyUI(render_time=render_time, failure_rate=failure_rate, websocket=websocket, overhead=overhead)
+    await fake.start(host, port)
+    print(f"🧪 ComfyUI falso escuchando en {fake.url} (Ctrl+C para parar)")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await fake.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor ComfyUI falso para pruebas locales")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--render-time", type=float, default=RENDER_TIME_S)
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE)
+    parser.add_argument("--overhead", type=float, default=PROMPT_OVERHEAD_S, help="Segundos fijos por prompt")
+    parser.add_argument("--batch-tradeoff", type=float, help="Micro-batching en la demo: 0 = latencia, 1 = coste")
+    parser.add_argument("--no-websocket", action="store_true", help="Desactiva /ws (fuerza el polling de respaldo)")
+    parser.add_argument("--demo", type=int, metavar="N_JOBS", help="Lanza el orquestador contra el servidor con N jobs")
+    parser.add_argument("--outputs", metavar="DIR", help="En la demo, descarga las imágenes a DIR (output_store.py)")
+    args = parser.parse_args()
+
+    try:
+        if args.demo:
+            asyncio.run(demo(args.demo, args.render_time, args.failure_rate, websocket=not args.no_websocket,
+                             overhead=args.overhead, batch_tradeoff=args.batch_tradeoff, outputs_dir=args.outputs))
+        else:
+            asyncio.run(serve(args.host, args.port, args.render_time, args.failure_rate,
+                              websocket=not args.no_websocket, overhead=args.overhead))
+    except KeyboardInterrupt:
+        print("\n🛑 Servidor detenido.")
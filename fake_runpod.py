@@ -0,0 +1,406 @@
+import argparse
+import asyncio
+import collections
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from aiohttp import web
+
+from fake_comfyui import FakeComfyUI
+from workflow_templates import PLANTILLAS, PLANTILLA_POR_DEFECTO
+
+# ==========================================
+# BACKEND RUNPOD SIMULADO (PARA PRUEBAS DEL POOL)
+# ==========================================
+# Misma interfaz que main.py (create / stop / resume / terminate_worker_pod, get_pod_addr,
+# gpu_type_for y get_gpu_prices), pero cada "Pod" es un FakeComfyUI local que tarda
+# boot_time segundos en estar listo. Lleva la cuenta de Pods creados/parados y de los
+# segundos de GPU facturados (para contrastar con el medidor de costes).
+
+BOOT_TIME_S = 1.0
+RESUME_TIME_S = 0.3
+SIM_GPU = "NVIDIA GeForce RTX 4090"
+SIM_GPU_PRICES = {"NVIDIA GeForce RTX 4090": 0.69, "NVIDIA A100 80GB PCIe": 1.64}
+
+
+class SimulatedRunPod:
+    def __init__(self, addresses, boot_time=BOOT_TIME_S, resume_time=RESUME_TIME_S, gpu_prices=None,
+                 clock=time.monotonic):
+        self.free_addresses = list(addresses)   # Capacidad del "datacenter"
+        self.boot_time = boot_time
+        self.resume_time = resume_time
+        self.gpu_prices = dict(SIM_GPU_PRICES if gpu_prices is None else gpu_prices)
+        self.clock = clock
+        self.pods = {}                          # pod_id -> {"address", "started", "boot"}
+        self.parked = set()                     # Pods parados (se pueden reanudar)
+        self.created = 0
+        self.resumed = 0
+        self.terminated = 0
+        self.stopped = []
+        self.billed_seconds = 0.0
+        self.price_queries = 0
+        self._lock = threading.Lock()
+
+    def create_worker_pod(self, tipo_trabajo="imagen"):
+        with self._lock:
+            if not self.free_addresses:
+                print("❌ Error al crear Pod: sin capacidad en el datacenter simulado")
+                return None
+            self.created += 1
+            pod_id = f"POD-SIM-{self.created}"
+            self.pods[pod_id] = {"address": self.free_addresses.pop(0), "started": self.clock(), "boot": self.boot_time}
+            return pod_id
+
+    def resume_worker_pod(self, pod_id):
+        with self._lock:
+            if pod_id not in self.parked or not self.free_addresses:
+                return False
+            self.parked.discard(pod_id)
+            self.resumed += 1
+            self.pods[pod_id] = {"address": self.free_addresses.pop(0), "started": self.clock(), "boot": self.resume_time}
+            return True
+
+    def _release(self, pod_id):
+        pod = self.pods.pop(pod_id, None)
+        if pod is not None:
+            self.billed_seconds += self.clock() - pod["started"]
+            self.free_addresses.append(pod["address"])
+
+    def stop_worker_pod(self, pod_id):
+        with self._lock:
+            self._release(pod_id)
+            self.parked.add(pod_id)
+            self.stopped.append(pod_id)
+
+    def terminate_worker_pod(self, pod_id):
+        with self._lock:
+            self._release(pod_id)
+            self.parked.discard(pod_id)
+            self.terminated += 1
+
+    def gpu_type_for(self, tipo_trabajo="imagen"):
+        return SIM_GPU
+
+    def get_gpu_prices(self):
+        self.price_queries += 1
+        return dict(self.gpu_prices)
+
+    def get_pod_addr(self, pod_id):
+        with self._lock:
+            pod = self.pods.get(pod_id)
+            if pod is None or self.clock() - pod["started"] < pod["boot"]:
+                return None
+            return pod["address"]
+
+    def running_pods(self):
+        with self._lock:
+            return list(self.pods)
+
+
+# ==========================================
+# API GRAPHQL DE RUNPOD SIMULADA
+# ==========================================
+# Servidor HTTP con la forma de https://api.runpod.io/graphql sobre un SimulatedRunPod,
+# para probar runpod_client.py / main.py sin cuenta ni saldo:
+#   RUNPOD_API_URL=<url> RUNPOD_API_KEY=<api_key> python ...
+# No es un motor GraphQL: responde a las operaciones que envía RunPodClient por su
+# operationName, y a los alias (p0, p1... / g0, g1...) por las variables que declara.
+# Exige el Bearer, aplica un límite de peticiones por segundo (429 + Retry-After) y puede
+# devolver 503 aleatorios (error_rate). Corre en su propio hilo y event loop, como un
+# servicio externo: las llamadas síncronas de main.py no lo bloquean.
+
+FAKE_API_KEY = "sim-api-key"
+FAKE_API_RATE_LIMIT = 20          # Peticiones por segundo antes de responder 429
+
+
+class FakeRunPodAPI:
+    def __init__(self, runpod, api_key=FAKE_API_KEY, rate_limit=FAKE_API_RATE_LIMIT, error_rate=0.0,
+                 balance=25.0, seed=0):
+        self.runpod = runpod
+        self.api_key = api_key
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.balance = balance
+        self.rng = random.Random(seed)
+        self.url = None
+        self.requests = 0
+        self.throttled = 0
+        self.errors = 0
+        self.operations = collections.Counter()
+        self.pods_per_status_query = []
+        self._recent = collections.deque()      # Instantes de las peticiones del último segundo
+        self._loop = None
+        self._thread = None
+        self._runner = None
+
+    # --- CICLO DE VIDA (hilo propio) ---
+    def start(self, host="127.0.0.1", port=0):
+        """Arranca el servidor en un hilo. Devuelve la URL del endpoint GraphQL."""
+        started = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run():
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._serve(host, port))
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-runpod-api", daemon=True)
+        self._thread.start()
+        started.wait()
+        return self.url
+
+    async def _serve(self, host, port):
+        app = web.Application()
+        app.router.add_post("/graphql", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.url = f"http://{host}:{self._runner.addresses[0][1]}/graphql"
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._loop = None
+
+    # --- HTTP ---
+    async def handle(self, request):
+        self.requests += 1
+        if request.headers.get("Authorization") != f"Bearer {self.api_key}":
+            return web.json_response({"errors": [{"message": "Unauthorized"}]}, status=401)
+        now = time.monotonic()
+        while self._recent and now - self._recent[0] >= 1.0:
+            self._recent.popleft()
+        if len(self._recent) >= self.rate_limit:
+            self.throttled += 1
+            retry_after = 1.0 - (now - self._recent[0])
+            return web.json_response({"errors": [{"message": "Too Many Requests"}]}, status=429,
+                                     headers={"Retry-After": f"{retry_after:.3f}"})
+        self._recent.append(now)
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.errors += 1
+            return web.json_response({"errors": [{"message": "Service Unavailable"}]}, status=503)
+
+        body = await request.json()
+        operation = body.get("operationName")
+        variables = body.get("variables") or {}
+        self.operations[operation] += 1
+        handler = getattr(self, f"_op_{operation}", None)
+        if handler is None:
+            return web.json_response({"errors": [{"message": f"Operación no simulada: {operation}"}]})
+        try:
+            data = handler(variables)
+        except ValueError as e:
+            return web.json_response({"data": None, "errors": [{"message": str(e)}]})
+        return web.json_response({"data": data})
+
+    # --- OPERACIONES ---
+    def _op_Myself(self, variables):
+        return {"myself": {"id": "user-sim", "clientBalance": self.balance}}
+
+    def _op_GpuTypes(self, variables):
+        return {"gpuTypes": [{"id": gpu_id, "displayName": gpu_id.replace("NVIDIA ", ""), "memoryInGb": 24}
+                             for gpu_id in self.runpod.gpu_prices]}
+
+    def _op_GpuPrices(self, variables):
+        self.runpod.price_queries += 1
+        data = {}
+        for alias, gpu_filter in variables.items():
+            price = self.runpod.gpu_prices.get(gpu_filter["id"])
+            data[alias] = [] if price is None else [{
+                "id": gpu_filter["id"], "displayName": gpu_filter["id"].replace("NVIDIA ", ""), "memoryInGb": 24,
+                "communityPrice": price, "securePrice": round(price * 1.2, 2),
+                "lowestPrice": {"minimumBidPrice": round(price * 0.6, 2), "uninterruptablePrice": price},
+            }]
+        return data
+
+    def _op_PodStatus(self, variables):
+        self.pods_per_status_query.append(len(variables))
+        return {alias: self._pod(pod_filter["podId"]) for alias, pod_filter in variables.items()}
+
+    def _pod(self, pod_id):
+        sim = self.runpod
+        if pod_id in sim.parked:
+            return {"id": pod_id, "desiredStatus": "EXITED", "lastStatusChange": "Exited by user", "runtime": None}
+        if pod_id not in sim.running_pods():
+            return None
+        address = sim.get_pod_addr(pod_id)
+        if address is None:
+            return {"id": pod_id, "desiredStatus": "RUNNING", "lastStatusChange": "Rented by user", "runtime": None}
+        ip, port = address.rsplit(":", 1)
+        return {"id": pod_id, "desiredStatus": "RUNNING", "lastStatusChange": "Rented by user",
+                "runtime": {"uptimeInSeconds": 1, "ports": [
+                    {"ip": ip, "isIpPublic": True, "privatePort": 8188, "publicPort": int(port), "type": "tcp"}]}}
+
+    def _op_CreatePod(self, variables):
+        pod_id = self.runpod.create_worker_pod()
+        if pod_id is None:
+            raise ValueError("There are no longer any instances available with the requested specifications.")
+        return {"podFindAndDeployOnDemand": {"id": pod_id, "desiredStatus": "RUNNING",
+                                             "imageName": variables["input"].get("imageName"), "machineId": "sim"}}
+
+    def _op_ResumePod(self, variables):
+        pod_id = variables["input"]["podId"]
+        if not self.runpod.resume_worker_pod(pod_id):
+            raise ValueError("There are not enough free GPUs on the host machine to start this pod.")
+        return {"podResume": {"id": pod_id, "desiredStatus": "RUNNING"}}
+
+    def _op_StopPod(self, variables):
+        pod_id = variables["input"]["podId"]
+        self.runpod.stop_worker_pod(pod_id)
+        return {"podStop": {"id": pod_id, "desiredStatus": "EXITED"}}
+
+    def _op_TerminatePod(self, variables):
+        self.runpod.terminate_worker_pod(variables["input"]["podId"])
+        return {"podTerminate": None}
+
+
+# ==========================================
+# ZONA DE TEST
+# ==========================================
+def model_templates(num_models, directory):
+    """Copias de workflow_api.json con checkpoints distintos (una plantilla por modelo)."""
+    with open(PLANTILLAS[PLANTILLA_POR_DEFECTO]) as f:
+        base = json.load(f)
+    templates = {}
+    for i in range(num_models):
+        graph = json.loads(json.dumps(base))
+        for node in graph.values():
+            if node["class_type"] == "CheckpointLoaderSimple":
+                node["inputs"]["ckpt_name"] = f"modelo_{i}.safetensors"
+        path = os.path.join(directory, f"modelo_{i}.json")
+        with open(path, "w") as f:
+            json.dump(graph, f)
+        templates[f"modelo_{i}"] = path
+    return templates
+
+
+async def demo(num_pods, num_jobs, render_time, boot_time, num_models=1, model_load_time=0.0, sick=False, shards=1):
+    from queue_system import QueueOrchestrator
+
+    models = [f"modelo_{i}.safetensors" for i in range(num_models)]
+    servers = [FakeComfyUI(render_time=render_time, models=models, model_load_time=model_load_time)
+               for _ in range(num_pods)]
+    if sick:
+        # El primer Pod responde 503 a todo; el último servidor queda libre para su reemplazo
+        servers[0].http_error_rate = 1.0
+        servers.append(FakeComfyUI(render_time=render_time, models=models, model_load_time=model_load_time))
+    for server in servers:
+        await server.start()
+    backend = SimulatedRunPod([server.address for server in servers], boot_time=boot_time)
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        sistema = QueueOrchestrator(backend=backend, max_pods=num_pods, shards=shards)
+        sistema.pool.health.cooldown_s = 1.0     # Enfriamiento del circuit breaker a escala de la demo
+        names = [PLANTILLA_POR_DEFECTO]
+        if num_models > 1:
+            # Varios checkpoints en rotación: los jobs llegan intercalados
+            names = []
+            for name, path in model_templates(num_models, tmp.name).items():
+                sistema.templates.register(name, path)
+                names.append(name)
+        for i in range(num_jobs):
+            sistema.submit_job(f"Ráfaga de prueba #{i}", template=names[i % len(names)])
+        start = time.time()
+        await sistema.process_queue_async(stop_when_idle=True)
+        elapsed = time.time() - start
+        sistema.pool.stop_all()
+        print(f"\n📊 {num_jobs} jobs en {elapsed:.2f}s con hasta {num_pods} Pods "
+              f"(creados: {backend.created}, completados: {len(sistema.completed_jobs)}, "
+              f"GPU facturada: {backend.billed_seconds:.1f}s)")
+        # El medidor debe cuadrar con lo "facturado" por el RunPod simulado
+        facturado = backend.billed_seconds * SIM_GPU_PRICES[SIM_GPU] / 3600
+        imputado = sum(job.cost for job in sistema.completed_jobs)
+        print(f"💲 Gasto medido: ${sistema.total_spent_today:.6f} (RunPod simulado: ${facturado:.6f}); "
+              f"imputado a jobs: ${imputado:.6f}; Pods sin jobs: ${sistema.meter.unattributed_cost:.6f}; "
+              f"consultas de precios: {backend.price_queries}")
+        for server in servers:
+            print(f"   {server.address}: {server.prompts_received} prompts, {server.model_loads} cargas de modelo")
+        health = sistema.pool.health
+        print(f"🩺 Fallos de infraestructura: {health.infra_failures} (jobs reencolados: "
+              f"{sistema.metrics.infra_requeues.value}), aperturas de circuito: {health.opens}, "
+              f"Pods reemplazados: {health.replaced}, DLQ: {len(sistema.dead_letter_queue)}")
+        if sistema.shards:
+            # Grupos al final de la ejecución (con la flota ya estable coinciden con los del despacho)
+            in_group = sum(job.pod_id in sistema.shards.pods_for(job.prompt_hash) for job in sistema.completed_jobs)
+            print(f"🧩 {shards} shards en grupos de {sistema.shards.group_size} Pods "
+                  f"({sistema.shards.rebalances} repartos); jobs servidos por su grupo dueño: "
+                  f"{in_group}/{len(sistema.completed_jobs)}")
+        return sistema      # Para los tests (test_worker_pool.py)
+    finally:
+        for server in servers:
+            await server.stop()
+        tmp.cleanup()
+
+
+async def graphql_demo(num_pods, num_jobs, render_time, boot_time, rate_limit, error_rate):
+    """El orquestador con main.py de backend real (runpod_client.py) contra FakeRunPodAPI."""
+    servers = [FakeComfyUI(render_time=render_time) for _ in range(num_pods)]
+    for server in servers:
+        await server.start()
+    api = FakeRunPodAPI(SimulatedRunPod([server.address for server in servers], boot_time=boot_time),
+                        rate_limit=rate_limit, error_rate=error_rate)
+    os.environ["RUNPOD_API_KEY"] = api.api_key
+    os.environ["RUNPOD_API_URL"] = api.start()
+    try:
+        import main
+        from queue_system import QueueOrchestrator
+
+        main.client.events.poll_s = 0.5         # Escala de la demo (arranques de ~1s)
+        await asyncio.to_thread(main.test_connection)
+        sistema = QueueOrchestrator(backend=main, max_pods=num_pods)
+        for i in range(num_jobs):
+            sistema.submit_job(f"Ráfaga GraphQL #{i}")
+        start = time.time()
+        await sistema.process_queue_async(stop_when_idle=True)
+        elapsed = time.time() - start
+        await asyncio.to_thread(sistema.pool.stop_all)
+        main.client.events.close()
+
+        stats = main.client.stats()
+        per_query = api.pods_per_status_query
+        print(f"\n📊 {num_jobs} jobs en {elapsed:.2f}s (completados: {len(sistema.completed_jobs)}, "
+              f"DLQ: {len(sistema.dead_letter_queue)}, Pods creados: {api.runpod.created})")
+        print(f"🌐 API GraphQL: {api.requests} peticiones ({dict(api.operations)}); 429: {api.throttled}, "
+              f"503: {api.errors}; reintentos del cliente: {stats['retries']}, "
+              f"espera por rate limit: {stats['rate_wait_s']:.2f}s")
+        print(f"📡 Estado de Pods: {stats['pods_queried']} consultas de Pod en {stats['status_queries']} llamadas "
+              f"(máx. {max(per_query, default=0)} Pods por llamada); caché de GPUs: {stats['cache_hits']} aciertos")
+        print(f"🔔 Eventos de ciclo de vida: {main.client.events.published} publicados, "
+              f"{sistema.pool.pod_events} recibidos por el pool")
+    finally:
+        api.stop()
+        for server in servers:
+            await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Prueba del pool de Pods contra un RunPod simulado")
+    parser.add_argument("--pods", type=int, default=3)
+    parser.add_argument("--jobs", type=int, default=60)
+    parser.add_argument("--render-time", type=float, default=0.2)
+    parser.add_argument("--boot-time", type=float, default=BOOT_TIME_S)
+    parser.add_argument("--modelos", type=int, default=1, help="Checkpoints distintos en rotación")
+    parser.add_argument("--model-load-time", type=float, default=0.0, help="Segundos por cambio de checkpoint")
+    parser.add_argument("--pod-enfermo", action="store_true", help="El primer Pod responde 503 (circuit breaker)")
+    parser.add_argument("--shards", type=int, default=1, help="Shards de la cola por hash del prompt")
+    parser.add_argument("--graphql", action="store_true",
+                        help="Usa main.py (runpod_client.py) contra la API GraphQL simulada")
+    parser.add_argument("--api-rate-limit", type=int, default=FAKE_API_RATE_LIMIT, help="Peticiones/s de la API simulada")
+    parser.add_argument("--api-error-rate", type=float, default=0.0, help="Probabilidad de 503 en la API simulada")
+    args = parser.parse_args()
+    if args.graphql:
+        asyncio.run(graphql_demo(args.pods, args.jobs, args.render_time, args.boot_time,
+                                 args.api_rate_limit, args.api_error_rate))
+    else:
+        asyncio.run(demo(args.pods, args.jobs, args.render_time, args.boot_time, args.modelos, args.model_load_time,
+                         sick=args.pod_enfermo, shards=args.shards))
@@ -0,0 +1,100 @@
+import collections
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from prompt_filter import PromptFilter
+
+# ==========================================
+# VALIDACIÓN DE LA INGESTA EN VARIOS PROCESOS
+# ==========================================
+# En una ingesta masiva casi todo el tiempo se va en normalizar y filtrar cada prompt
+# (Unicode, leetspeak, regex) y en su hash: trabajo de CPU puro que el GIL deja en un
+# solo núcleo. Aquí se reparte en un pool de procesos:
+#  - Cada proceso compila su propio PromptFilter una vez (initializer) y recarga la
+#    lista de términos del fichero igual que el del orquestador.
+#  - El proceso principal solo lee/parsea el fichero y hace lo que necesita el estado
+#    compartido (deduplicación, caché, presupuesto, cola), con las comprobaciones ya
+#    hechas: QueueOrchestrator.submit_many(batch, checks=...).
+#  - Como mucho IN_FLIGHT_PER_WORKER lotes por proceso en vuelo: la memoria sigue sin
+#    depender del tamaño del fichero y el orden de los lotes se conserva.
+# La parte secuencial (parseo + encolado) marca el techo del escalado; ver benchmark_ingest.py.
+
+INGEST_WORKERS = os.cpu_count() or 1    # Procesos de validación por defecto
+IN_FLIGHT_PER_WORKER = 2                # Lotes encargados por proceso a la vez
+
+
+def check_prompts(prompt_filter, prompts, max_length):
+    """(is_valid, message) por prompt: longitud y términos prohibidos, en el mismo orden."""
+    results = []
+    for prompt, bad_word in zip(prompts, prompt_filter.validate_many(prompts)):
+        if not prompt or len(prompt) > max_length:
+            results.append((False, f"Prompt inválido o demasiado largo (>{max_length} chars)"))
+        elif bad_word is not None:
+            results.append((False, f"Contenido prohibido detectado: '{bad_word}'"))
+        else:
+            results.append((True, "OK"))
+    return results
+
+
+def prompt_hash(prompt):
+    return hashlib.md5(prompt.encode()).hexdigest()
+
+
+# --- LADO DEL PROCESO HIJO ---
+_worker_filter = None
+_worker_max_length = None
+
+
+def _init_worker(terms, path, max_length):
+    global _worker_filter, _worker_max_length
+    _worker_filter = PromptFilter(terms, path=path)
+    _worker_max_length = max_length
+
+
+def _check_batch(prompts):
+    """(is_valid, message, prompt_hash) por prompt (hash None si no es válido)."""
+    return [
+        (is_valid, message, prompt_hash(prompt) if is_valid else None)
+        for prompt, (is_valid, message) in zip(prompts, check_prompts(_worker_filter, prompts, _worker_max_length))
+    ]
+
+
+# --- LADO DEL ORQUESTADOR ---
+class IngestPool:
+    """Pool de procesos que valida y hashea lotes de prompts. Se usa como context manager."""
+
+    def __init__(self, terms, path=None, max_length=500, workers=INGEST_WORKERS):
+        self.workers = workers
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                            initargs=(list(terms), path, max_length))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def check(self, prompts):
+        """Future con la lista de _check_batch para esos prompts."""
+        return self.executor.submit(_check_batch, prompts)
+
+    def checked_batches(self, batches):
+        """
+        Genera (batch, checks) en el orden de entrada. checks va alineado con los prompts
+        str del lote (los que no lo son ya se rechazan por formato en submit_many).
+        """
+        pending = collections.deque()
+        limit = self.workers * IN_FLIGHT_PER_WORKER
+        for batch in batches:
+            prompts = [item.get("prompt") for item in batch]
+            pending.append((batch, self.check([prompt for prompt in prompts if isinstance(prompt, str)])))
+            if len(pending) >= limit:
+                batch, future = pending.popleft()
+                yield batch, future.result()
+        while pending:
+            batch, future = pending.popleft()
+            yield batch, future.result()
@@ -0,0 +1,184 @@
+import heapq
+from collections import deque
+
+# ==========================================
+# COLA DE TRABAJOS CON PRIORIDADES Y REPARTO JUSTO
+# ==========================================
+# Sustituye a la lista plana (pop(0)/insert(0) son O(n)).
+#  - Prioridad: siempre se sirve antes el nivel más alto (número mayor).
+#  - Reparto justo: dentro de un nivel, los tenants se turnan (round-robin),
+#    así un cliente que mete 10.000 prompts no bloquea al resto.
+#  - FIFO: dentro de un mismo tenant y nivel se respeta el orden de llegada.
+# push/pop son O(log P) siendo P el nº de niveles de prioridad distintos (O(1) en la práctica).
+
+PRIORIDAD_BAJA = 0
+PRIORIDAD_NORMAL = 5
+PRIORIDAD_ALTA = 10
+TENANT_POR_DEFECTO = "default"
+
+
+class _PriorityLevel:
+    """Colas FIFO por tenant + turno rotatorio de tenants con trabajo pendiente."""
+
+    __slots__ = ("queues", "rotation")
+
+    def __init__(self):
+        self.queues = {}         # tenant -> deque de jobs
+        self.rotation = deque()  # tenants con jobs, en orden de turno
+
+    def push(self, job, front=False):
+        queue = self.queues.get(job.tenant)
+        if queue is None:
+            queue = self.queues[job.tenant] = deque()
+            if front:
+                self.rotation.appendleft(job.tenant)
+            else:
+                self.rotation.append(job.tenant)
+        if front:
+            queue.appendleft(job)
+        else:
+            queue.append(job)
+
+    def pop(self):
+        tenant = self.rotation.popleft()
+        queue = self.queues[tenant]
+        job = queue.popleft()
+        if queue:
+            self.rotation.append(tenant)
+        else:
+            del self.queues[tenant]
+        return job
+
+    def __bool__(self):
+        return bool(self.rotation)
+
+
+class PriorityJobQueue:
+    def __init__(self):
+        self._levels = {}        # prioridad -> _PriorityLevel
+        self._priorities = []    # heap de -prioridad (solo niveles con jobs)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        """Recorre los jobs pendientes (orden aproximado, solo para inspección)."""
+        for priority in sorted(self._levels, reverse=True):
+            for queue in self._levels[priority].queues.values():
+                yield from queue
+
+    def _level(self, priority):
+        level = self._levels.get(priority)
+        if level is None:
+            level = self._levels[priority] = _PriorityLevel()
+            heapq.heappush(self._priorities, -priority)
+        return level
+
+    def push(self, job):
+        """Encola al final de su tenant dentro de su nivel de prioridad."""
+        self._level(job.priority).push(job)
+        self._size += 1
+
+    def push_front(self, job):
+        """Encola en cabeza (reintentos: no pierden su turno)."""
+        self._level(job.priority).push(job, front=True)
+        self._size += 1
+
+    def head_priority(self):
+        """Prioridad del siguiente job que saldría (None si está vacía)."""
+        return -self._priorities[0] if self._size else None
+
+    def pop(self):
+        """Saca el siguiente job: prioridad más alta, turno del tenant, FIFO."""
+        if not self._size:
+            raise IndexError("pop from empty PriorityJobQueue")
+        priority = -self._priorities[0]
+        level = self._levels[priority]
+        job = level.pop()
+        if not level:
+            heapq.heappop(self._priorities)
+            del self._levels[priority]
+        self._size -= 1
+        return job
+
+    def depth_by_priority(self):
+        """Nº de jobs pendientes por nivel de prioridad (para logs/métricas)."""
+        return {
+            priority: sum(len(queue) for queue in level.queues.values())
+            for priority, level in self._levels.items()
+        }
+
+
+# ------------------------------------------
+# COLA REPARTIDA EN SHARDS POR HASH DEL PROMPT
+# ------------------------------------------
+# Misma interfaz que PriorityJobQueue, pero los jobs se reparten en N colas según el hash
+# de su prompt (el mismo prompt cae siempre en el mismo shard). Es la unidad que
+# ShardCoordinator asigna a grupos de Pods. pop sigue sirviendo siempre la prioridad más
+# alta; entre shards con la misma prioridad se turnan, y dentro de cada shard los tenants.
+# Ojo: el reparto justo entre tenants pasa a ser por shard, no global.
+
+def shard_index(prompt_hash, shards):
+    """Shard de un prompt (estable entre procesos y reinicios, a diferencia de hash())."""
+    return int(prompt_hash[:8], 16) % shards if prompt_hash else 0
+
+
+class ShardedJobQueue:
+    def __init__(self, shards):
+        self.shards = [PriorityJobQueue() for _ in range(shards)]
+        self._size = 0
+        self._turn = 0           # Shard por el que empieza el desempate
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        for shard in self.shards:
+            yield from shard
+
+    def shard_of(self, job):
+        return shard_index(job.prompt_hash, len(self.shards))
+
+    def push(self, job):
+        self.shards[self.shard_of(job)].push(job)
+        self._size += 1
+
+    def push_front(self, job):
+        self.shards[self.shard_of(job)].push_front(job)
+        self._size += 1
+
+    def head_priority(self):
+        priorities = [shard.head_priority() for shard in self.shards if shard]
+        return max(priorities) if priorities else None
+
+    def pop(self):
+        """Siguiente job del shard con la prioridad más alta (en empate, por turno)."""
+        if not self._size:
+            raise IndexError("pop from empty ShardedJobQueue")
+        count = len(self.shards)
+        best, best_priority = None, None
+        for offset in range(count):
+            index = (self._turn + offset) % count
+            priority = self.shards[index].head_priority()
+            if priority is not None and (best is None or priority > best_priority):
+                best, best_priority = index, priority
+        self._turn = (best + 1) % count
+        self._size -= 1
+        return self.shards[best].pop()
+
+    def depth_by_priority(self):
+        depth = {}
+        for shard in self.shards:
+            for priority, count in shard.depth_by_priority().items():
+                depth[priority] = depth.get(priority, 0) + count
+        return depth
+
+    def depth_by_shard(self):
+        return [len(shard) for shard in self.shards]
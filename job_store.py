@@ -0,0 +1,217 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import date
+
+# ==========================================
+# ALMACÉN PERSISTENTE DE JOBS (SQLITE EN MODO WAL)
+# ==========================================
+# Cada cambio de estado de un Job se encola en memoria (O(1), no bloquea el
+# dispatch) y un hilo escritor lo vuelca a SQLite en lotes: una transacción y un
+# fsync por lote (group commit) en vez de uno por cambio. Si el mismo job cambia
+# varias veces dentro de un lote solo se escribe su último estado.
+# Al arrancar, load() devuelve lo necesario para reconstruir colas, hashes activos
+# y el gasto del día.
+
+JOB_DB_FILE = "jobs.db"
+FLUSH_INTERVAL_S = 0.05     # Latencia máxima de un cambio hasta llegar a disco
+BATCH_MAX = 5000            # Cambios máximos por transacción
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    prompt_hash TEXT NOT NULL,
+    priority INTEGER NOT NULL,
+    tenant TEXT NOT NULL,
+    template TEXT NOT NULL,
+    status TEXT NOT NULL,
+    retries INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    finished_at REAL,
+    cost REAL NOT NULL,
+    prompt_id TEXT,
+    result TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_UPSERT = """
+INSERT INTO jobs (id, prompt, prompt_hash, priority, tenant, template, status, retries,
+                  created_at, finished_at, cost, prompt_id, result, updated_at)
+VALUES (:id, :prompt, :prompt_hash, :priority, :tenant, :template, :status, :retries,
+        :created_at, :finished_at, :cost, :prompt_id, :result, :updated_at)
+ON CONFLICT(id) DO UPDATE SET
+    status = excluded.status, retries = excluded.retries, finished_at = excluded.finished_at,
+    cost = excluded.cost, prompt_id = excluded.prompt_id, result = excluded.result,
+    priority = excluded.priority, updated_at = excluded.updated_at
+"""
+
+# Estados que hay que volver a encolar tras un reinicio
+RECOVERABLE = ("PENDING", "RETRY_WAIT", "PROCESSING", "FETCHING")
+
+
+def job_record(job):
+    """Foto del job en el momento del cambio (el objeto sigue mutando después)."""
+    return {
+        "id": job.id, "prompt": job.prompt, "prompt_hash": job.prompt_hash,
+        "priority": job.priority, "tenant": job.tenant, "template": job.template,
+        "status": job.status, "retries": job.retries, "created_at": job.created_at,
+        "finished_at": job.finished_at, "cost": job.cost, "prompt_id": job.prompt_id,
+        "result": json.dumps(job.result) if job.result is not None else None,
+        "updated_at": time.time(),
+    }
+
+
+class JobStore:
+    def __init__(self, path=JOB_DB_FILE, flush_interval=FLUSH_INTERVAL_S, batch_max=BATCH_MAX):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_max = batch_max
+        self.writes = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._closed = False
+        conn = self._connect()
+        conn.executescript(_SCHEMA)
+        conn.close()
+        self._writer = threading.Thread(target=self._writer_loop, name="job-store-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=FULL")   # fsync en cada commit... pero hay un commit por lote
+        return conn
+
+    # --- ESCRITURA (desde el event loop: solo encola) ---
+    def record(self, job):
+        self._queue.put(("job", job_record(job)))
+
+    def record_many(self, jobs):
+        """Un solo cambio de estado para todo un lote (ingesta masiva)."""
+        self._queue.put(("jobs", [job_record(job) for job in jobs]))
+
+    def record_spend(self, total_spent_today, day=None):
+        self.record_meta("spend", {"day": (day or date.today()).isoformat(), "total": total_spent_today})
+
+    def record_meta(self, key, value):
+        """Guarda un valor JSON suelto (gasto del día, reserva de Pods parados...)."""
+        self._queue.put(("meta", (key, json.dumps(value))))
+
+    def flush(self, timeout=None):
+        """Bloquea hasta que todo lo encolado esté en disco."""
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        return done.wait(timeout)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(("stop", None))
+        self._writer.join()
+
+    # --- HILO ESCRITOR ---
+    def _writer_loop(self):
+        conn = self._connect()
+        running = True
+        while running:
+            items = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(items) < self.batch_max:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or items[-1][0] in ("flush", "stop"):
+                    break
+                try:
+                    items.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            jobs, meta, waiters = {}, {}, []
+            for kind, payload in items:
+                if kind == "job":
+                    jobs[payload["id"]] = payload
+                elif kind == "jobs":
+                    for record in payload:
+                        jobs[record["id"]] = record
+                elif kind == "meta":
+                    meta[payload[0]] = payload[1]
+                elif kind == "flush":
+                    waiters.append(payload)
+                elif kind == "stop":
+                    running = False
+            try:
+                if jobs or meta:
+                    with conn:
+                        conn.executemany(_UPSERT, jobs.values())
+                        conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", meta.items())
+                    self.writes += len(jobs)
+                    self.batches += 1
+            except sqlite3.Error as e:
+                print(f"❌ Error escribiendo en {self.path}: {e}")
+            for waiter in waiters:
+                waiter.set()
+        conn.close()
+
+    # --- RECUPERACIÓN ---
+    def load_meta(self, key, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else default
+
+    def load(self):
+        """Devuelve (jobs_recuperables, jobs_dlq, gasto_de_hoy) a partir del contenido en disco."""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            recoverable = [dict(row) for row in conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({','.join('?' * len(RECOVERABLE))}) ORDER BY created_at",
+                RECOVERABLE)]
+            dead = [dict(row) for row in conn.execute("SELECT * FROM jobs WHERE status = 'DEAD' ORDER BY created_at")]
+            row = conn.execute("SELECT value FROM meta WHERE key = 'spend'").fetchone()
+        finally:
+            conn.close()
+        spent = 0.0
+        if row:
+            spend = json.loads(row["value"])
+            if spend["day"] == date.today().isoformat():
+                spent = spend["total"]
+        return recoverable, dead, spent
+
+
+# ==========================================
+# ZONA DE TEST (throughput de escritura)
+# ==========================================
+if __name__ == "__main__":
+    import tempfile
+    from types import SimpleNamespace
+
+    N = 50_000
+    with tempfile.TemporaryDirectory() as tmp:
+        store = JobStore(os.path.join(tmp, "bench.db"))
+        job = SimpleNamespace(prompt="Un astronauta en marte", prompt_hash="x", priority=5, tenant="default",
+                              template="imagen", retries=0, created_at=time.time(), finished_at=None,
+                              cost=0.0, prompt_id=None, result=None)
+        start = time.perf_counter()
+        for i in range(N):
+            job.id = f"job-{i % 10_000}"
+            job.status = ("PENDING", "PROCESSING", "COMPLETED")[i % 3]
+            store.record(job)
+        enqueue = time.perf_counter() - start
+        store.flush()
+        total = time.perf_counter() - start
+        store.close()
+        print(f"📊 {N} cambios de estado: encolar {enqueue / N * 1e6:.1f} µs/cambio, "
+              f"{N / total:,.0f} cambios/s hasta disco ({store.batches} lotes, {store.writes} filas escritas)")
@@ -1,8 +1,9 @@
-import runpod
 import os
 import time
 from dotenv import load_dotenv
 
+from runpod_client import RunPodClient, RunPodAPIError, RUNPOD_GRAPHQL_URL, pod_address, gpu_price
+
 
 # --- 3. CATÁLOGO DE IMÁGENES (Configuración) ---
 # Definimos las imágenes aquí para no tener "números mágicos" por el código.
@@ -14,6 +15,12 @@ IMAGENES_DOCKER = {
     "DEV_BASE":        "runpod/pytorch:2.0.1-py3.10-cuda11.8.0-devel"
 }
 
+# GPU que pedimos para cada tipo de trabajo (también la usa el medidor de costes)
+GPU_POR_TIPO = {
+    "imagen": "NVIDIA GeForce RTX 4090",
+    "video":  "NVIDIA A100 80GB PCIe",  # Vídeo pide más VRAM
+}
+
 # Variable de configuración actual (Esto permite el ROLLBACK rápido)
 # Si la versión nueva falla, solo cambiamos esta línea a "DEV_BASE" y redeplegamos.
 IMAGEN_ACTUAL_PRODUCCION = IMAGENES_DOCKER["IMAGEN_ESTANDAR"]
@@ -27,38 +34,49 @@ api_key = os.getenv("RUNPOD_API_KEY")
 if not api_key:
     raise ValueError("❌ ERROR: No se encontró RUNPOD_API_KEY en el archivo .env")
 
-runpod.api_key = api_key
+# Cliente GraphQL propio (runpod_client.py): timeouts, reintentos, rate limit, caché del
+# catálogo de GPUs, consultas de estado agrupadas y stream de eventos de los Pods.
+# RUNPOD_API_URL permite apuntarlo a un servidor falso (fake_runpod.FakeRunPodAPI).
+client = RunPodClient(api_key, url=os.getenv("RUNPOD_API_URL", RUNPOD_GRAPHQL_URL))
 
 # --- FUNCIONES DE ORQUESTACIÓN ---
 
 def test_connection():
     """Verifica que la API Key funciona y tenemos saldo/acceso."""
     try:
-        user = runpod.get_user()
-        print(f"✅ Conexión ÉXITO. Saldo: ${user.get('credit', 0)}")
+        user = client.user()
+        print(f"✅ Conexión ÉXITO. Saldo: ${user.get('clientBalance', 0)}")
         
-        # Listar GPUs
-        gpus = runpod.get_gpus()
-        if gpus:
-            # Cogemos la primera para ver qué tiene dentro
-            gpu_ejemplo = gpus[0]
-            
+        # Solo la GPU que usamos (no todo el catálogo); queda en caché para get_gpu_prices
+        gpu_ejemplo = client.gpu(gpu_type_for("imagen"))
+        if gpu_ejemplo:
             # INTENTO DE RECUPERAR PRECIO DE FORMA SEGURA
             # RunPod a veces cambia 'communityPrice' por 'communitySpotPrice' o similar.
             # Esto busca el precio, y si no está, pone "N/A" en vez de fallar.
-            precio = gpu_ejemplo.get('communityPrice', gpu_ejemplo.get('minSpotPrice', 'N/A'))
-            nombre = gpu_ejemplo.get('id', 'GPU Desconocida')
+            precio = gpu_price(gpu_ejemplo) or 'N/A'
+            nombre = gpu_ejemplo.get('displayName') or gpu_ejemplo.get('id', 'GPU Desconocida')
             
             print(f"👀 GPU Detectada: {nombre} - Precio aprox: ${precio}/hr")
         else:
-            print("⚠️ Conexión buena, pero no se devolvió lista de GPUs (¿Filtros activados?)")
+            print("⚠️ Conexión buena, pero RunPod no conoce la GPU configurada (revisa GPU_POR_TIPO)")
             
         return True
-    except Exception as e:
+    except RunPodAPIError as e:
         # Imprimimos el error completo para debug
         print(f"❌ Error de conexión (Detalle): {e}")
         return False
 
+def gpu_type_for(tipo_trabajo="imagen"):
+    """Tipo de GPU (id de RunPod) con el que se crean los Pods de ese tipo de trabajo."""
+    return GPU_POR_TIPO.get(tipo_trabajo, GPU_POR_TIPO["imagen"])
+
+def get_gpu_prices():
+    """
+    $/h (Community) de las GPUs que usamos: una sola llamada GraphQL para todas, y el
+    cliente la cachea CATALOG_TTL_S (el medidor de costes además cachea el resultado).
+    """
+    return client.gpu_prices(sorted(set(GPU_POR_TIPO.values())))
+
 def create_worker_pod(tipo_trabajo="imagen"):
     """
     Crea un Pod usando la imagen definida en el catálogo.
@@ -66,55 +84,70 @@ def create_worker_pod(tipo_trabajo="imagen"):
     # Selección inteligente de imagen
     if tipo_trabajo == "video":
         imagen_a_usar = IMAGENES_DOCKER["VIDEO_HIGH_MEM"]
-        gpu_id = "NVIDIA A100 80GB PCIe" # Vídeo pide más VRAM
     else:
         imagen_a_usar = IMAGENES_DOCKER["IMAGEN_ESTANDAR"] # Usamos la versión "Pinned"
-        gpu_id = "NVIDIA GeForce RTX 4090"
+    gpu_id = gpu_type_for(tipo_trabajo)
 
     print(f"🚀 Desplegando Worker para [{tipo_trabajo}] usando imagen: {imagen_a_usar}...")
     
     try:
-        pod = runpod.create_pod(
+        pod = client.create_pod(
             name=f"Worker-{tipo_trabajo.capitalize()}",
-            image_name=imagen_a_usar,  # <--- AQUÍ USAMOS EL CATÁLOGO
-            gpu_type_id=gpu_id, 
-            cloud_type="COMMUNITY", 
-            gpu_count=1,
-            volume_in_gb=40,
+            imageName=imagen_a_usar,  # <--- AQUÍ USAMOS EL CATÁLOGO
+            gpuTypeId=gpu_id, 
+            cloudType="COMMUNITY", 
+            gpuCount=1,
+            volumeInGb=40,
             ports="8188/http",
         )
         print(f"✅ Pod creado con ID: {pod['id']}")
         return pod['id']
-    except Exception as e:
+    except RunPodAPIError as e:
         print(f"❌ Error al crear Pod: {e}")
         return None
 
 def stop_worker_pod(pod_id):
     """Detiene un pod para no consumir GPU (aunque cobra disco)."""
     try:
-        runpod.stop_pod(pod_id)
+        client.stop_pod(pod_id)
         print(f"🛑 Pod {pod_id} detenido correctamente.")
-    except Exception as e:
+    except RunPodAPIError as e:
         print(f"⚠️ No se pudo detener el pod: {e}")
 
+def resume_worker_pod(pod_id):
+    """Reanuda un Pod parado (reserva caliente). Devuelve True si RunPod lo acepta."""
+    try:
+        client.resume_pod(pod_id, gpu_count=1)
+        print(f"♨️ Pod {pod_id} reanudado.")
+        return True
+    except RunPodAPIError as e:
+        # Típico: la máquina donde estaba el Pod ya no tiene GPU libre
+        print(f"⚠️ No se pudo reanudar el pod: {e}")
+        return False
+
+def terminate_worker_pod(pod_id):
+    """Elimina el Pod por completo (deja de cobrar también el disco)."""
+    try:
+        client.terminate_pod(pod_id)
+        print(f"🗑️ Pod {pod_id} eliminado.")
+    except RunPodAPIError as e:
+        print(f"⚠️ No se pudo eliminar el pod: {e}")
+
 # --- EJECUCIÓN DEL SCRIPT ---
 def get_pod_addr(pod_id):
     """Busca la IP pública y el puerto mapeado del 8188"""
     try:
-        pod = runpod.get_pod(pod_id)
-        # Si el pod no está corriendo, no tiene IP
-        if pod['desiredStatus'] != 'RUNNING':
-            return None
-            
-        # Buscamos el puerto interno 8188 y vemos su mapeo externo
-        if 'runtime' in pod and 'ports' in pod['runtime']:
-            for port in pod['runtime']['ports']:
-                if port['privatePort'] == 8188:
-                    return f"{port['ip']}:{port['publicPort']}"
-        return None
-    except Exception as e:
+        # Las consultas simultáneas de varios Pods salen en una sola llamada agrupada
+        # (si el pod no está corriendo, no tiene IP)
+        return pod_address(client.pod(pod_id))
+    except RunPodAPIError as e:
         print(f"Error obteniendo IP: {e}")
         return None
+
+def subscribe_pod_events(callback, loop=None):
+    """Suscripción al ciclo de vida de los Pods (CREATED/BOOTING/READY/STOPPED/TERMINATED).
+    La usa WorkerPool para no preguntar por cada Pod que arranca. Devuelve la baja."""
+    return client.events.subscribe(callback, loop=loop)
 if __name__ == "__main__":
     print("--- INICIANDO SISTEMA DE ORQUESTACIÓN ---")
     
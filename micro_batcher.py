@@ -0,0 +1,130 @@
+import time
+
+# ==========================================
+# MICRO-BATCHING DE JOBS COMPATIBLES
+# ==========================================
+# Cada Job era su propio prompt de ComfyUI: validación del grafo, comprobación de
+# modelos, ida y vuelta HTTP y evento de fin por cada imagen. El batcher agrupa jobs
+# pendientes que comparten plantilla, modelo y resolución y los envía como UN solo
+# prompt (WorkflowTemplate.render_batch); al terminar, las salidas se reparten por job.
+#
+# Un grupo sale hacia un Pod cuando se llena (max_size) o cuando su job más antiguo
+# lleva window_s esperando compañeros. El "tradeoff" resume ambos en un solo mando:
+#   0.0 -> sin batching (cada job sale solo y al momento: mínima latencia)
+#   1.0 -> lotes de BATCH_MAX_SIZE esperando hasta BATCH_MAX_WINDOW_S (mínimo overhead/coste)
+#
+# Los grupos también sirven para la afinidad de modelo: el despachador puede adelantar
+# un grupo cuyo checkpoint ya está cargado en el Pod libre, pero un grupo adelantado
+# AFFINITY_MAX_SKIPS veces sale sí o sí en el siguiente turno (reparto justo).
+
+BATCH_MAX_SIZE = 8           # Jobs máximos por prompt de ComfyUI
+BATCH_MAX_WINDOW_S = 0.5     # Espera máxima de un job para llenar su lote
+BATCH_TRADEOFF = 0.5         # 0 = latencia, 1 = coste
+STAGED_MIN = 16              # Jobs retenidos como mínimo (margen para reordenar por modelo)
+AFFINITY_MAX_SKIPS = 3       # Veces que un grupo puede ser adelantado por afinidad de modelo
+
+
+class _Group:
+    __slots__ = ("started", "jobs", "model", "skips")
+
+    def __init__(self, started, model):
+        self.started = started    # Llegada del job más antiguo del grupo
+        self.jobs = []
+        self.model = model        # Checkpoint que necesita el grupo
+        self.skips = 0
+
+
+class MicroBatcher:
+    def __init__(self, max_size=None, window_s=None, tradeoff=BATCH_TRADEOFF, clock=time.monotonic):
+        self.max_size = max_size or 1 + round(tradeoff * (BATCH_MAX_SIZE - 1))
+        self.window_s = tradeoff * BATCH_MAX_WINDOW_S if window_s is None else window_s
+        self.clock = clock
+        # Tope de jobs retenidos (acota el adelantamiento entre prioridades)
+        self.max_staged = max(self.max_size * 4, STAGED_MIN)
+        self.groups = {}         # clave de compatibilidad -> _Group (por orden de llegada)
+        self._size = 0
+        self.batches_sent = 0
+        self.jobs_sent = 0
+        self.affinity_reorders = 0
+
+    def __len__(self):
+        return self._size
+
+    def __bool__(self):
+        return self._size > 0
+
+    def __iter__(self):
+        for group in self.groups.values():
+            yield from group.jobs
+
+    @property
+    def enabled(self):
+        return self.max_size > 1
+
+    @property
+    def average_size(self):
+        return self.jobs_sent / self.batches_sent if self.batches_sent else 0.0
+
+    def add(self, job, key, model=None):
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = _Group(self.clock(), model)
+        group.jobs.append(job)
+        self._size += 1
+
+    def ready_keys(self):
+        """Claves de los grupos listos (llenos o con la ventana vencida), por orden de llegada."""
+        now = self.clock()
+        return [
+            key for key, group in self.groups.items()
+            if len(group.jobs) >= self.max_size or now - group.started >= self.window_s
+        ]
+
+    def pick(self, ready_keys, loaded_model):
+        """
+        Grupo a enviar a un Pod que tiene loaded_model en VRAM: el más antiguo, salvo que
+        haya otro listo con ese mismo modelo y el antiguo aún no haya agotado sus adelantamientos.
+        """
+        oldest = ready_keys[0]
+        if loaded_model is None or self.groups[oldest].model == loaded_model:
+            return oldest
+        if self.groups[oldest].skips >= AFFINITY_MAX_SKIPS:
+            return oldest
+        for key in ready_keys[1:]:
+            if self.groups[key].model == loaded_model:
+                self.groups[oldest].skips += 1
+                self.affinity_reorders += 1
+                return key
+        return oldest
+
+    def model_of(self, key):
+        return self.groups[key].model
+
+    def head(self, key):
+        """Job más antiguo del grupo."""
+        return self.groups[key].jobs[0]
+
+    def next_ready_in(self):
+        """Segundos hasta que venza la ventana del próximo grupo aún no listo (None si no hay)."""
+        now = self.clock()
+        waits = [self.window_s - (now - group.started) for group in self.groups.values()
+                 if len(group.jobs) < self.max_size and now - group.started < self.window_s]
+        return min(waits) if waits else None
+
+    def take(self, key, max_jobs=None, prefer=None):
+        """
+        Saca hasta max_size jobs (o max_jobs) del grupo como un lote. prefer(job) -> bool:
+        esos jobs van primero (shards del Pod elegido); el resto sigue por orden de llegada.
+        """
+        group = self.groups[key]
+        size = min(self.max_size, max_jobs or self.max_size)
+        if prefer is not None and len(group.jobs) > size:
+            group.jobs.sort(key=lambda job: not prefer(job))    # Estable: conserva el orden de llegada
+        batch = group.jobs[:size]
+        del group.jobs[:size]
+        if not group.jobs:
+            del self.groups[key]    # Los que sobran conservan su antigüedad y sus adelantamientos
+        self._size -= len(batch)
+        self.batches_sent += 1
+        self.jobs_sent += len(batch)
+        return batch
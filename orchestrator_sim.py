@@ -0,0 +1,413 @@
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import itertools
+import json
+import logging
+import math
+import os
+import random
+import selectors
+import time
+
+import numpy as np
+
+from comfy_client import JobError, ConnectionStats
+from fake_comfyui import FakeComfyUI
+from fake_runpod import SimulatedRunPod, SIM_GPU, SIM_GPU_PRICES
+from queue_system import (QueueOrchestrator, MAX_CONCURRENT_JOBS, AUTO_SCALE_THRESHOLD, BACKOFF_FACTOR,
+                          MAX_PODS, MAX_JOBS_POR_POD)
+from micro_batcher import BATCH_TRADEOFF
+from worker_pool import WARM_POOL_SIZE, POD_BOOT_INICIAL_S, POD_RESUME_INICIAL_S
+from warm_pool_sim import load_trace
+
+# ==========================================
+# SIMULADOR DE EVENTOS DISCRETOS DEL ORQUESTADOR (PLANIFICACIÓN DE CAPACIDAD)
+# ==========================================
+# Para ajustar MAX_CONCURRENT_JOBS, AUTO_SCALE_THRESHOLD, BACKOFF_FACTOR o el número de
+# Pods sin gastar dinero (test_infra.py crea un Pod de verdad). Se ejecuta el
+# QueueOrchestrator REAL (cola, batcher, reintentos, auto-scaling, costes, DispatchEngine)
+# contra:
+#  - fake_runpod.SimulatedRunPod: arranque/reanudación configurables y precio por hora,
+#  - SimComfyUI: el FakeComfyUI sin HTTP, con tiempos de render log-normales y fallos.
+# Todo corre en un event loop con RELOJ VIRTUAL: cuando no queda nada listo, el reloj
+# salta al siguiente temporizador en vez de dormir, y las llamadas "a hilo" (RunPod) se
+# ejecutan en línea. Un día de tráfico se simula en segundos y, con la misma semilla,
+# el resultado es siempre el mismo.
+
+DURACION_S = 24 * 3600        # Un día de tráfico
+JOBS_POR_HORA = 300           # Media de llegadas
+AMPLITUD_DIARIA = 0.8         # Variación día/noche de la tasa (0 = constante)
+HORA_PICO = 15                # Hora del día con más llegadas
+RENDER_TIME_S = 8.0           # Mediana del tiempo de GPU por imagen
+RENDER_SIGMA = 0.25           # Dispersión (log-normal) del tiempo de render
+FAILURE_RATE = 0.02           # Probabilidad de que un prompt falle en ComfyUI
+SIM_TICK_S = None             # Espera máxima del DispatchEngine (None = solo eventos y plazos, como el real)
+IDLE_CHECK_S = 5.0            # Cada cuánto se mira si ya terminó todo tras la última llegada
+HISTORY_KEEP = 64             # Entradas de /history que conserva cada Pod simulado
+
+
+# ------------------------------------------
+# EVENT LOOP CON RELOJ VIRTUAL
+# ------------------------------------------
+class _VirtualSelector:
+    """Selector que nunca espera: si no hay E/S lista, adelanta el reloj lo que se iba a dormir."""
+
+    def __init__(self):
+        self.real = selectors.DefaultSelector()   # Solo para el self-pipe del loop
+        self.loop = None
+
+    def __getattr__(self, name):
+        return getattr(self.real, name)
+
+    def select(self, timeout=None):
+        events = self.real.select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            raise RuntimeError("Simulación bloqueada: ninguna tarea tiene nada programado")
+        self.loop.now += timeout
+        return []
+
+
+class _InlineExecutor(concurrent.futures.ThreadPoolExecutor):
+    """asyncio.to_thread sin hilos: la llamada (backend RunPod simulado) se ejecuta en el acto."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        future = concurrent.futures.Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self, start=0.0):
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.now = start
+        self.set_default_executor(_InlineExecutor(max_workers=1))
+
+    def time(self):
+        return self.now
+
+
+# ------------------------------------------
+# COMFYUI SIMULADO (SIN HTTP)
+# ------------------------------------------
+class SimComfyUI(FakeComfyUI):
+    """
+    El FakeComfyUI de siempre (GPU en serie, carga de modelos, fallos, /history) pero
+    llamado en memoria: hace a la vez de cliente (PodClients.get) y de tracker
+    (CompletionHub.for_pod) para el orquestador.
+    """
+
+    def __init__(self, address, render_sigma=RENDER_SIGMA, **options):
+        super().__init__(websocket=False, **options)
+        self.url = f"http://{address}"
+        self.base_url = self.url
+        self.client_id = "sim"
+        self.render_sigma = render_sigma
+        self.waiters = {}          # prompt_id -> Future
+        self.results = {}          # Terminados antes de que alguien espere
+
+    def start_worker(self):
+        if self.worker is None:
+            self.queue = asyncio.Queue()
+            self.worker = asyncio.create_task(self._gpu_worker())
+
+    def render_seconds(self, images):
+        per_image = self.random.lognormvariate(math.log(self.render_time), self.render_sigma)
+        return self.overhead + per_image * max(images, 1)
+
+    async def _emit(self, client_id, event, data):
+        prompt_id = data.get("prompt_id")
+        if event == "execution_error":
+            self._finish(prompt_id, JobError("Ejecución fallida en ComfyUI: error"))
+        elif event == "executing" and data.get("node") is None:
+            self._finish(prompt_id, self.history[prompt_id])
+        while len(self.history) > HISTORY_KEEP:
+            self.history.pop(next(iter(self.history)))
+
+    def _finish(self, prompt_id, result):
+        future = self.waiters.pop(prompt_id, None)
+        if future is None:
+            self.results[prompt_id] = result
+        elif isinstance(result, Exception):
+            future.set_exception(result)
+        else:
+            future.set_result(result)
+
+    # --- Interfaz de ComfyClient ---
+    async def queue_prompt_raw(self, body):
+        payload = json.loads(body)
+        workflow = payload.get("prompt")
+        if not isinstance(workflow, dict) or not workflow:
+            raise JobError("HTTP 400: invalid prompt")
+        self.start_worker()
+        number = self.prompts_received
+        self.prompts_received += 1
+        prompt_id = f"{self.address}-{number}"
+        await self.queue.put((prompt_id, number, workflow, payload.get("client_id")))
+        return {"prompt_id": prompt_id, "number": number, "node_errors": {}}
+
+    async def get_checkpoints(self):
+        return list(self.models)
+
+    async def get_recent_history(self, max_items):
+        return dict(list(self.history.items())[-max_items:])
+
+    async def is_ready(self, timeout=None):
+        return True
+
+    async def get_system_stats(self):
+        return self.system_stats()
+
+    async def get_queue(self):
+        return self.queue.qsize() if self.queue else 0
+
+    # --- Interfaz de PodCompletionTracker ---
+    async def wait(self, prompt_id, timeout=None):
+        if prompt_id in self.results:
+            result = self.results.pop(prompt_id)
+        else:
+            future = self.waiters[prompt_id] = asyncio.get_running_loop().create_future()
+            result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+class SimPodClients:
+    """Sustituto de comfy_client.PodClients: un SimComfyUI por dirección de Pod."""
+
+    def __init__(self, make_server):
+        self.make_server = make_server
+        self.servers = {}
+        self.stats = ConnectionStats()
+        self.session = self            # CompletionHub recibe la "sesión": aquí, este mismo objeto
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        for server in self.servers.values():
+            await server.stop()
+
+    def get(self, address):
+        server = self.servers.get(address)
+        if server is None:
+            server = self.servers[address] = self.make_server(address)
+        return server
+
+
+class SimCompletionHub:
+    """Sustituto de completion_tracker.CompletionHub (los eventos llegan en memoria)."""
+
+    def __init__(self, clients, clock=None):
+        self.clients = clients
+
+    def for_pod(self, pod_id, address):
+        return self.clients.get(address)
+
+    async def retain(self, pod_ids):
+        pass
+
+    async def close(self):
+        pass
+
+
+# ------------------------------------------
+# TRÁFICO
+# ------------------------------------------
+def diurnal_arrivals(duration_s=DURACION_S, jobs_per_hour=JOBS_POR_HORA, amplitude=AMPLITUD_DIARIA,
+                     peak_hour=HORA_PICO, seed=1):
+    """Llegadas Poisson con tasa sinusoidal día/noche (thinning). Deterministas con la semilla."""
+    rng = random.Random(seed)
+    base = jobs_per_hour / 3600
+    peak = base * (1 + amplitude)
+    arrivals, t = [], 0.0
+    while True:
+        t += rng.expovariate(peak)
+        if t >= duration_s:
+            return arrivals
+        hour = (t / 3600) % 24
+        rate = base * (1 + amplitude * math.cos(2 * math.pi * (hour - peak_hour) / 24))
+        if rng.random() < rate / peak:
+            arrivals.append(t)
+
+
+# ------------------------------------------
+# UNA CONFIGURACIÓN
+# ------------------------------------------
+async def _run(arrivals, config, seed, tick):
+    loop = asyncio.get_running_loop()
+    clock = loop.time
+    backend = SimulatedRunPod([f"sim-pod-{i}" for i in range(config["max_pods"])],
+                              boot_time=config["boot_time"], resume_time=config["resume_time"],
+                              gpu_prices={SIM_GPU: config["price"]}, clock=clock)
+    orch = QueueOrchestrator(backend=backend, max_concurrent_jobs=config["max_concurrent_jobs"],
+                             max_pods=config["max_pods"], max_jobs_por_pod=config["max_jobs_por_pod"],
+                             batch_tradeoff=config["batch_tradeoff"], scale_threshold=config["scale_threshold"],
+                             backoff_factor=config["backoff_factor"], budget=config["budget"], clock=clock)
+    orch.pool.warm_size = config["warm_size"]
+    orch.retry_scheduler.random = random.Random(seed)
+    ckpt = orch.templates.get(orch.templates.names()[0]).defaults.get("ckpt_name")
+    seeds = itertools.count(seed)
+    clients = SimPodClients(lambda address: SimComfyUI(
+        address, render_time=config["render_time"], render_sigma=config["render_sigma"],
+        failure_rate=config["failure_rate"], overhead=config["overhead"], models=[ckpt],
+        seed=next(seeds), clock=clock))
+
+    rejected = 0
+    engine = asyncio.create_task(orch.process_queue_async(tick=tick, clients=clients, hub_factory=SimCompletionHub))
+    for index, at in enumerate(arrivals):
+        if at > clock():
+            await asyncio.sleep(at - clock())
+        if orch.submit(f"Simulación de carga, job #{index}") is None:
+            rejected += 1
+    while orch.pending_queue or orch.batcher or orch.active_jobs or orch.retry_scheduler:
+        await asyncio.sleep(IDLE_CHECK_S)
+    engine.cancel()
+    await asyncio.gather(engine, return_exceptions=True)
+    orch.pool.stop_all()
+
+    completed = [job for job in orch.completed_jobs if job.status == "COMPLETED"]
+    latencies = [job.finished_at - job.created_at for job in completed]
+    waits = [job.dispatched_at - job.created_at for job in completed if job.dispatched_at is not None]
+    span_h = max(clock(), 1e-9) / 3600
+    meter = orch.meter
+    images = sum(len(job.result or []) for job in completed)
+    return {
+        "submitted": len(arrivals),
+        "rejected": rejected,
+        "completed": len(completed),
+        "dead": len(orch.dead_letter_queue),
+        "retries": sum(job.retries for job in completed) + sum(job.retries for job in orch.dead_letter_queue),
+        "images_per_hour": round(images / span_h, 1),
+        "latency_p50_s": round(float(np.percentile(latencies, 50)), 1) if latencies else None,
+        "latency_p95_s": round(float(np.percentile(latencies, 95)), 1) if latencies else None,
+        "latency_p99_s": round(float(np.percentile(latencies, 99)), 1) if latencies else None,
+        "latency_max_s": round(max(latencies), 1) if latencies else None,
+        "queue_p95_s": round(float(np.percentile(waits, 95)), 1) if waits else None,
+        "cost_usd": round(orch.total_spent_today, 4),
+        "usd_per_1000_images": round(orch.total_spent_today / images * 1000, 4) if images else None,
+        "gpu_utilization": round(meter.closed_busy_s / meter.closed_uptime_s, 4) if meter.closed_uptime_s else 0.0,
+        "pods_created": backend.created,
+        "pods_resumed": backend.resumed,
+        "simulated_h": round(span_h, 2),
+    }
+
+
+def simulate(arrivals, seed=1, tick=SIM_TICK_S, **config):
+    """Ejecuta el orquestador real sobre la traza con reloj virtual. Devuelve métricas."""
+    settings = dict(DEFAULTS, **config)
+    loop = VirtualTimeLoop()
+    started = time.perf_counter()
+    previous_disable = logging.root.manager.disable
+    logging.disable(logging.CRITICAL)      # Miles de JOB_COMPLETED no deben ir a production.log
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            result = loop.run_until_complete(_run(arrivals, settings, seed, tick))
+    finally:
+        logging.disable(previous_disable)
+        pending = asyncio.all_tasks(loop)
+        for task in pending:
+            task.cancel()
+        if pending:
+            loop.run_until_complete(asyncio.wait(pending))
+        loop.close()
+    result["wall_s"] = round(time.perf_counter() - started, 2)
+    return result
+
+
+DEFAULTS = {
+    "max_concurrent_jobs": MAX_CONCURRENT_JOBS,
+    "scale_threshold": AUTO_SCALE_THRESHOLD,
+    "backoff_factor": BACKOFF_FACTOR,
+    "max_pods": MAX_PODS,
+    "max_jobs_por_pod": MAX_JOBS_POR_POD,
+    "warm_size": WARM_POOL_SIZE,
+    "batch_tradeoff": BATCH_TRADEOFF,
+    "budget": math.inf,
+    "boot_time": POD_BOOT_INICIAL_S,
+    "resume_time": POD_RESUME_INICIAL_S,
+    "price": SIM_GPU_PRICES[SIM_GPU],
+    "render_time": RENDER_TIME_S,
+    "render_sigma": RENDER_SIGMA,
+    "overhead": 0.0,
+    "failure_rate": FAILURE_RATE,
+}
+
+# Parámetros que admiten varios valores separados por comas (rejilla de configuraciones)
+GRID = {
+    "max_concurrent_jobs": int,
+    "scale_threshold": int,
+    "backoff_factor": float,
+    "max_pods": int,
+    "max_jobs_por_pod": int,
+    "warm_size": int,
+}
+
+
+def print_table(rows):
+    keys = [key for key in GRID if len({row["config"][key] for row in rows}) > 1] or ["max_pods"]
+    header = "".join(f"{key:>22}" for key in keys)
+    print(f"{header}{'jobs':>7}{'DLQ':>5}{'img/h':>8}{'p50 (s)':>9}{'p95 (s)':>9}{'p99 (s)':>9}"
+          f"{'coste $':>9}{'$/1k img':>9}{'util GPU':>9}{'Pods':>6}{'real (s)':>9}")
+    for row in rows:
+        r, config = row["result"], row["config"]
+        cells = "".join(f"{config[key]:>22}" for key in keys)
+        print(f"{cells}{r['completed']:>7}{r['dead']:>5}{r['images_per_hour']:>8}{r['latency_p50_s']!s:>9}"
+              f"{r['latency_p95_s']!s:>9}{r['latency_p99_s']!s:>9}{r['cost_usd']:>9}{r['usd_per_1000_images']!s:>9}"
+              f"{r['gpu_utilization']:>9.0%}{r['pods_created'] + r['pods_resumed']:>6}{r['wall_s']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulación determinista del orquestador (capacidad y coste)")
+    parser.add_argument("--trace", help="Fichero de llegadas (segundos por línea o JSONL {\"t\": ...})")
+    parser.add_argument("--hours", type=float, default=DURACION_S / 3600, help="Duración del tráfico sintético")
+    parser.add_argument("--jobs-per-hour", type=float, default=JOBS_POR_HORA)
+    parser.add_argument("--amplitude", type=float, default=AMPLITUD_DIARIA, help="Variación día/noche (0-1)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tick", type=float, default=SIM_TICK_S, help="Espera máxima del motor de despacho (s virtuales; por defecto solo eventos)")
+    for key, kind in GRID.items():
+        parser.add_argument("--" + key.replace("_", "-"), default=str(DEFAULTS[key]),
+                            help="Uno o varios valores separados por comas")
+    parser.add_argument("--batch-tradeoff", type=float, default=BATCH_TRADEOFF)
+    parser.add_argument("--budget", type=float, default=math.inf, help="Presupuesto ($) del periodo simulado")
+    parser.add_argument("--boot-time", type=float, default=POD_BOOT_INICIAL_S)
+    parser.add_argument("--resume-time", type=float, default=POD_RESUME_INICIAL_S)
+    parser.add_argument("--price", type=float, default=SIM_GPU_PRICES[SIM_GPU], help="$/h de la GPU")
+    parser.add_argument("--render-time", type=float, default=RENDER_TIME_S, help="Mediana de s de GPU por imagen")
+    parser.add_argument("--render-sigma", type=float, default=RENDER_SIGMA)
+    parser.add_argument("--overhead", type=float, default=0.0, help="s fijos por prompt")
+    parser.add_argument("--failure-rate", type=float, default=FAILURE_RATE)
+    parser.add_argument("--json", dest="json_path", help="Exporta configuraciones y resultados a JSON")
+    args = parser.parse_args()
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        trace = diurnal_arrivals(args.hours * 3600, args.jobs_per_hour, args.amplitude, seed=args.seed)
+    fixed = {key: getattr(args, key) for key in ("batch_tradeoff", "budget", "boot_time", "resume_time", "price",
+                                                "render_time", "render_sigma", "overhead", "failure_rate")}
+    grid = [[kind(value) for value in getattr(args, key).split(",")] for key, kind in GRID.items()]
+    print(f"🧪 Simulando {len(trace)} llegadas ({args.hours:g} h) en "
+          f"{math.prod(len(values) for values in grid)} configuración(es)...")
+
+    rows = []
+    for values in itertools.product(*grid):
+        config = dict(fixed, **dict(zip(GRID, values)))
+        rows.append({"config": config, "result": simulate(trace, seed=args.seed, tick=args.tick, **config)})
+        print(f"   ✔ {', '.join(f'{key}={value}' for key, value in zip(GRID, values))} "
+              f"({rows[-1]['result']['wall_s']}s)")
+    print()
+    print_table(rows)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(rows, f, indent=2, default=str)
+        print(f"💾 Resultados en {args.json_path}")
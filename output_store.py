@@ -0,0 +1,247 @@
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date
+
+import aiohttp
+
+from comfy_client import InfraError
+
+# ==========================================
+# DESCARGA Y ALMACENAMIENTO DE RESULTADOS
+# ==========================================
+# Las imágenes de SaveImage se quedan en el disco del Pod (RunPod_Result_*) y se pierden
+# al pararlo/eliminarlo. Aquí se bajan en cuanto termina el prompt:
+#  - Cada fichero se lee de /view en trozos de CHUNK_SIZE y se escribe según llega
+#    (nunca hay una imagen entera en memoria; en S3 como mucho una parte multipart).
+#  - Un pool acotado de DOWNLOAD_WORKERS descargas simultáneas para todos los Pods:
+#    la red del orquestador no se satura aunque terminen muchos lotes a la vez.
+#  - Checksums: SHA-256 de lo recibido; se comprueba contra Content-Length y contra
+#    lo que quedó escrito (relectura del fichero local / ChecksumSHA256 por parte en S3).
+#  - Mientras un Pod tiene descargas pendientes el auto-scaling no lo para (ver
+#    WorkerPool.begin_fetch / end_fetch).
+# Destinos: LocalStorage (directorio o volumen montado) o S3Storage (S3, R2, MinIO...).
+
+OUTPUT_DIR = "outputs"
+DOWNLOAD_WORKERS = 4              # Descargas simultáneas (en total, no por Pod)
+CHUNK_SIZE = 256 * 1024           # Bytes por lectura de /view
+DOWNLOAD_RETRIES = 3              # Intentos por fichero ante cortes de red o checksum erróneo
+S3_PART_SIZE = 8 * 1024 * 1024    # S3 exige >= 5 MiB por parte (salvo la última)
+
+
+class OutputFetchError(InfraError):
+    """No se pudo descargar o guardar un fichero generado (no es culpa del job: se vuelve a renderizar)."""
+
+
+class ChecksumError(OutputFetchError):
+    """Lo guardado no coincide con lo recibido (o la descarga llegó truncada)."""
+
+
+def _path_parts(value):
+    return [part for part in str(value).replace("\\", "/").split("/") if part not in ("", ".")]
+
+
+def output_key(job, image):
+    """
+    Ruta del fichero en el almacenamiento: <día>/<job>/<subcarpeta>/<nombre original>.
+    subfolder y filename vienen de /history del Pod: sin "..", rutas absolutas ni unidades,
+    y del nombre solo su última parte, para que nunca se salga del directorio del job.
+    """
+    subfolder = str(image.get("subfolder") or "")
+    parts = _path_parts(subfolder)
+    if subfolder.startswith(("/", "\\")) or ".." in parts or any(":" in part for part in parts):
+        raise OutputFetchError(f"Subcarpeta insegura en /history: {subfolder!r}")
+    filename = (_path_parts(image.get("filename") or "") or [""])[-1]
+    if filename in ("", "..") or ":" in filename:
+        raise OutputFetchError(f"Nombre de fichero inseguro en /history: {image.get('filename')!r}")
+    return "/".join([date.today().isoformat(), job.id, *parts, filename])
+
+
+# ------------------------------------------
+# ALMACENAMIENTO LOCAL
+# ------------------------------------------
+class _LocalWriter:
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Fichero temporal en el mismo directorio: el rename final es atómico
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, prefix=".part-")
+        self.file = os.fdopen(fd, "wb")
+
+    def write(self, chunk):
+        self.file.write(chunk)
+
+    def commit(self, sha256):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.file.close()
+        # Relectura: lo que hay en disco debe ser exactamente lo que llegó por la red
+        digest = hashlib.sha256()
+        with open(self.tmp_path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(chunk)
+        if digest.hexdigest() != sha256:
+            self.abort()
+            raise ChecksumError(f"SHA-256 en disco distinto del recibido ({self.path})")
+        os.replace(self.tmp_path, self.path)
+        return self.path
+
+    def abort(self):
+        if not self.file.closed:
+            self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+class LocalStorage:
+    """Ficheros bajo un directorio local (o un volumen de red montado)."""
+
+    def __init__(self, root=OUTPUT_DIR):
+        self.root = root
+
+    def open(self, key):
+        # Última barrera: lo que se escribe queda siempre dentro de root (también con enlaces simbólicos)
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, *key.split("/")))
+        if os.path.commonpath([root, path]) != root or path == root:
+            raise OutputFetchError(f"Ruta fuera del directorio de salida: {key!r}")
+        return _LocalWriter(path)
+
+
+# ------------------------------------------
+# ALMACENAMIENTO COMPATIBLE CON S3
+# ------------------------------------------
+class _S3Writer:
+    def __init__(self, client, bucket, key, part_size):
+        self.client = client
+        self.bucket = bucket
+        self.key = key
+        self.part_size = part_size
+        self.buffer = bytearray()
+        self.parts = []
+        self.upload_id = client.create_multipart_upload(Bucket=bucket, Key=key,
+                                                        ChecksumAlgorithm="SHA256")["UploadId"]
+
+    def write(self, chunk):
+        self.buffer += chunk
+        if len(self.buffer) >= self.part_size:
+            self._upload_part()
+
+    def _upload_part(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        # S3 recalcula el SHA-256 de cada parte y rechaza la subida si no coincide
+        checksum = base64.b64encode(hashlib.sha256(data).digest()).decode()
+        number = len(self.parts) + 1
+        response = self.client.upload_part(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                           PartNumber=number, Body=data, ChecksumSHA256=checksum)
+        self.parts.append({"PartNumber": number, "ETag": response["ETag"], "ChecksumSHA256": checksum})
+
+    def commit(self, sha256):
+        if self.buffer or not self.parts:
+            self._upload_part()
+        self.client.complete_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                                              MultipartUpload={"Parts": self.parts})
+        return f"s3://{self.bucket}/{self.key}"
+
+    def abort(self):
+        self.client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+
+class S3Storage:
+    """Bucket S3 o compatible (R2, MinIO...: endpoint_url). boto3 solo hace falta si se usa."""
+
+    def __init__(self, bucket, prefix="", client=None, endpoint_url=None, part_size=S3_PART_SIZE):
+        if client is None:
+            import boto3
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.part_size = part_size
+
+    def open(self, key):
+        full_key = f"{self.prefix}/{key}" if self.prefix else key
+        return _S3Writer(self.client, self.bucket, full_key, self.part_size)
+
+
+# ------------------------------------------
+# DESCARGAS
+# ------------------------------------------
+class OutputFetcher:
+    """Descarga en streaming las salidas de los jobs terminados al almacenamiento."""
+
+    def __init__(self, storage, workers=DOWNLOAD_WORKERS, chunk_size=CHUNK_SIZE, retries=DOWNLOAD_RETRIES):
+        self.storage = storage
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retries = retries
+        self.slots = asyncio.Semaphore(workers)
+        self.files = 0
+        self.bytes = 0
+        self.checksum_failures = 0
+
+    async def fetch_job(self, client, job, images):
+        """Guarda todas las imágenes del job en paralelo. Devuelve [{"location", "bytes", "sha256"}]."""
+        started = time.monotonic()
+        stored = await asyncio.gather(*(self.fetch(client, job, image) for image in images))
+        logging.info(json.dumps({
+            "event": "OUTPUTS_STORED",
+            "job_id": job.id,
+            "files": len(stored),
+            "bytes": sum(item["bytes"] for item in stored),
+            "seconds": round(time.monotonic() - started, 3),
+            "sha256": [item["sha256"] for item in stored],
+        }))
+        return stored
+
+    async def fetch(self, client, job, image):
+        key = output_key(job, image)
+        async with self.slots:
+            for attempt in range(1, self.retries + 1):
+                try:
+                    return await self._stream(client, image, key)
+                except ChecksumError as e:
+                    self.checksum_failures += 1
+                    error = e
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                print(f"⚠️ Descarga de {image['filename']} fallida (intento {attempt}/{self.retries}): {error}")
+        raise OutputFetchError(f"{image['filename']}: {error}")
+
+    async def _stream(self, client, image, key):
+        digest = hashlib.sha256()
+        size = 0
+        writer = await asyncio.to_thread(self.storage.open, key)
+        try:
+            async with client.view(image) as response:
+                if response.status != 200:
+                    raise InfraError(f"HTTP {response.status} en /view ({image['filename']})")
+                expected = response.content_length
+                async for chunk in response.content.iter_chunked(self.chunk_size):
+                    digest.update(chunk)
+                    size += len(chunk)
+                    await asyncio.to_thread(writer.write, chunk)
+            if expected is not None and size != expected:
+                raise ChecksumError(f"Descarga truncada: {size} de {expected} bytes")
+            sha256 = digest.hexdigest()
+            location = await asyncio.to_thread(writer.commit, sha256)
+        except BaseException:
+            # Sin ficheros a medias en el destino. En S3 abort() es una llamada bloqueante de boto3:
+            # va a un hilo, protegida para que termine aunque cancelen esta tarea mientras espera
+            try:
+                await asyncio.shield(asyncio.to_thread(writer.abort))
+            except Exception as e:
+                logging.warning(f"OUTPUT ABORT FAILED | {key} | {e}")
+            raise
+        self.files += 1
+        self.bytes += size
+        return {"location": location, "bytes": size, "sha256": sha256}
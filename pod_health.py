@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+import statistics
+import time
+
+import aiohttp
+
+from comfy_client import InfraError, JobError
+
+# ==========================================
+# SALUD DE LOS PODS Y CIRCUIT BREAKER
+# ==========================================
+# Antes cualquier excepción en execute_on_pod era un "Fallo de conexión con GPU" que
+# gastaba un reintento del job, y un Pod enfermo seguía recibiendo trabajo hasta mandar
+# tres jobs seguidos a la DLQ. Ahora:
+#  - Se distingue el fallo de INFRAESTRUCTURA (red, timeouts, HTTP 5xx, ejecución
+#    interrumpida, descarga fallida) del fallo del JOB (workflow rechazado con 4xx,
+#    execution_error). Solo el segundo gasta reintentos del job.
+#  - Por Pod: tasa de error (EWMA), fallos seguidos, latencia por imagen (EWMA) y lo que
+#    dicen /system_stats y /queue de ComfyUI (consultados cada HEALTH_PROBE_S).
+#  - Circuit breaker por Pod: CLOSED -> OPEN (no recibe jobs) -> tras el enfriamiento
+#    HALF_OPEN (un único job de prueba) -> CLOSED si sale bien u OPEN otra vez (con el
+#    doble de enfriamiento). Tras BREAKER_MAX_TRIPS aperturas seguidas el Pod se
+#    reemplaza: se elimina y el auto-scaling pide otro.
+
+HEALTH_PROBE_S = 15           # Cada cuánto se consulta /system_stats y /queue de cada Pod
+HEALTH_ALPHA = 0.3            # Peso de cada resultado en las EWMA de error y latencia
+BREAKER_FAILURES = 3          # Fallos de infraestructura seguidos que abren el circuito
+BREAKER_ERROR_RATE = 0.5      # ...o tasa de error (EWMA) a partir de la cual se abre
+BREAKER_MIN_SAMPLES = 4       # Resultados mínimos antes de fiarnos de la tasa de error
+LATENCY_DEGRADED_FACTOR = 3.0  # Latencia por imagen > factor x mediana de la flota = degradado
+LATENCY_DEGRADED_MIN_S = 5.0  # ...y al menos estos segundos por encima de la mediana
+QUEUE_STUCK_SLACK = 4         # Prompts en la cola de ComfyUI que no son nuestros antes de sospechar
+BREAKER_COOLDOWN_S = 30       # Tiempo abierto antes del job de prueba (se dobla en cada apertura)
+BREAKER_MAX_TRIPS = 3         # Aperturas seguidas antes de reemplazar el Pod
+MAX_INFRA_RETRIES = 10        # Reintentos "gratis" por infraestructura; a partir de aquí cuentan
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+def is_infra_error(error):
+    """¿El fallo es del Pod/red (True) o del propio job (False)? Lo desconocido cuenta como del job."""
+    if isinstance(error, JobError):
+        return False
+    return isinstance(error, (InfraError, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+class PodHealth:
+    __slots__ = ("state", "error_rate", "samples", "consecutive", "latency", "opened_at", "cooldown",
+                 "trips", "queue_remaining", "vram_free", "probed_at", "reason")
+
+    def __init__(self, cooldown=BREAKER_COOLDOWN_S):
+        self.state = CLOSED
+        self.error_rate = 0.0
+        self.samples = 0
+        self.consecutive = 0        # Fallos de infraestructura seguidos
+        self.latency = None         # Segundos por imagen (envío -> fin), EWMA
+        self.opened_at = None
+        self.cooldown = cooldown
+        self.trips = 0              # Aperturas seguidas sin volver a cerrar
+        self.queue_remaining = None  # Último /queue
+        self.vram_free = None       # Último /system_stats (bytes, GPU 0)
+        self.probed_at = None
+        self.reason = None
+
+
+class PodHealthMonitor:
+    def __init__(self, clock=time.monotonic, cooldown_s=BREAKER_COOLDOWN_S):
+        self.clock = clock
+        self.cooldown_s = cooldown_s
+        self.pods = {}              # pod_id -> PodHealth
+        self.opens = 0
+        self.replaced = 0
+        self.infra_failures = 0
+
+    def get(self, pod_id):
+        health = self.pods.get(pod_id)
+        if health is None:
+            health = self.pods[pod_id] = PodHealth(self.cooldown_s)
+        return health
+
+    def forget(self, pod_id):
+        self.pods.pop(pod_id, None)
+
+    def open_count(self):
+        return sum(1 for health in self.pods.values() if health.state != CLOSED)
+
+    # --- RUTEO ---
+    def allows(self, pod_id, outstanding=0):
+        """¿Puede recibir un job? En HALF_OPEN solo uno a la vez (el de prueba)."""
+        health = self.pods.get(pod_id)
+        if health is None or health.state == CLOSED:
+            return True
+        if health.state == OPEN:
+            if self.clock() - health.opened_at < health.cooldown:
+                return False
+            health.state = HALF_OPEN
+            print(f"🩺 Pod {pod_id}: circuito medio abierto, enviando un job de prueba.")
+        return outstanding == 0
+
+    def needs_replacement(self):
+        return [pod_id for pod_id, health in self.pods.items() if health.trips >= BREAKER_MAX_TRIPS]
+
+    # --- RESULTADOS ---
+    def record_success(self, pod_id, latency_s=None):
+        """El Pod respondió (aunque el job fallase por su culpa). latency_s: segundos por imagen."""
+        health = self.get(pod_id)
+        health.samples += 1
+        health.consecutive = 0
+        health.error_rate += HEALTH_ALPHA * (0.0 - health.error_rate)
+        if latency_s is not None:
+            health.latency = latency_s if health.latency is None else \
+                health.latency + HEALTH_ALPHA * (latency_s - health.latency)
+        if health.state == HALF_OPEN:
+            health.state = CLOSED
+            health.trips = 0
+            health.cooldown = self.cooldown_s
+            self._event("POD_CIRCUIT_CLOSED", pod_id, health)
+            print(f"💚 Pod {pod_id}: circuito cerrado, vuelve a recibir trabajo.")
+        if health.state == CLOSED and self._slow(pod_id, health):
+            self._open(pod_id, health, f"latencia {health.latency:.1f}s/imagen")
+
+    def record_failure(self, pod_id, reason):
+        """Fallo de infraestructura en el Pod (los fallos del job no se registran aquí)."""
+        health = self.get(pod_id)
+        self.infra_failures += 1
+        health.samples += 1
+        health.consecutive += 1
+        health.error_rate += HEALTH_ALPHA * (1.0 - health.error_rate)
+        if health.state == HALF_OPEN:
+            self._open(pod_id, health, f"falló el job de prueba: {reason}")
+        elif health.state == CLOSED and (
+                health.consecutive >= BREAKER_FAILURES
+                or (health.samples >= BREAKER_MIN_SAMPLES and health.error_rate >= BREAKER_ERROR_RATE)):
+            self._open(pod_id, health, reason)
+
+    def record_probe(self, pod_id, stats, queue_remaining, outstanding):
+        """Resultado de /system_stats + /queue. Una cola ajena que no baja también abre el circuito."""
+        health = self.get(pod_id)
+        health.probed_at = self.clock()
+        health.queue_remaining = queue_remaining
+        devices = stats.get("devices") or [{}]
+        health.vram_free = devices[0].get("vram_free")
+        if health.state == CLOSED and queue_remaining > outstanding + QUEUE_STUCK_SLACK:
+            self._open(pod_id, health, f"{queue_remaining} prompts en la cola de ComfyUI ({outstanding} nuestros)")
+
+    def due_probe(self, pod_id):
+        health = self.pods.get(pod_id)
+        return health is None or health.probed_at is None or self.clock() - health.probed_at >= HEALTH_PROBE_S
+
+    def mark_probed(self, pod_id):
+        self.get(pod_id).probed_at = self.clock()
+
+    # --- INTERNOS ---
+    def _slow(self, pod_id, health):
+        others = [h.latency for p, h in self.pods.items() if p != pod_id and h.latency is not None]
+        if health.latency is None or not others:
+            return False
+        median = statistics.median(others)
+        return (health.latency > median * LATENCY_DEGRADED_FACTOR
+                and health.latency - median > LATENCY_DEGRADED_MIN_S)
+
+    def _open(self, pod_id, health, reason):
+        if health.trips:
+            health.cooldown *= 2
+        health.state = OPEN
+        health.opened_at = self.clock()
+        health.trips += 1
+        health.reason = reason
+        self.opens += 1
+        self._event("POD_CIRCUIT_OPEN", pod_id, health)
+        print(f"🚧 Pod {pod_id}: circuito abierto {health.cooldown:.0f}s ({reason}).")
+
+    def _event(self, event, pod_id, health):
+        logging.info(json.dumps({
+            "event": event,
+            "pod_id": pod_id,
+            "reason": health.reason,
+            "trips": health.trips,
+            "error_rate": round(health.error_rate, 3),
+            "latency_s": round(health.latency, 3) if health.latency is not None else None,
+            "queue_remaining": health.queue_remaining,
+            "vram_free": health.vram_free,
+        }))
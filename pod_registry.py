@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+# ==========================================
+# REGISTRO DE ENDPOINTS DE PODS (CACHÉ CON TTL)
+# ==========================================
+# main.get_pod_addr hace una consulta GraphQL completa (runpod.get_pod) solo para
+# saber el ip:puerto público del 8188. Aquí se resuelve una vez cuando el Pod pasa
+# a RUNNING y se cachea:
+#   - TTL por entrada; antes de caducar se refresca en segundo plano,
+#   - un error de conexión invalida la entrada (y dispara un refresco),
+#   - el camino caliente (resolve con entrada en caché) nunca espera a la API de RunPod.
+
+ENDPOINT_TTL_S = 300        # Vida de una dirección cacheada
+REFRESH_AHEAD = 0.8         # Se refresca al consumir este % del TTL
+REFRESH_TICK_S = 5.0        # Cada cuánto revisa el refresco en segundo plano
+
+
+class PodEndpointRegistry:
+    def __init__(self, resolver, ttl=ENDPOINT_TTL_S, clock=time.monotonic):
+        self.resolver = resolver          # Función síncrona pod_id -> "ip:puerto" | None
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}                 # pod_id -> (address, expires_at)
+        self.lookups = 0                  # Llamadas reales a la API (para métricas)
+        self.hits = 0
+        self._refreshing = {}             # pod_id -> Task en curso
+        self._task = None
+
+    # --- CICLO DE VIDA ---
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def close(self):
+        tasks = [t for t in (self._task, *self._refreshing.values()) if t]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+        self._refreshing.clear()
+
+    # --- API ---
+    def get(self, pod_id):
+        """Dirección cacheada (aunque esté vieja) o None. Nunca llama a RunPod."""
+        entry = self.entries.get(pod_id)
+        return entry[0] if entry else None
+
+    def set(self, pod_id, address):
+        self.entries[pod_id] = (address, self.clock() + self.ttl)
+
+    def forget(self, pod_id):
+        self.entries.pop(pod_id, None)
+        task = self._refreshing.pop(pod_id, None)
+        if task:
+            task.cancel()
+
+    def invalidate(self, pod_id):
+        """Tras un error de conexión: descartamos la dirección y pedimos una nueva en segundo plano."""
+        if self.entries.pop(pod_id, None) is not None:
+            self._schedule_refresh(pod_id)
+
+    async def fetch(self, pod_id):
+        """Consulta a RunPod (en un hilo) y cachea si el Pod tiene dirección pública."""
+        self.lookups += 1
+        address = await asyncio.to_thread(self.resolver, pod_id)
+        if address:
+            self.set(pod_id, address)
+        else:
+            self.entries.pop(pod_id, None)
+        return address
+
+    async def resolve(self, pod_id):
+        """Dirección para despachar: de caché si existe; solo espera a la API si no hay nada."""
+        entry = self.entries.get(pod_id)
+        if entry is None:
+            pending = self._refreshing.get(pod_id)
+            if pending is not None:
+                return await asyncio.shield(pending)
+            return await self.fetch(pod_id)
+        self.hits += 1
+        if self._needs_refresh(entry):
+            self._schedule_refresh(pod_id)
+        return entry[0]
+
+    # --- REFRESCO EN SEGUNDO PLANO ---
+    def _needs_refresh(self, entry):
+        return self.clock() >= entry[1] - self.ttl * (1 - REFRESH_AHEAD)
+
+    def _schedule_refresh(self, pod_id):
+        if pod_id in self._refreshing:
+            return
+        task = asyncio.create_task(self._background_fetch(pod_id))
+        self._refreshing[pod_id] = task
+
+        def _done(finished, pod_id=pod_id):
+            if self._refreshing.get(pod_id) is finished:
+                del self._refreshing[pod_id]
+        task.add_done_callback(_done)
+
+    async def _background_fetch(self, pod_id):
+        try:
+            return await self.fetch(pod_id)
+        except Exception as e:
+            print(f"⚠️ No se pudo refrescar la dirección del Pod {pod_id}: {e}")
+            return None
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(REFRESH_TICK_S)
+            for pod_id, entry in list(self.entries.items()):
+                if self._needs_refresh(entry):
+                    self._schedule_refresh(pod_id)
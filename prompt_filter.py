@@ -0,0 +1,140 @@
+import os
+import re
+import time
+import unicodedata
+
+# ==========================================
+# FILTRO DE PROMPTS (UNA SOLA PASADA, MILES DE TÉRMINOS)
+# ==========================================
+# El bucle "for bad_word in BANNED_WORDS: if bad_word in prompt.lower()" es
+# O(palabras x longitud) por prompt. Aquí la lista se compila UNA vez en una
+# expresión regular con forma de trie (los prefijos comunes se comparten), así
+# que el motor de re recorre cada prompt una vez aunque haya miles de términos.
+#  - Normalización Unicode: sin acentos (NFKD), casefold y leetspeak (s4ngr3 -> sangre).
+#    "@", "$" y "!" solo cuentan como letra entre letras (dr0g@s, v!olencia): al final de una
+#    palabra son puntuación ("droga!"). "_" separa palabras (nsfw_content).
+#  - Límites de palabra: "droga" detecta "droga"/"drogas" pero no "hidrogado".
+#  - La lista se recarga desde fichero si cambia, sin reiniciar.
+
+BANNED_WORDS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "banned_words.txt")  # Un término por línea, '#' para comentarios
+RELOAD_CHECK_S = 1.0
+PLURAL_SUFFIX = r"(?:s|es)?"             # Sufijos tolerados tras un término
+
+_LEET = str.maketrans({"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "_": " "})
+_LEET_SYMBOLS = {"@": "a", "$": "s", "!": "i"}
+_LEET_SYMBOLS_RE = re.compile(r"(?<=[^\W_])[@$!]+(?=[^\W_])")     # Solo entre letras o dígitos
+
+
+def normalize(text):
+    """Minúsculas, sin acentos, sin leetspeak y con los espacios colapsados."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    if not decomposed.isascii():
+        decomposed = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    text = decomposed.casefold()
+    if "@" in text or "$" in text or "!" in text:
+        text = _LEET_SYMBOLS_RE.sub(lambda m: "".join(_LEET_SYMBOLS[ch] for ch in m.group()), text)
+    return " ".join(text.translate(_LEET).split())
+
+
+def _trie_pattern(terms):
+    """Construye una regex tipo trie: ["sangre", "sangriento"] -> sangr(?:e|iento)."""
+    trie = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node):
+        if "" in node and len(node) == 1:
+            return None
+        branches, leaves = [], []
+        for ch in sorted(key for key in node if key):
+            sub = build(node[ch])
+            if sub is None:
+                leaves.append(re.escape(ch))
+            else:
+                branches.append(re.escape(ch) + sub)
+        if leaves:
+            branches.append(leaves[0] if len(leaves) == 1 else "[" + "".join(leaves) + "]")
+        pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if "" in node:
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return build(trie) or ""
+
+
+class PromptFilter:
+    def __init__(self, terms=(), path=None, word_boundaries=True, clock=time.monotonic):
+        self.default_terms = list(terms)
+        self.path = path
+        self.word_boundaries = word_boundaries
+        self.clock = clock
+        self._mtime = None
+        self._last_check = 0.0
+        self.reloads = 0
+        self.compile(self._read_terms())
+
+    # --- CARGA / RECARGA ---
+    def _read_terms(self):
+        if self.path and os.path.exists(self.path):
+            self._mtime = os.stat(self.path).st_mtime
+            with open(self.path, encoding="utf-8") as f:
+                return [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        self._mtime = None
+        return self.default_terms
+
+    def compile(self, terms):
+        self.originals = {}      # término normalizado -> término tal y como está en la lista
+        for term in terms:
+            normalized = normalize(term)
+            if normalized:
+                self.originals.setdefault(normalized, term)
+        if not self.originals:
+            self.regex = None
+            return
+        # El grupo 1 es el término que ha saltado (sin el sufijo de plural)
+        body = f"({_trie_pattern(sorted(self.originals))})"
+        if self.word_boundaries:
+            body = rf"\b{body}{PLURAL_SUFFIX}\b"
+        self.regex = re.compile(body)
+
+    def maybe_reload(self):
+        """Recarga la lista si el fichero ha cambiado (como mucho una comprobación por segundo)."""
+        if not self.path:
+            return False
+        now = self.clock()
+        if now - self._last_check < RELOAD_CHECK_S:
+            return False
+        self._last_check = now
+        mtime = os.stat(self.path).st_mtime if os.path.exists(self.path) else None
+        if mtime == self._mtime:
+            return False
+        self.compile(self._read_terms())
+        self.reloads += 1
+        print(f"♻️ Lista de términos prohibidos recargada ({len(self.originals)} términos).")
+        return True
+
+    def __len__(self):
+        return len(self.originals)
+
+    # --- CONSULTA ---
+    def find(self, prompt):
+        """Término prohibido encontrado en el prompt (como aparece en la lista) o None."""
+        if self.regex is None:
+            return None
+        match = self.regex.search(normalize(prompt))
+        if match is None:
+            return None
+        return self.originals.get(match.group(1), match.group(1))
+
+    def check(self, prompt):
+        self.maybe_reload()
+        bad_word = self.find(prompt)
+        return bad_word is None, bad_word
+
+    def validate_many(self, prompts):
+        """Versión por lotes: una comprobación de recarga y una pasada por prompt."""
+        self.maybe_reload()
+        return [self.find(prompt) for prompt in prompts]
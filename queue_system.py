@@ -1,21 +1,53 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
 import time
 import uuid
 import hashlib
 import logging
 import json
 import random
-import requests
 from datetime import datetime
-from main import get_pod_addr
+
+import aiohttp
+
+from comfy_client import output_images, execution_seconds, InfraError
+from dispatch_engine import DispatchEngine
+from retry_scheduler import RetryScheduler
+from job_queue import PriorityJobQueue, ShardedJobQueue, PRIORIDAD_NORMAL, TENANT_POR_DEFECTO
+from worker_pool import WorkerPool, MAX_PODS, MAX_JOBS_POR_POD, READY
+from workflow_templates import TemplateRegistry, TemplateError, PLANTILLA_POR_DEFECTO, SEED_MAX
+from job_store import JobStore, JOB_DB_FILE
+from prompt_filter import PromptFilter, BANNED_WORDS_FILE
+from result_cache import ResultCache, RESULT_CACHE_DIR, SEED_POLICY_RANDOM, cache_key
+from micro_batcher import MicroBatcher, BATCH_TRADEOFF
+from arrival_forecast import ArrivalForecaster
+from cost_meter import CostMeter, GpuPriceCatalog
+from output_store import OutputFetcher, OutputFetchError, LocalStorage, OUTPUT_DIR
+from pod_health import is_infra_error, MAX_INFRA_RETRIES
+from ingest_pool import IngestPool, check_prompts, prompt_hash as hash_prompt, INGEST_WORKERS
+from shard_coordinator import ShardCoordinator
+from telemetry import OrchestratorMetrics, Tracer, MetricsServer, setup_logging, METRICS_PORT
 
 # --- INTENTO DE IMPORTAR TU MÓDULO MAIN ---
-# Si no existe main.py, usamos funciones dummy para que el script no falle al probarlo
+# Si no existe main.py (o no hay RUNPOD_API_KEY), usamos funciones dummy para que el script no falle al probarlo.
+# El "backend" es cualquier objeto con create_worker_pod / stop_worker_pod / resume_worker_pod /
+# terminate_worker_pod / get_pod_addr / gpu_type_for / get_gpu_prices:
+# el propio módulo main en producción, o fake_comfyui.LocalBackend en local.
 try:
-    from main import create_worker_pod, stop_worker_pod
-except ImportError:
-    print("⚠️  Aviso: 'main.py' no encontrado. Usando funciones simuladas.")
-    def create_worker_pod(tipo_trabajo="imagen"): return "POD-SIMULADO-123"
-    def stop_worker_pod(pod_id): print(f"🛑 Pod {pod_id} detenido (Simulación).")
+    import main as runpod_backend
+except (ImportError, ValueError):
+    print("⚠️  Aviso: 'main.py' no disponible. Usando funciones simuladas.")
+    class _DummyBackend:
+        def create_worker_pod(self, tipo_trabajo="imagen"): return "POD-SIMULADO-123"
+        def stop_worker_pod(self, pod_id): print(f"🛑 Pod {pod_id} detenido (Simulación).")
+        def resume_worker_pod(self, pod_id): return False
+        def terminate_worker_pod(self, pod_id): print(f"🗑️ Pod {pod_id} eliminado (Simulación).")
+        def get_pod_addr(self, pod_id): return None
+        def gpu_type_for(self, tipo_trabajo="imagen"): return None
+        def get_gpu_prices(self): return {}
+    runpod_backend = _DummyBackend()
 
 # ==========================================
 # CONFIGURACIÓN DEL SISTEMA (PUNTOS 5, 6, 7)
@@ -24,60 +56,274 @@ except ImportError:
 # Configuración de Colas (Punto 5)
 MAX_RETRIES = 3            # Intentos antes de DLQ
 BACKOFF_FACTOR = 2         # Espera exponencial (2s, 4s, 8s...)
-MAX_CONCURRENT_JOBS = 1    # Rate Limiting
-AUTO_SCALE_THRESHOLD = 5   # Umbral para crear máquinas
+MAX_CONCURRENT_JOBS = 16   # Rate Limiting global (jobs en vuelo entre todos los Pods)
+AUTO_SCALE_THRESHOLD = 5   # Umbral para crear máquinas (jobs en cola por Pod)
 
 # Configuración de Costes y Observabilidad (Punto 6)
-PRECIO_GPU_HORA = 0.29     # $/h (RTX 3090)
-PRESUPUESTO_DIARIO = 5.0   # Límite de gasto ($)
+PRECIO_GPU_HORA = 0.29     # $/h de respaldo si RunPod no da el precio de la GPU (ver cost_meter.py)
+PRESUPUESTO_DIARIO = 5.0   # Límite de gasto ($), contando lo ya aceptado en cola
 LOG_FILE = "production.log"
 
 # Configuración de Seguridad (Punto 7)
-BANNED_WORDS = ["violencia", "sangre", "nsfw", "desnudo", "ilegal", "droga"]
+BANNED_WORDS = ["violencia", "sangre", "nsfw", "desnudo", "ilegal", "droga"]   # Si existe banned_words.txt, manda el fichero
 MAX_PROMPT_LENGTH = 500
+ID_BYTES = 16              # Bytes aleatorios por ID de job (128 bits, como un uuid4)
 
-# Configuración del Logger (Genera el archivo production.log)
-logging.basicConfig(
-    filename=LOG_FILE,
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s'
-)
+# Configuración del Logger (Genera el archivo production.log desde un hilo aparte, ver telemetry.py)
+setup_logging(LOG_FILE)
 
 # ==========================================
 # CLASES DEL SISTEMA
 # ==========================================
 
+# Solo protege la creación perezosa de Job._future (los handles pueden pedirla desde otros hilos)
+_FUTURE_LOCK = threading.Lock()
+
+
+class JobFailedError(Exception):
+    """El job agotó sus reintentos y terminó en la DLQ."""
+
+
+def _job_meta(item):
+    """
+    (priority, tenant) de un item de ingesta ya normalizados: prioridad entera y tenant str no vacío.
+    None si no se pueden convertir (p.ej. "priority": "alta" o "tenant": ["a"]): la cola los usa
+    como clave de orden y de diccionario y un valor así reventaría la ingesta a medias.
+    """
+    priority = item.get("priority", PRIORIDAD_NORMAL)
+    if isinstance(priority, bool) or not isinstance(priority, (int, float, str)):
+        return None
+    try:
+        priority = int(priority)
+    except (ValueError, OverflowError):
+        return None
+    tenant = item.get("tenant")
+    if tenant is None or tenant == "":
+        return priority, TENANT_POR_DEFECTO
+    if isinstance(tenant, bool) or not isinstance(tenant, (str, int)):
+        return None
+    tenant = str(tenant).strip()
+    return (priority, tenant) if tenant else None
+
+
 class Job:
-    def __init__(self, prompt):
-        self.id = str(uuid.uuid4())[:8]
+    def __init__(self, prompt, priority=PRIORIDAD_NORMAL, tenant=TENANT_POR_DEFECTO, template=PLANTILLA_POR_DEFECTO,
+                 prompt_hash=None, job_id=None, created_at=None):
+        self.id = job_id or uuid.uuid4().hex
         self.prompt = prompt
+        self.priority = priority
+        self.tenant = tenant
+        self.template = template
         self.status = "PENDING"
         # Timestamps para métricas
-        self.created_at = time.time()
+        self.created_at = time.time() if created_at is None else created_at
         self.finished_at = None
         self.retries = 0
+        self.infra_retries = 0       # Reintentos por fallos del Pod/red (no gastan los del job)
         self.cost = 0.0
-        # Hash para deduplicación
-        self.prompt_hash = hashlib.md5(prompt.encode()).hexdigest()
-        self.history_log = []
+        # Datos de ejecución en ComfyUI
+        self.prompt_id = None
+        self.dispatched_at = None
+        self.execution_time = None   # Segundos reales en GPU (eventos de ComfyUI)
+        self.pod_id = None           # Pod donde se ejecutó (su factura se reparte entre sus jobs)
+        self.result = None
+        self.files = None            # [{"location", "bytes", "sha256"}] de las imágenes ya guardadas
+        self.last_error = None
+        # Hash del texto (reparto en shards) y clave de deduplicación (la result_key del orquestador)
+        self.prompt_hash = prompt_hash or hashlib.md5(prompt.encode()).hexdigest()
+        self.dedup_key = None
+        self.coalesced = 0           # Envíos duplicados que esperan a este mismo job
+        self._future = None          # Se crea solo si alguien espera el resultado
+        self._events = []            # (time.time(), mensaje): se formatea solo si alguien lo lee
 
     def log(self, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        self.history_log.append(f"[{timestamp}] {message}")
+        self._events.append((time.time(), message))
+
+    @property
+    def history_log(self):
+        return [f"[{datetime.fromtimestamp(ts).strftime('%H:%M:%S')}] {message}" for ts, message in self._events]
+
+    def future(self):
+        """Future (thread-safe) que se resuelve con el resultado o con JobFailedError si acaba en DLQ."""
+        with _FUTURE_LOCK:
+            if self._future is None:
+                self._future = concurrent.futures.Future()
+        # Si el job terminó mientras se creaba, resolve() ya no lo vio: se resuelve aquí.
+        # complete_job deja result antes que status, así que COMPLETED siempre trae su resultado
+        if self.status in ("COMPLETED", "DEAD"):
+            self.resolve()
+        return self._future
+
+    def resolve(self):
+        """Despierta a todos los que esperan este job (original + duplicados adjuntados)."""
+        future = self._future
+        if future is None or future.done():
+            return
+        try:
+            if self.status == "COMPLETED":
+                future.set_result(self.result)
+            else:
+                future.set_exception(JobFailedError(f"Job {self.id} en DLQ: {self.last_error}"))
+        except concurrent.futures.InvalidStateError:
+            pass    # Otro hilo (future() tardío) lo resolvió a la vez
+
+    @classmethod
+    def from_record(cls, record):
+        """Reconstruye un Job guardado en el JobStore."""
+        job = cls(record["prompt"], priority=record["priority"], tenant=record["tenant"], template=record["template"])
+        job.id = record["id"]
+        job.status = record["status"]
+        job.retries = record["retries"]
+        job.created_at = record["created_at"]
+        job.finished_at = record["finished_at"]
+        job.cost = record["cost"]
+        job.prompt_id = record["prompt_id"]
+        job.result = json.loads(record["result"]) if record["result"] else None
+        job.log(f"Job recuperado del almacén persistente (estado previo: {job.status}).")
+        return job
+
+class JobHandle:
+    """
+    Lo que recibe quien envía un prompt. Si el mismo prompt ya está en vuelo, el
+    handle apunta al job existente (single-flight): una sola renderización en GPU
+    y todos los handles reciben el mismo resultado cuando termina.
+    """
+
+    def __init__(self, job, coalesced=False):
+        self.job = job
+        self.job_id = job.id
+        self.coalesced = coalesced   # True si se adjuntó a un job que ya existía
+
+    def done(self):
+        return self.job.status in ("COMPLETED", "DEAD")
+
+    def result(self, timeout=None):
+        """Bloquea (desde otro hilo) hasta tener el resultado."""
+        return self.job.future().result(timeout)
+
+    async def wait(self):
+        """Versión asíncrona, para usar desde el event loop del orquestador."""
+        return await asyncio.wrap_future(self.job.future())
+
 
 class QueueOrchestrator:
-    def __init__(self):
-        self.pending_queue = []
+    def __init__(self, backend=None, max_concurrent_jobs=MAX_CONCURRENT_JOBS,
+                 max_pods=MAX_PODS, max_jobs_por_pod=MAX_JOBS_POR_POD, job_store=None, result_cache=None,
+                 batch_tradeoff=BATCH_TRADEOFF, scale_threshold=AUTO_SCALE_THRESHOLD,
+                 backoff_factor=BACKOFF_FACTOR, budget=PRESUPUESTO_DIARIO, clock=None,
+                 metrics_port=None, tracing=False, output_store=None, shards=1):
+        self.backend = backend or runpod_backend
+        # Reloj de todo el orquestador (timestamps de jobs, backoff, escalado, costes).
+        # Por defecto el real; orchestrator_sim.py inyecta uno virtual.
+        self.clock = clock or time.time
+        monotonic = clock or time.monotonic
+        self.backoff_factor = backoff_factor
+        self.budget = budget
+        self.store = job_store      # JobStore opcional: persiste cada cambio de estado
+        self.cache = result_cache   # ResultCache opcional: repeticiones servidas sin GPU (requiere output_store)
+        # Almacenamiento opcional de las imágenes (output_store.py); sin él el resultado son
+        # los nombres de fichero en el Pod
+        self.fetcher = OutputFetcher(output_store) if output_store is not None else None
+        self.fetching_jobs = 0      # Jobs ya renderizados cuyas imágenes se están descargando
+        self.max_concurrent_jobs = max_concurrent_jobs
+        # Con shards > 1 la cola se reparte por hash del prompt y el coordinador asigna cada
+        # shard a un grupo de Pods (preferencia al despachar, ver shard_coordinator.py)
+        self.pending_queue = ShardedJobQueue(shards) if shards > 1 else PriorityJobQueue()
+        self.shards = ShardCoordinator(shards) if shards > 1 else None
+        self.batcher = MicroBatcher(tradeoff=batch_tradeoff, clock=monotonic)   # 0 = latencia mínima, 1 = coste mínimo
         self.active_jobs = {}
         self.completed_jobs = []
         self.dead_letter_queue = []
-        self.active_hashes = set()
-        
-        # Estado de Infraestructura
-        self.worker_pod_id = None
+        self.retry_scheduler = RetryScheduler(clock=monotonic)
+        self.active_hashes = {}     # result_key (prompt + plantilla + sus parámetros) -> Job en vuelo
+        self.coalesced_total = 0
+        self.templates = TemplateRegistry()
+        self.prompt_filter = PromptFilter(BANNED_WORDS, path=BANNED_WORDS_FILE)
         
-        # Estado Financiero
-        self.total_spent_today = 0.0
+        # Estado Financiero: facturación real por Pod y precio por tipo de GPU
+        self.meter = CostMeter(GpuPriceCatalog(self.backend.get_gpu_prices, default_price=PRECIO_GPU_HORA,
+                                               clock=monotonic), clock=monotonic)
+        self.meter.on_bill = self._on_pod_billed
+
+        # Estado de Infraestructura (flota de Pods)
+        self.pool = WorkerPool(
+            self.backend,
+            max_pods=max_pods,
+            max_jobs_por_pod=max_jobs_por_pod,
+            scale_threshold=scale_threshold,
+            price_per_hour=PRECIO_GPU_HORA,
+            budget=budget,
+            spent_fn=lambda: self.total_spent_today,
+            meter=self.meter,
+            clock=monotonic,
+        )
+        self.arrivals = ArrivalForecaster(clock=monotonic)   # Tasa de llegadas reciente -> pre-escalado
+        if self.store:
+            self.pool.on_warm_change = lambda warm: self.store.record_meta("warm_pods", warm)
+
+        # Observabilidad: métricas Prometheus en /metrics (si hay puerto) y trazas opcionales por job
+        self.metrics = OrchestratorMetrics(self)
+        self.tracer = Tracer(enabled=tracing)
+        self.metrics_port = metrics_port
+        self.metrics_server = None  # MetricsServer mientras corre process_queue_async
+        self.engine = None          # DispatchEngine en marcha (para despertarlo al llegar trabajo)
+
+    # --- PUNTO 6: GASTO Y PROYECCIÓN ---
+    @property
+    def total_spent_today(self):
+        """Gasto real del día: Pods ya facturados + lo que llevan encendidos los actuales."""
+        return self.meter.total()
+
+    @total_spent_today.setter
+    def total_spent_today(self, value):
+        self.meter.base_spent = value
+
+    def accepted_work(self):
+        """Jobs aceptados que aún van a consumir GPU (cola, lotes, reintentos y en vuelo)."""
+        return (len(self.pending_queue) + len(self.batcher) + len(self.retry_scheduler)
+                + len(self.active_jobs) - self.fetching_jobs)
+
+    def projected_spend(self, extra_jobs=0):
+        return self.meter.projected(self.accepted_work() + extra_jobs, self.pool.gpu_type)
+
+    def budget_headroom(self):
+        """Jobs nuevos que caben en el presupuesto diario contando lo ya aceptado."""
+        return self.meter.headroom_jobs(self.budget, self.accepted_work(), self.pool.gpu_type)
+
+    def _on_pod_billed(self, bill, jobs):
+        """Factura de un Pod cerrada: sus jobs ya tienen el coste repartido, se persiste."""
+        if self.store:
+            if jobs:
+                self.store.record_many(jobs)
+            self.store.record_spend(self.total_spent_today)
+
+    # --- PERSISTENCIA (SOBREVIVIR A REINICIOS) ---
+    def _persist(self, job):
+        if self.store:
+            self.store.record(job)
+
+    def recover(self):
+        """Reconstruye colas, hashes y gasto del día desde el JobStore tras un reinicio."""
+        if not self.store:
+            return 0
+        recoverable, dead, spent = self.store.load()
+        for record in recoverable:
+            job = Job.from_record(record)
+            # Lo que estaba en vuelo se perdió con el proceso: se vuelve a ejecutar
+            job.status = "PENDING"
+            self.pending_queue.push(job)
+            try:
+                self._track_active(job, self.result_key(job.prompt, job.template))
+            except (TemplateError, OSError):
+                pass    # Su plantilla ya no existe: fallará al despacharse, no hay con qué deduplicarlo
+        self.dead_letter_queue.extend(Job.from_record(record) for record in dead)
+        self.total_spent_today = spent
+        # Pods parados en la sesión anterior: se pueden reanudar en vez de crear otros
+        self.pool.warm = self.store.load_meta("warm_pods", [])[:self.pool.warm_size]
+        if recoverable or dead or spent:
+            print(f"♻️ Recuperados {len(recoverable)} jobs pendientes y {len(dead)} en DLQ "
+                  f"(gasto de hoy: ${spent:.4f}).")
+        return len(recoverable)
 
     # --- PUNTO 7: SANITIZACIÓN Y SEGURIDAD ---
     def validate_input(self, prompt):
@@ -86,195 +332,532 @@ class QueueOrchestrator:
         if not prompt or len(prompt) > MAX_PROMPT_LENGTH:
             return False, "Prompt inválido o demasiado largo (>500 chars)"
         
-        # 2. Palabras prohibidas (Guardarraíl)
-        for bad_word in BANNED_WORDS:
-            if bad_word in prompt.lower():
-                return False, f"Contenido prohibido detectado: '{bad_word}'"
-        
+        # 2. Palabras prohibidas (Guardarraíl): una sola pasada sobre el prompt normalizado
+        is_clean, bad_word = self.prompt_filter.check(prompt)
+        if not is_clean:
+            return False, f"Contenido prohibido detectado: '{bad_word}'"
+
         return True, "OK"
 
+    def validate_many(self, prompts):
+        """Versión por lotes de validate_input: lista de (is_valid, message) en el mismo orden."""
+        return check_prompts(self.prompt_filter, prompts, MAX_PROMPT_LENGTH)
+
+    def ingest_pool(self, workers=INGEST_WORKERS):
+        """Pool de procesos con las mismas reglas de validación que este orquestador (ver ingest_pool.py)."""
+        return IngestPool(self.prompt_filter.default_terms, path=self.prompt_filter.path,
+                          max_length=MAX_PROMPT_LENGTH, workers=workers)
+
+    # --- CACHÉ DE RESULTADOS ---
+    def result_key(self, prompt, template):
+        """Clave de caché: prompt normalizado + plantilla + modelo + política de semilla + resolución."""
+        defaults = self.templates.get(template).defaults
+        return cache_key(prompt, template, model=defaults.get("ckpt_name"), seed_policy=SEED_POLICY_RANDOM,
+                         width=defaults.get("width"), height=defaults.get("height"))
+
+    def _lookup_cache(self, key):
+        if self.cache is None:
+            return None
+        return self.cache.get(key)
+
+    def _track_active(self, job, key):
+        """Job en vuelo: los envíos con la misma result_key se le adjuntan en vez de renderizarse otra vez."""
+        job.dedup_key = key
+        self.active_hashes[key] = job
+
+    def _untrack_active(self, job):
+        if self.active_hashes.get(job.dedup_key) is job:
+            del self.active_hashes[job.dedup_key]
+
+    def _complete_from_cache(self, job, entry):
+        """Job resuelto con un resultado ya guardado: sin Pod, sin coste."""
+        job.result = entry["result"]
+        job.finished_at = self.clock()
+        job.status = "COMPLETED"
+        job.log("Resultado servido desde la caché.")
+        self.completed_jobs.append(job)
+        job.resolve()
+
+        log_data = {
+            "event": "JOB_COMPLETED",
+            "job_id": job.id,
+            "duration_s": round(job.finished_at - job.created_at, 4),
+            "gpu_time_s": 0.0,
+            "cost_usd": 0.0,
+            "cache_hit": True,
+            "gpu_s_saved_job": entry["metadata"].get("execution_time"),
+            **self.cache.stats(),
+            "prompt_hash": job.prompt_hash
+        }
+        logging.info(json.dumps(log_data))
+
     # --- PUNTO 5, 6 y 7: SUBMIT & DEDUPLICACIÓN ---
-    def submit_job(self, prompt):
+    def submit_job(self, prompt, priority=PRIORIDAD_NORMAL, tenant=TENANT_POR_DEFECTO, template=PLANTILLA_POR_DEFECTO):
+        """Devuelve el id del job (el del job ya en vuelo si es un duplicado) o None si se rechaza."""
+        handle = self.submit(prompt, priority=priority, tenant=tenant, template=template)
+        return handle.job_id if handle else None
+
+    def submit(self, prompt, priority=PRIORIDAD_NORMAL, tenant=TENANT_POR_DEFECTO, template=PLANTILLA_POR_DEFECTO):
+        """Como submit_job pero devuelve un JobHandle para esperar el resultado (o None si se rechaza)."""
+        started = time.perf_counter()
         # A) VALIDACIÓN DE SEGURIDAD (Punto 7)
         is_valid, message = self.validate_input(prompt)
         if not is_valid:
             print(f"⛔ Job Rechazado (Seguridad): {message}")
             logging.warning(f"SECURITY REJECTION | Prompt: {prompt[:20]}... | Reason: {message}")
+            self.metrics.rejected.labels("seguridad").inc()
             return None
 
-        # B) DEDUPLICACIÓN (Punto 5)
-        prompt_hash = hashlib.md5(prompt.encode()).hexdigest()
-        if prompt_hash in self.active_hashes:
-            print(f"⚠️ Job Duplicado rechazado: '{prompt[:20]}...'")
+        if template not in self.templates.names():
+            print(f"⛔ Job Rechazado: plantilla de workflow desconocida '{template}'")
+            self.metrics.rejected.labels("plantilla").inc()
             return None
+
+        # Resultado ya generado antes: se completa al momento sin pasar por la cola
+        key = self.result_key(prompt, template)
+        cached = self._lookup_cache(key)
+        if cached:
+            new_job = Job(prompt, priority=priority, tenant=tenant, template=template, created_at=self.clock())
+            self._complete_from_cache(new_job, cached)
+            self._persist(new_job)
+            self.metrics.cache_hits.inc()
+            print(f"⚡ Job {new_job.id} servido desde caché (sin GPU).")
+            return JobHandle(new_job)
+
+        # B) DEDUPLICACIÓN (Punto 5): el duplicado se adjunta al job en vuelo en vez de rechazarse.
+        # Misma clave que la caché: el mismo texto con otra plantilla o resolución es otro job
+        running = self.active_hashes.get(key)
+        if running:
+            self._attach_duplicate(running)
+            print(f"🔗 Job duplicado adjuntado a {running.id}: '{prompt[:20]}...'")
+            return JobHandle(running, coalesced=True)
         
-        # C) CONTROL DE PRESUPUESTO (Punto 6)
-        if self.total_spent_today >= PRESUPUESTO_DIARIO:
-            print("💰 ALARMA: Presupuesto diario excedido. Rechazando trabajo.")
+        # C) CONTROL DE PRESUPUESTO (Punto 6): gasto real + coste previsto de lo ya aceptado
+        projected = self.projected_spend(extra_jobs=1)
+        if projected > self.budget:
+            print(f"💰 ALARMA: El gasto previsto (${projected:.4f}) supera el presupuesto diario. "
+                  f"Rechazando trabajo.")
+            self.metrics.rejected.labels("presupuesto").inc()
             return None
 
         # Si pasa todo, creamos el Job
-        new_job = Job(prompt)
-        self.pending_queue.append(new_job)
-        self.active_hashes.add(prompt_hash)
+        new_job = Job(prompt, priority=priority, tenant=tenant, template=template, created_at=self.clock())
+        self.pending_queue.push(new_job)
+        self._track_active(new_job, key)
+        self.arrivals.record()
         new_job.log("Job aceptado y encolado.")
+        self._persist(new_job)
+        self.metrics.submitted.inc()
+        elapsed = time.perf_counter() - started
+        self.metrics.submit_time.observe(elapsed)
+        self.tracer.span(new_job.id, "submit_job", new_job.created_at, new_job.created_at + elapsed)
+        self._wake()
         print(f"📥 Job Recibido: {new_job.id}")
-        return new_job.id
+        return JobHandle(new_job)
 
-    # --- PUNTO 5: BUCLE PRINCIPAL ---
-    def process_queue(self):
-        print("\n🔄 Iniciando Orquestador Inteligente (Ctrl+C para parar)...")
-        try:
-            while True:
-                # 1. Auto-Scaling
-                self.check_auto_scaling()
+    def _attach_duplicate(self, job):
+        job.coalesced += 1
+        self.coalesced_total += 1
+        self.metrics.coalesced.inc()
+        job.log(f"Duplicado adjuntado ({job.coalesced} en espera además del original).")
 
-                # 2. Asignación de trabajos
-                if len(self.active_jobs) < MAX_CONCURRENT_JOBS and self.pending_queue:
-                    job = self.pending_queue.pop(0)
-                    self.run_job_async(job)
+    # --- INGESTA MASIVA (LOTES) ---
+    def submit_many(self, items, checks=None):
+        """
+        Versión por lotes de submit_job para ingestas grandes (ver bulk_ingest.py).
+        items: iterable de dicts con "prompt" y opcionalmente priority/tenant/template.
+        checks: (is_valid, message, prompt_hash) ya calculados en otro proceso para los prompts
+        str del lote, en orden (IngestPool.checked_batches); sin él se validan aquí.
+        Sin prints por job y con un único cambio de estado persistido para todo el lote.
+        Devuelve un dict con accepted / rejected / duplicates / cached y los motivos de rechazo.
+        Los duplicados de un job en vuelo se adjuntan a él (no se vuelven a renderizar).
+        Los servidos desde caché cuentan también como aceptados (ya salen completados).
+        """
+        report = {"accepted": 0, "rejected": 0, "duplicates": 0, "cached": 0, "reasons": {}}
 
-                # 3. Espera activa
-                time.sleep(1)
-                
-                # Feedback visual si está ocioso
-                if not self.pending_queue and not self.active_jobs:
-                    print(f"💤 Ocioso (Gasto hoy: ${self.total_spent_today:.4f})...", end="\r")
+        def reject(reason):
+            report["rejected"] += 1
+            report["reasons"][reason] = report["reasons"].get(reason, 0) + 1
+
+        headroom = self.budget_headroom()     # Jobs que aún caben en el presupuesto previsto
+        templates = set(self.templates.names())
+        items = list(items)
+        # IDs de 128 bits del lote con una sola llamada a urandom (uuid4 por job domina el coste de la
+        # ingesta). Con 32 bits un millón de jobs ya colisiona y el upsert del JobStore pisaría al anterior
+        ids = os.urandom(ID_BYTES * len(items)).hex()
+        prompts = [item.get("prompt") for item in items]
+        if checks is None:
+            checks = [(is_valid, message, None) for is_valid, message
+                      in self.validate_many([prompt for prompt in prompts if isinstance(prompt, str)])]
+        checks = iter(checks)
+        accepted = []
+        for index, item in enumerate(items):
+            prompt = prompts[index]
+            if not isinstance(prompt, str):
+                reject("formato")
+                continue
+            is_valid, _message, prompt_hash = next(checks)
+            meta = _job_meta(item)
+            if meta is None:
+                reject("formato")
+                continue
+            if not is_valid:
+                reject("seguridad")
+                continue
+            template = item.get("template") or PLANTILLA_POR_DEFECTO
+            if template not in templates:
+                reject("plantilla")
+                continue
+            prompt_hash = prompt_hash or hash_prompt(prompt)
+            key = self.result_key(prompt, template)
+            cached = self._lookup_cache(key)
+            running = None if cached else self.active_hashes.get(key)
+            if running:
+                self._attach_duplicate(running)
+                report["duplicates"] += 1
+                continue
+            if not cached:
+                if headroom <= 0:
+                    reject("presupuesto")
+                    continue
+                headroom -= 1
+
+            job = Job(prompt,
+                      priority=meta[0],
+                      tenant=meta[1],
+                      template=template,
+                      prompt_hash=prompt_hash,
+                      job_id=ids[index * ID_BYTES * 2:(index + 1) * ID_BYTES * 2],
+                      created_at=self.clock())
+            accepted.append(job)
+            if cached:
+                self._complete_from_cache(job, cached)
+                report["cached"] += 1
+                continue
+            self.pending_queue.push(job)
+            self._track_active(job, key)
+
+        # La ingesta masiva no alimenta la previsión de llegadas: ya es cola visible, no una tasa sostenida
+        report["accepted"] = len(accepted)
+        self.metrics.submitted.inc(len(accepted) - report["cached"])
+        self.metrics.cache_hits.inc(report["cached"])
+        for reason, count in report["reasons"].items():
+            self.metrics.rejected.labels(reason).inc(count)
+        if accepted and self.store:
+            self.store.record_many(accepted)
+        if len(accepted) > report["cached"]:
+            self._wake()
+        return report
 
+    def _wake(self):
+        """Hay trabajo nuevo: el motor de despacho no espera a su siguiente revisión."""
+        if self.engine is not None:
+            self.engine.notify()
+
+    # --- PUNTO 5: BUCLE PRINCIPAL ---
+    def process_queue(self, stop_when_idle=False):
+        print("\n🔄 Iniciando Orquestador Inteligente (Ctrl+C para parar)...")
+        try:
+            asyncio.run(self.process_queue_async(stop_when_idle=stop_when_idle))
         except KeyboardInterrupt:
             print("\n🛑 Deteniendo sistema...")
-            if self.worker_pod_id:
-                print(f"🧹 Limpiando recursos: Apagando Pod {self.worker_pod_id}")
-                stop_worker_pod(self.worker_pod_id)
+            self.pool.stop_all()
+
+    async def process_queue_async(self, stop_when_idle=False, **engine_options):
+        """Versión asíncrona del bucle principal (para integrarlo en un event loop propio)."""
+        engine = self.engine = DispatchEngine(self, **engine_options)
+        if self.metrics_port is not None:
+            self.metrics_server = MetricsServer(self.metrics.registry, self.tracer)
+            await self.metrics_server.start(port=self.metrics_port)
+        try:
+            await engine.run(stop_when_idle=stop_when_idle)
+        finally:
+            self.engine = None
+            if self.metrics_server:
+                await self.metrics_server.stop()
+                self.metrics_server = None
 
     # --- PUNTO 5: AUTO-SCALING ---
-    def check_auto_scaling(self):
-        queue_size = len(self.pending_queue)
-        
-        # Scale Up
-        if queue_size > 0 and self.worker_pod_id is None:
-            print(f"🚨 Cola detectada ({queue_size} jobs). Solicitando GPU...")
-            self.worker_pod_id = create_worker_pod(tipo_trabajo="imagen")
-            print(f"✅ Infraestructura lista: {self.worker_pod_id}")
-
-        # Scale Down (Ahorro)
-        elif queue_size == 0 and not self.active_jobs and self.worker_pod_id:
-            print("📉 Cola vacía. Apagando worker para ahorrar dinero.")
-            stop_worker_pod(self.worker_pod_id)
-            self.worker_pod_id = None
+    async def check_auto_scaling(self):
+        # Los reintentos en espera también son trabajo: no apagamos Pods por ellos
+        backlog = len(self.pending_queue) + len(self.batcher) + len(self.retry_scheduler)
+        # Pre-escalado: tasa de llegadas prevista para cuando estaría listo un Pod nuevo
+        forecast = self.arrivals.forecast(self.pool.boot_estimate_s)
+        in_flight = len(self.active_jobs) - self.fetching_jobs    # Los que solo descargan ya no ocupan GPU
+        await self.pool.autoscale(backlog=backlog, in_flight=in_flight, forecast_rate=forecast)
+        if self.shards is not None:
+            self.shards.rebalance(pod.pod_id for pod in self.pool.pods.values() if pod.status == READY)
 
     # --- PUNTO 5: EJECUCIÓN ASÍNCRONA ---
-    def run_job_async(self, job):
-        job.status = "PROCESSING"
-        self.active_jobs[job.id] = job
-        print(f"⚙️ Procesando Job {job.id} en Pod {self.worker_pod_id}...")
-        
+    async def run_job_async(self, job, pod_id, engine):
+        await self.run_batch_async([job], pod_id, engine)
+
+    async def run_batch_async(self, jobs, pod_id, engine):
+        """Ejecuta un lote de jobs compatibles como un solo prompt de ComfyUI."""
+        for job in jobs:
+            job.status = "PROCESSING"
+            job.pod_id = pod_id
+            self.active_jobs[job.id] = job
+            self._persist(job)
+        if len(jobs) == 1:
+            print(f"⚙️ Procesando Job {jobs[0].id} en Pod {pod_id}...")
+        else:
+            print(f"⚙️ Procesando lote de {len(jobs)} jobs en Pod {pod_id}...")
+
         try:
-            # AQUÍ ESTÁ EL CAMBIO: Usamos la función real si tenemos Pod, sino el mock
-            if self.worker_pod_id:
-                success = self.execute_on_pod(job, self.worker_pod_id)
-            else:
-                success = self.mock_api_call(job) # Fallback si no hay pod real levantado
-            
-            if success:
-                # En un sistema real, aquí haríamos polling (como en benchmark.py)
-                # Para la entrega, asumimos éxito tras el envío.
-                self.complete_job(job, "imagen_generada.png")
+            results = await self.execute_batch_on_pod(jobs, pod_id, engine)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Fallo del Pod/red: cuenta para su circuit breaker y el lote vuelve a la cola sin
+            # gastar reintentos. Fallo del job: el Pod respondió bien; cada job sigue su backoff/DLQ.
+            infra = is_infra_error(e)
+            if infra:
+                self.pool.health.record_failure(pod_id, str(e) or type(e).__name__)
             else:
-                raise Exception("Fallo de conexión con GPU")
+                self.pool.health.record_success(pod_id)
+            for job in jobs:
+                self.handle_failure(job, str(e) or type(e).__name__, infra=infra)
+            return
+
+        if self.fetcher is not None:
+            # La GPU queda libre para el siguiente lote; el Pod no se para hasta guardar estas imágenes
+            for job in jobs:
+                job.status = "FETCHING"
+                self._persist(job)
+            self.fetching_jobs += len(jobs)
+            self.pool.begin_fetch(pod_id)
+            engine.spawn(self.store_outputs(jobs, results, pod_id, engine))
+            return
 
+        for job, images in zip(jobs, results):
+            self._finish(job, [image["filename"] for image in images])
+
+    def _finish(self, job, result):
+        try:
+            self.complete_job(job, result)
         except Exception as e:
+            if job.status == "COMPLETED":
+                # Ya resuelto y persistido: lo que falle después (logs, métricas) no lo re-renderiza
+                logging.error(f"POST-COMPLETION ERROR | Job: {job.id} | {e}")
+                return
             self.handle_failure(job, str(e))
 
+    async def store_outputs(self, jobs, results, pod_id, engine):
+        """Descarga las imágenes del lote al almacenamiento y completa cada job (o lo reintenta)."""
+        try:
+            started = self.clock()
+            try:
+                address = await self.pool.endpoints.resolve(pod_id)
+                if not address:
+                    raise OutputFetchError(f"el Pod {pod_id} no tiene dirección")
+                client = engine.clients.get(address)
+                stored = await asyncio.gather(*(self.fetcher.fetch_job(client, job, images)
+                                                for job, images in zip(jobs, results)), return_exceptions=True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stored = [e] * len(jobs)
+            self.metrics.output_fetch.observe(self.clock() - started)
+        finally:
+            self.fetching_jobs -= len(jobs)
+            self.pool.end_fetch(pod_id)
+
+        for job, files in zip(jobs, stored):
+            if isinstance(files, BaseException):
+                infra = is_infra_error(files)
+                if infra:
+                    self.pool.health.record_failure(pod_id, f"descarga: {files}")
+                self.handle_failure(job, f"Descarga de resultados: {files}", infra=infra)
+                continue
+            job.files = files
+            self.metrics.output_files.inc(len(files))
+            self.metrics.output_bytes.inc(sum(item["bytes"] for item in files))
+            self._finish(job, [item["location"] for item in files])
+
+    def batch_key(self, job):
+        """Jobs con la misma clave pueden compartir prompt: misma plantilla, modelo y resolución."""
+        defaults = self.templates.get(job.template).defaults
+        return (job.template, defaults.get("ckpt_name"), defaults.get("width"), defaults.get("height"))
+
+    def job_model(self, job):
+        """Checkpoint que cargará el job en el Pod (para la afinidad de modelo)."""
+        return self.templates.get(job.template).defaults.get("ckpt_name")
+
     # --- PUNTO 5: GESTIÓN DE FALLOS (BACKOFF + DLQ) ---
-    def handle_failure(self, job, error_msg):
+    def handle_failure(self, job, error_msg, infra=False):
+        """infra=True: falló el Pod o la red, no el job. Vuelve a la cola al momento (a otro Pod)
+        sin gastar reintentos, hasta MAX_INFRA_RETRIES veces."""
+        job.last_error = error_msg
+        self.active_jobs.pop(job.id, None)
+
+        if infra and job.infra_retries < MAX_INFRA_RETRIES:
+            job.infra_retries += 1
+            job.status = "PENDING"
+            job.log(f"Fallo de infraestructura (no cuenta como reintento): {error_msg}")
+            self.pending_queue.push_front(job)
+            self.metrics.infra_requeues.inc()
+            print(f"🔌 Fallo de infraestructura en {job.id}; vuelve a la cola sin gastar reintentos.")
+            self._persist(job)
+            return
+
         job.retries += 1
-        wait_time = BACKOFF_FACTOR ** job.retries
-        
+        wait_time = self.backoff_factor ** job.retries
         job.log(f"Fallo detectado: {error_msg}")
-        print(f"⚠️ Error en {job.id}. Reintentando en {wait_time}s...")
-        
-        del self.active_jobs[job.id]
         
         if job.retries >= MAX_RETRIES:
             job.status = "DEAD"
             job.log("Movido a DLQ.")
             self.dead_letter_queue.append(job)
-            self.active_hashes.remove(job.prompt_hash) # Liberamos hash para permitir reintento manual
+            self.metrics.dead.inc()
+            self._untrack_active(job) # Liberamos la clave para permitir reintento manual
+            job.resolve()   # Los que esperaban (incluidos duplicados adjuntados) reciben el error
             print(f"💀 Job {job.id} MUERTO (DLQ).")
             # Log de error crítico
             logging.error(f"DLQ ENTRY | Job: {job.id} | Prompt: {job.prompt} | Error: {error_msg}")
+            self._persist(job)
         else:
-            time.sleep(wait_time) # Simulación de espera
+            # Backoff sin bloquear: el job espera en el heap mientras el resto sigue
+            delay = self.retry_scheduler.schedule(job, wait_time)
+            job.status = "RETRY_WAIT"
+            self.metrics.retries.inc()
+            job.log(f"Reintento programado en {delay:.1f}s.")
+            print(f"⚠️ Error en {job.id}. Reintentando en {delay:.1f}s...")
+            self._persist(job)
+
+    def release_due_retries(self):
+        """Devuelve a la cabeza de la cola los jobs cuyo backoff ya ha vencido."""
+        due = self.retry_scheduler.pop_due()
+        for job in reversed(due):
             job.status = "PENDING"
-            self.pending_queue.insert(0, job)
+            self.pending_queue.push_front(job)
+            self._persist(job)
+        return len(due)
 
     # --- PUNTO 6: COMPLETADO Y CÁLCULO DE COSTES ---
     def complete_job(self, job, result):
-        job.finished_at = time.time()
+        job.finished_at = self.clock()
         duration = job.finished_at - job.created_at
         
-        # CÁLCULO DE FINOPS
-        coste_real = (PRECIO_GPU_HORA / 3600) * duration
+        # CÁLCULO DE FINOPS: su tiempo real de GPU al precio de SU Pod. La cola no se cobra;
+        # arranques y huecos del Pod se le reparten al cerrarse la factura (POD_BILLED).
+        gpu = self.meter.gpu_of(job.pod_id)
+        coste_real = self.meter.job_finished(job.pod_id, job, job.execution_time)
         job.cost = coste_real
-        self.total_spent_today += coste_real
 
+        job.result = result          # Antes que el estado: quien vea COMPLETED (otro hilo) ya tiene el resultado
         job.status = "COMPLETED"
-        self.active_hashes.remove(job.prompt_hash)
-        if job.id in self.active_jobs:
-            del self.active_jobs[job.id]
+        self._untrack_active(job)
+        job.resolve()       # Un único render, todos los handles reciben el resultado
+        self.active_jobs.pop(job.id, None)
+        self.completed_jobs.append(job)
+        self._persist(job)
+        if self.store:
+            self.store.record_spend(self.total_spent_today)
+        # Solo se cachean ubicaciones ya guardadas (OutputFetcher): los nombres de fichero del
+        # disco del Pod dejan de existir en cuanto se para
+        if self.cache is not None and self.fetcher is not None and job.files:
+            try:
+                self.cache.put(job.dedup_key or self.result_key(job.prompt, job.template), result,
+                               {"execution_time": job.execution_time, "template": job.template,
+                                "prompt_hash": job.prompt_hash})
+            except OSError as e:
+                # El job ya está COMPLETED: un fallo de la caché no debe llevarlo a handle_failure
+                logging.warning(f"RESULT CACHE WRITE FAILED | Job: {job.id} | {e}")
 
         # LOGGING ESTRUCTURADO (JSON)
         log_data = {
             "event": "JOB_COMPLETED",
             "job_id": job.id,
             "duration_s": round(duration, 2),
+            "gpu_time_s": round(job.execution_time, 2) if job.execution_time is not None else None,
             "cost_usd": round(coste_real, 6),
-            "model": "RTX 3090",
+            "gpu": gpu,
+            "cache_hit": False,
+            "coalesced": job.coalesced,
+            **(self.cache.stats() if self.cache is not None else {}),
             "prompt_hash": job.prompt_hash
         }
         logging.info(json.dumps(log_data))
+
+        self.metrics.completed.inc()
+        self.metrics.job_latency.observe(duration)
+        if job.dispatched_at is not None:
+            self.tracer.span(job.id, "queue", job.created_at, job.dispatched_at)
+        self.tracer.span(job.id, "job", job.created_at, job.finished_at, pod=job.pod_id, gpu=gpu)
         
         print(f"✅ Job {job.id} TERMINADO. Coste: ${coste_real:.6f} (Total acumulado: ${self.total_spent_today:.4f})")
 
-   def execute_on_pod(self, job, pod_id):
+    async def execute_on_pod(self, job, pod_id, engine):
+        """Envía el job a ComfyUI y espera a que termine. Devuelve sus imágenes; si falla lanza
+        InfraError (Pod/red) o JobError (workflow), ver pod_health.is_infra_error."""
+        results = await self.execute_batch_on_pod([job], pod_id, engine)
+        return results[0]
+
+    async def execute_batch_on_pod(self, jobs, pod_id, engine):
+        """Como execute_on_pod para un lote: un solo prompt y una lista de imágenes por job."""
         try:
-            # CORRECCIÓN: Obtener la IP real dinámicamente
-            address = get_pod_addr(pod_id)
+            # Dirección cacheada en el registro (solo llama a RunPod si no la conocemos)
+            address = await self.pool.endpoints.resolve(pod_id)
             if not address:
-                print(f"⚠️ El Pod {pod_id} no está listo o no tiene IP pública.")
-                return False
+                raise InfraError(f"El Pod {pod_id} no está listo o no tiene IP pública.")
                 
-            url = f"http://{address}/prompt"
+            client = engine.clients.get(address)   # Conexión keep-alive compartida por Pod
+            tracker = engine.completions.for_pod(pod_id, address)
             
-            # Cargamos el workflow plantilla
-            with open("workflow_api.json", "r") as f:
-                workflow = json.load(f)
-
-            # INYECCIÓN DINÁMICA (Lo que pide la Tarea 6 y 2)
-            # Buscamos el nodo de texto (ID 6 en tu json) y metemos el prompt del usuario
-            workflow["6"]["inputs"]["text"] = job.prompt
-            # Cambiamos la semilla para que no salgan fotos iguales
-            workflow["3"]["inputs"]["seed"] = random.randint(1, 1000000000)
+            # Plantilla precompilada: solo se codifican el prompt y la semilla del job
+            template = self.templates.get(jobs[0].template)
+            values = [{"prompt": job.prompt, "seed": random.randint(1, SEED_MAX)} for job in jobs]  # Semilla nueva: fotos distintas
+            if len(jobs) == 1:
+                # Para recibir sus eventos por el WebSocket
+                payload = template.render(values[0], client_id=tracker.client_id)
+                output_nodes = [None]
+            else:
+                # Una rama por job en el mismo grafo; output_nodes dice qué SaveImage es de quién
+                payload, output_nodes = template.render_batch(values, client_id=tracker.client_id)
 
             # Enviamos a ComfyUI
-            payload = json.dumps({"prompt": workflow}).encode('utf-8')
-            req = request.Request(url, data=payload, headers={'Content-Type': 'application/json'})
-            
-            with request.urlopen(req) as response:
-                response_data = json.loads(response.read())
-                job.log(f"Enviado a GPU. Prompt ID: {response_data.get('prompt_id')}")
-                return True
+            response_data = await client.queue_prompt_raw(payload)
+            prompt_id = response_data.get("prompt_id")
+            dispatched_at = self.clock()
+            self.metrics.prompts.inc()
+            for job in jobs:
+                job.prompt_id = prompt_id
+                job.dispatched_at = dispatched_at
+                self.metrics.dispatch_latency.observe(dispatched_at - job.created_at)
+                job.log(f"Enviado a GPU. Prompt ID: {prompt_id}" + (f" (lote de {len(jobs)})" if len(jobs) > 1 else ""))
 
-        except Exception as e:
-            print(f"Error conectando con Pod: {e}")
-            return False
+            # Esperamos el evento de fin (o el polling de respaldo) sin bloquear al resto de jobs
+            entry = await tracker.wait(prompt_id)
+            done_at = self.clock()
+            gpu_seconds = execution_seconds(entry)
+            self.pool.health.record_success(pod_id, (done_at - dispatched_at) / len(jobs))
+            if gpu_seconds is not None:
+                # Espera en el Pod antes de empezar a renderizar (sin comparar su reloj con el nuestro)
+                self.metrics.render_time.observe(gpu_seconds)
+                self.metrics.first_gpu.observe(max(0.0, done_at - dispatched_at - gpu_seconds))
+            for job in jobs:
+                # Tiempo de GPU del lote repartido a partes iguales
+                job.execution_time = gpu_seconds / len(jobs) if gpu_seconds is not None else None
+                self.tracer.span(job.id, "execute_on_pod", dispatched_at, done_at, pod=pod_id, prompt_id=prompt_id,
+                                 batch=len(jobs))
+            return [output_images(entry, nodes) for nodes in output_nodes]
+
+        except aiohttp.ClientConnectionError as e:
+            # La IP/puerto puede haber cambiado (reinicio del Pod): forzamos nueva resolución
+            self.pool.endpoints.invalidate(pod_id)
+            raise InfraError(f"Error conectando con Pod: {e}") from e
 
 # ==========================================
 # ZONA DE TEST
 # ==========================================
 if __name__ == "__main__":
-    sistema = QueueOrchestrator()
+    # Todo cambio de estado queda en jobs.db: un reinicio retoma la cola y el gasto del día
+    almacen = JobStore(JOB_DB_FILE)
+    # Repeticiones de prompts ya generados se sirven desde result_cache/ sin encender GPU
+    sistema = QueueOrchestrator(job_store=almacen, result_cache=ResultCache(RESULT_CACHE_DIR),
+                                metrics_port=METRICS_PORT, output_store=LocalStorage(OUTPUT_DIR))
+    sistema.recover()
     
     print("--- 🧪 TEST DE INTEGRACIÓN COMPLETO (PUNTOS 5, 6, 7) ---")
     
@@ -283,7 +866,7 @@ if __name__ == "__main__":
     
     # 2. Prueba de Deduplicación
     sistema.submit_job("Un paisaje tranquilo")
-    sistema.submit_job("Un paisaje tranquilo") # Rechazado por duplicado
+    sistema.submit_job("Un paisaje tranquilo") # Duplicado: se adjunta al primero (un solo render)
     
     # 3. Prueba de Fallo y DLQ
     sistema.submit_job("Quiero que esto de fallo de conexión")
@@ -292,4 +875,5 @@ if __name__ == "__main__":
     sistema.submit_job("Un astronauta en marte")
     
     # Iniciar motor
-    sistema.process_queue()
\ No newline at end of file
+    sistema.process_queue()
+    almacen.close()
@@ -0,0 +1,126 @@
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from collections import OrderedDict
+
+# ==========================================
+# CACHÉ DE RESULTADOS (DIRECCIONADA POR CONTENIDO)
+# ==========================================
+# La deduplicación de submit_job solo rechaza un prompt mientras está en vuelo:
+# al terminar se libera el hash y una petición idéntica vuelve a pagar GPU.
+# Aquí guardamos en disco, por cada combinación prompt normalizado + plantilla +
+# modelo + política de semilla + resolución, las referencias a las imágenes
+# generadas y sus metadatos. Un acierto completa el job en milisegundos sin Pod.
+#  - Un fichero JSON por entrada: result_cache/<2 primeros hex>/<clave>.json
+#  - Expulsión LRU por número de entradas y por tamaño total en disco.
+#  - El mtime del fichero hace de "último uso", así el orden LRU sobrevive a reinicios.
+
+RESULT_CACHE_DIR = "result_cache"
+CACHE_MAX_ENTRIES = 10_000
+CACHE_MAX_BYTES = 64 * 1024 * 1024
+SEED_POLICY_RANDOM = "random"      # Semilla nueva por job: cualquier resultado previo es válido
+
+
+def normalize_prompt(prompt):
+    """Forma canónica del prompt para la clave: Unicode NFC, casefold y espacios colapsados."""
+    return " ".join(unicodedata.normalize("NFC", prompt).casefold().split())
+
+
+def cache_key(prompt, template, model=None, seed_policy=SEED_POLICY_RANDOM, width=None, height=None):
+    material = json.dumps([normalize_prompt(prompt), template, model, seed_policy, width, height])
+    return hashlib.sha256(material.encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=RESULT_CACHE_DIR, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()    # clave -> bytes en disco (del menos al más reciente)
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.gpu_seconds_saved = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _load(self):
+        """Reconstruye el índice LRU a partir de lo que hay en disco (orden por mtime)."""
+        found = []
+        for root, _dirs, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".json"):
+                    stat = os.stat(os.path.join(root, name))
+                    found.append((stat.st_mtime, name[:-5], stat.st_size))
+        for _mtime, key, size in sorted(found):
+            self.entries[key] = size
+            self.total_bytes += size
+        self._evict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    # --- CONSULTA ---
+    def get(self, key):
+        """Entrada guardada ({"result": ..., "metadata": ...}) o None."""
+        if key not in self.entries:
+            self.misses += 1
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r") as f:
+                entry = json.load(f)
+            os.utime(path)                # Marca de último uso para el LRU tras reinicios
+        except (OSError, ValueError):
+            # Borrado a mano o corrupto: lo tratamos como fallo y lo olvidamos
+            self._discard(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.gpu_seconds_saved += entry["metadata"].get("execution_time") or 0.0
+        return entry
+
+    # --- ESCRITURA ---
+    def put(self, key, result, metadata=None):
+        data = json.dumps({"result": result, "metadata": {"stored_at": time.time(), **(metadata or {})}}).encode()
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)             # Atómico: nunca se lee una entrada a medias
+        self.total_bytes += len(data) - self.entries.pop(key, 0)
+        self.entries[key] = len(data)
+        self._evict()
+
+    def _discard(self, key):
+        self.total_bytes -= self.entries.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self.entries and (len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes):
+            oldest = next(iter(self.entries))
+            self._discard(oldest)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "cache_entries": len(self.entries),
+            "cache_hit_rate": round(self.hit_rate, 4),
+            "gpu_s_saved": round(self.gpu_seconds_saved, 2),
+        }
@@ -0,0 +1,50 @@
+import heapq
+import itertools
+import random
+import time
+
+# ==========================================
+# PLANIFICADOR DE REINTENTOS (SIN BLOQUEAR)
+# ==========================================
+# En lugar de time.sleep(backoff) dentro del bucle principal, los jobs fallidos se
+# aparcan en un heap ordenado por el instante en que vuelven a ser elegibles.
+# schedule() y pop_due() son O(log n), así que miles de jobs esperando reintento
+# no frenan al resto de la cola ni al auto-scaling.
+
+RETRY_JITTER = 0.2     # ±20% aleatorio sobre el backoff para no sincronizar reintentos
+
+
+class RetryScheduler:
+    def __init__(self, jitter=RETRY_JITTER, clock=time.monotonic, rng=None):
+        self.jitter = jitter
+        self.clock = clock
+        self.random = rng or random.Random()
+        self._heap = []                   # (eligible_at, seq, job)
+        self._seq = itertools.count()     # Desempate FIFO entre jobs con el mismo instante
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __bool__(self):
+        return bool(self._heap)
+
+    def schedule(self, job, delay):
+        """Aparca el job durante ~delay segundos. Devuelve el retardo real aplicado (con jitter)."""
+        if self.jitter:
+            delay *= self.random.uniform(1 - self.jitter, 1 + self.jitter)
+        heapq.heappush(self._heap, (self.clock() + delay, next(self._seq), job))
+        return delay
+
+    def pop_due(self, now=None):
+        """Saca, en orden de elegibilidad, todos los jobs cuyo backoff ya ha vencido."""
+        now = self.clock() if now is None else now
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def next_due_in(self):
+        """Segundos hasta el próximo reintento (None si no hay ninguno aparcado)."""
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - self.clock())
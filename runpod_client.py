@@ -0,0 +1,478 @@
+import concurrent.futures
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+
+# ==========================================
+# CLIENTE DE LA API DE RUNPOD (GRAPHQL)
+# ==========================================
+# main.py llamaba a runpod.get_pod / create_pod / stop_pod / get_gpus / get_user una a
+# una, sin timeouts, sin reintentos y sin tener en cuenta el rate limit. Con muchos
+# Pods el plano de control se convertía en el cuello de botella. Este cliente:
+#  - Agrupa las consultas de estado: varios Pods en UNA llamada GraphQL (alias p0, p1...).
+#    Las llamadas a pod() que llegan a la vez desde varios hilos (registro de endpoints,
+#    arranques en paralelo) se juntan durante STATUS_BATCH_WINDOW_S en una sola.
+#  - Cachea lo que cambia poco (catálogo y precios de GPU) durante CATALOG_TTL_S.
+#  - Token bucket compartido por todos los hilos (RATE_LIMIT_PER_S, ráfagas de
+#    RATE_LIMIT_BURST). Ante un 429 o un 5xx espera (Retry-After o backoff exponencial con
+#    jitter) y el bucket entero se frena, no solo la petición que falló.
+#  - Publica el ciclo de vida de los Pods (CREATED/BOOTING/READY/STOPPED/TERMINATED) en un
+#    stream al que se suscribe el orquestador: una sola consulta agrupada cada
+#    LIFECYCLE_POLL_S para todos los Pods vigilados, en vez de un get_pod por Pod y tick.
+# Para probarlo en local: fake_runpod.FakeRunPodAPI (servidor GraphQL falso).
+
+RUNPOD_GRAPHQL_URL = "https://api.runpod.io/graphql"
+API_TIMEOUT_S = 15            # Timeout de cada petición HTTP
+API_RETRIES = 4               # Reintentos ante red caída, 429 o 5xx
+API_BACKOFF_S = 0.5           # Primera espera entre reintentos (se dobla en cada uno)
+RATE_LIMIT_PER_S = 4.0        # Peticiones por segundo sostenidas hacia RunPod
+RATE_LIMIT_BURST = 8          # Ráfaga máxima permitida por el bucket
+CATALOG_TTL_S = 3600          # Vida en caché del catálogo y precios de GPU
+STATUS_BATCH_WINDOW_S = 0.02  # Espera para juntar consultas pod() simultáneas
+STATUS_BATCH_MAX = 50         # Pods por consulta agrupada
+LIFECYCLE_POLL_S = 5.0        # Cada cuánto se consulta el estado de los Pods vigilados
+
+CREATED = "CREATED"
+BOOTING = "BOOTING"
+READY = "READY"
+STOPPED = "STOPPED"
+TERMINATED = "TERMINATED"
+
+POD_FIELDS = """id desiredStatus lastStatusChange
+      runtime { uptimeInSeconds ports { ip isIpPublic privatePort publicPort type } }"""
+GPU_FIELDS = """id displayName memoryInGb communityPrice securePrice
+      lowestPrice(input: {gpuCount: 1}) { minimumBidPrice uninterruptablePrice }"""
+
+
+class RunPodAPIError(Exception):
+    """La API de RunPod respondió con error (o no respondió tras los reintentos)."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def pod_address(pod, private_port=8188):
+    """ip:puerto público del puerto privado del Pod, o None si aún no lo tiene (o no corre)."""
+    if not pod or pod.get("desiredStatus") != "RUNNING":
+        return None
+    for port in ((pod.get("runtime") or {}).get("ports") or []):
+        if port.get("privatePort") == private_port and port.get("ip"):
+            return f"{port['ip']}:{port['publicPort']}"
+    return None
+
+
+def lifecycle_state(pod):
+    """Estado del ciclo de vida según lo que devuelve pod()."""
+    if pod is None or pod.get("desiredStatus") == "TERMINATED":
+        return TERMINATED
+    if pod.get("desiredStatus") != "RUNNING":
+        return STOPPED
+    return READY if pod_address(pod) else BOOTING
+
+
+def gpu_price(gpu):
+    """$/h de una GPU (RunPod ha ido cambiando los nombres de los campos)."""
+    lowest = gpu.get("lowestPrice") or {}
+    return gpu.get("communityPrice") or gpu.get("minSpotPrice") or lowest.get("uninterruptablePrice")
+
+
+# ------------------------------------------
+# RATE LIMIT
+# ------------------------------------------
+class TokenBucket:
+    """Token bucket seguro entre hilos. acquire() bloquea hasta que hay ficha."""
+
+    def __init__(self, rate=RATE_LIMIT_PER_S, burst=RATE_LIMIT_BURST, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.updated = clock()
+        self.blocked_until = 0.0    # Tras un 429 nadie pide nada hasta esta hora
+        self.lock = threading.Lock()
+        self.waited_s = 0.0
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = self.clock()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if now >= self.blocked_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.blocked_until - now, (1 - self.tokens) / self.rate)
+                self.waited_s += wait
+            self.sleep(wait)
+
+    def penalize(self, seconds):
+        """RunPod nos ha frenado: se vacía el bucket y se bloquea a todos los hilos un rato."""
+        with self.lock:
+            self.tokens = 0.0
+            self.blocked_until = max(self.blocked_until, self.clock() + seconds)
+
+
+# ------------------------------------------
+# CLIENTE
+# ------------------------------------------
+class _TTLCache:
+    def __init__(self, ttl, clock):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = {}           # clave -> (valor, caduca)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None or self.clock() >= entry[1]:
+            return None
+        return entry[0]
+
+    def put(self, key, value):
+        self.entries[key] = (value, self.clock() + self.ttl)
+
+
+class _StatusCoalescer:
+    """Junta las consultas pod() simultáneas de varios hilos en una sola llamada agrupada."""
+
+    def __init__(self, fetch_many, window_s, sleep):
+        self.fetch_many = fetch_many
+        self.window_s = window_s
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.pending = {}           # pod_id -> Future
+        self.leader = False         # Hay un hilo esperando la ventana para lanzar el lote
+
+    def get(self, pod_id):
+        with self.lock:
+            future = self.pending.get(pod_id)
+            if future is None:
+                future = self.pending[pod_id] = concurrent.futures.Future()
+            lead = not self.leader
+            self.leader = True
+        if lead:
+            self.sleep(self.window_s)
+            with self.lock:
+                batch, self.pending, self.leader = self.pending, {}, False
+            try:
+                pods = self.fetch_many(list(batch))
+            except Exception as e:
+                for waiter in batch.values():
+                    waiter.set_exception(e)
+            else:
+                for batch_id, waiter in batch.items():
+                    waiter.set_result(pods.get(batch_id))
+        return future.result()
+
+
+class RunPodClient:
+    def __init__(self, api_key, url=RUNPOD_GRAPHQL_URL, timeout=API_TIMEOUT_S, retries=API_RETRIES,
+                 rate=RATE_LIMIT_PER_S, burst=RATE_LIMIT_BURST, catalog_ttl=CATALOG_TTL_S,
+                 poll_s=LIFECYCLE_POLL_S, clock=time.monotonic, sleep=time.sleep):
+        self.url = url
+        self.timeout = timeout
+        self.retries = retries
+        self.clock = clock
+        self.sleep = sleep
+        self.http = requests.Session()      # Keep-alive con la API
+        self.http.headers["Authorization"] = f"Bearer {api_key}"
+        self.bucket = TokenBucket(rate, burst, clock=clock, sleep=sleep)
+        self.catalog = _TTLCache(catalog_ttl, clock)
+        self.coalescer = _StatusCoalescer(self.pods, STATUS_BATCH_WINDOW_S, sleep)
+        self.events = PodEventStream(self, poll_s=poll_s)
+        self.requests = 0           # Peticiones HTTP reales (incluidos reintentos)
+        self.retried = 0
+        self.throttled = 0          # Respuestas 429
+        self.cache_hits = 0
+        self.pods_queried = 0       # Pods consultados (suma de todas las consultas agrupadas)
+        self.status_queries = 0     # Consultas de estado enviadas
+
+    # --- TRANSPORTE ---
+    def execute(self, query, variables=None, operation=None):
+        """Ejecuta una operación GraphQL con rate limit y reintentos. Devuelve "data"."""
+        payload = {"query": query, "variables": variables or {}}
+        if operation:
+            payload["operationName"] = operation
+        delay = API_BACKOFF_S
+        for attempt in range(self.retries + 1):
+            self.bucket.acquire()
+            self.requests += 1
+            retry_after = None
+            try:
+                response = self.http.post(self.url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                # Conexión, timeout, respuesta cortada (ChunkedEncodingError)...: todo es reintentable
+                error = RunPodAPIError(f"{operation or 'GraphQL'}: {e}")
+            else:
+                if response.status_code == 429 or response.status_code >= 500:
+                    error = RunPodAPIError(f"{operation or 'GraphQL'}: HTTP {response.status_code}",
+                                           status=response.status_code)
+                    if response.status_code == 429:
+                        self.throttled += 1
+                        retry_after = _retry_after(response)
+                        self.bucket.penalize(retry_after or delay)
+                elif response.status_code != 200:
+                    raise RunPodAPIError(f"{operation or 'GraphQL'}: HTTP {response.status_code} "
+                                         f"{response.text[:200]}", status=response.status_code)
+                else:
+                    body = _json_body(response)
+                    if body is None:
+                        # Un 200 que no es JSON (proxy, página de mantenimiento, cuerpo cortado): como una caída
+                        error = RunPodAPIError(f"{operation or 'GraphQL'}: respuesta no JSON "
+                                               f"{response.text[:200]!r}", status=response.status_code)
+                    else:
+                        if body.get("errors"):
+                            messages = "; ".join(error.get("message", "?") for error in body["errors"])
+                            raise RunPodAPIError(f"{operation or 'GraphQL'}: {messages}")
+                        return body.get("data") or {}
+            if attempt == self.retries:
+                raise error
+            self.retried += 1
+            # Jitter: los hilos frenados a la vez no vuelven todos en el mismo instante
+            wait = retry_after if retry_after is not None else delay * random.uniform(0.5, 1.5)
+            logging.warning(f"RUNPOD API RETRY | {error} | intento {attempt + 1}/{self.retries} en {wait:.2f}s")
+            self.sleep(wait)
+            delay *= 2
+
+    # --- CONSULTAS ---
+    def user(self):
+        return _field(self.execute("query Myself { myself { id clientBalance } }", operation="Myself"),
+                      "myself", "Myself")
+
+    def gpu_types(self):
+        """Catálogo de GPUs (id, nombre, memoria). Cacheado."""
+        cached = self.catalog.get("gpu_types")
+        if cached is not None:
+            self.cache_hits += 1
+            return cached
+        gpus = self.execute("query GpuTypes { gpuTypes { id displayName memoryInGb } }",
+                            operation="GpuTypes").get("gpuTypes") or []
+        self.catalog.put("gpu_types", gpus)
+        return gpus
+
+    def gpus(self, gpu_ids):
+        """Detalle con precios de varias GPUs en una sola llamada. Cacheado por GPU."""
+        result, missing = {}, []
+        for gpu_id in gpu_ids:
+            cached = self.catalog.get(("gpu", gpu_id))
+            if cached is not None:
+                self.cache_hits += 1
+                result[gpu_id] = cached
+            else:
+                missing.append(gpu_id)
+        if missing:
+            data = self._aliased("GpuPrices", "g", "GpuTypeFilter", "gpuTypes", GPU_FIELDS,
+                                 [{"id": gpu_id} for gpu_id in missing])
+            for gpu_id, found in zip(missing, data):
+                gpu = found[0] if found else None
+                if gpu is not None:
+                    self.catalog.put(("gpu", gpu_id), gpu)
+                    result[gpu_id] = gpu
+        return result
+
+    def gpu(self, gpu_id):
+        return self.gpus([gpu_id]).get(gpu_id)
+
+    def gpu_prices(self, gpu_ids):
+        """$/h por id de GPU (solo las que traen precio)."""
+        return {gpu_id: float(gpu_price(gpu)) for gpu_id, gpu in self.gpus(gpu_ids).items() if gpu_price(gpu)}
+
+    def pods(self, pod_ids):
+        """Estado de varios Pods: {pod_id: pod | None}, en consultas de hasta STATUS_BATCH_MAX."""
+        pod_ids = list(dict.fromkeys(pod_ids))
+        result = {}
+        for start in range(0, len(pod_ids), STATUS_BATCH_MAX):
+            chunk = pod_ids[start:start + STATUS_BATCH_MAX]
+            self.status_queries += 1
+            self.pods_queried += len(chunk)
+            data = self._aliased("PodStatus", "p", "PodFilter", "pod", POD_FIELDS,
+                                 [{"podId": pod_id} for pod_id in chunk])
+            result.update(zip(chunk, data))
+        return result
+
+    def pod(self, pod_id):
+        """Estado de un Pod. Si otros hilos preguntan a la vez, va todo en la misma consulta."""
+        return self.coalescer.get(pod_id)
+
+    def _aliased(self, operation, prefix, input_type, field, fields, inputs):
+        """Una operación con un alias por entrada (p0: pod(input: $p0) {...}). Devuelve la lista en orden."""
+        names = [f"{prefix}{index}" for index in range(len(inputs))]
+        declarations = ", ".join(f"${name}: {input_type}" for name in names)
+        selections = "\n  ".join(f"{name}: {field}(input: ${name}) {{ {fields} }}" for name in names)
+        data = self.execute(f"query {operation}({declarations}) {{\n  {selections}\n}}",
+                            variables=dict(zip(names, inputs)), operation=operation)
+        return [data.get(name) for name in names]
+
+    # --- MUTACIONES (publican el cambio en el stream de eventos) ---
+    def create_pod(self, **pod_input):
+        data = self.execute("mutation CreatePod($input: PodFindAndDeployOnDemandInput) {\n"
+                            "  podFindAndDeployOnDemand(input: $input) { id desiredStatus imageName machineId }\n}",
+                            variables={"input": pod_input}, operation="CreatePod")
+        pod = _field(data, "podFindAndDeployOnDemand", "CreatePod")
+        if not pod.get("id"):
+            raise RunPodAPIError(f"CreatePod: respuesta sin id de Pod: {pod}")
+        self.events.publish(pod["id"], CREATED)
+        return pod
+
+    def resume_pod(self, pod_id, gpu_count=1):
+        data = self.execute("mutation ResumePod($input: PodResumeInput) {\n"
+                            "  podResume(input: $input) { id desiredStatus }\n}",
+                            variables={"input": {"podId": pod_id, "gpuCount": gpu_count}}, operation="ResumePod")
+        pod = _field(data, "podResume", "ResumePod")
+        self.events.publish(pod_id, BOOTING)
+        return pod
+
+    def stop_pod(self, pod_id):
+        data = self.execute("mutation StopPod($input: PodStopInput) {\n"
+                            "  podStop(input: $input) { id desiredStatus }\n}",
+                            variables={"input": {"podId": pod_id}}, operation="StopPod")
+        pod = _field(data, "podStop", "StopPod")
+        self.events.publish(pod_id, STOPPED)
+        return pod
+
+    def terminate_pod(self, pod_id):
+        self.execute("mutation TerminatePod($input: PodTerminateInput) {\n  podTerminate(input: $input)\n}",
+                     variables={"input": {"podId": pod_id}}, operation="TerminatePod")
+        self.events.publish(pod_id, TERMINATED)
+
+    def stats(self):
+        return {"requests": self.requests, "retries": self.retried, "throttled": self.throttled,
+                "cache_hits": self.cache_hits, "status_queries": self.status_queries,
+                "pods_queried": self.pods_queried, "rate_wait_s": round(self.bucket.waited_s, 3)}
+
+
+def _field(data, name, operation):
+    """data[name] de una respuesta; si falta o viene a null (sin "errors") es un fallo de la API, no un KeyError."""
+    value = data.get(name)
+    if value is None:
+        raise RunPodAPIError(f"{operation}: respuesta sin '{name}'")
+    return value
+
+
+def _json_body(response):
+    """Cuerpo JSON (dict) de la respuesta, o None si no lo es."""
+    try:
+        body = response.json()
+    except (ValueError, requests.RequestException):
+        return None
+    return body if isinstance(body, dict) else None
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+# ------------------------------------------
+# STREAM DE CICLO DE VIDA DE LOS PODS
+# ------------------------------------------
+class PodEventStream:
+    """
+    Estado de cada Pod conocido y suscriptores a sus cambios. Las mutaciones del cliente
+    publican al momento; un hilo vigila el resto (arranque terminado, paradas externas)
+    con una consulta agrupada cada poll_s mientras queden Pods vivos.
+    """
+
+    def __init__(self, client, poll_s=LIFECYCLE_POLL_S):
+        self.client = client
+        self.poll_s = poll_s
+        self.states = {}            # pod_id -> último estado publicado
+        self.addresses = {}         # pod_id -> ip:puerto cuando está READY
+        self.subscribers = []       # (callback, loop)
+        self.lock = threading.Lock()
+        self.published = 0
+        self._thread = None
+        self._stop = threading.Event()
+
+    def subscribe(self, callback, loop=None):
+        """callback(event) por cada cambio. Con loop, se entrega en ese event loop (thread-safe).
+        Devuelve la función para darse de baja."""
+        entry = (callback, loop)
+        with self.lock:
+            self.subscribers.append(entry)
+
+        def unsubscribe():
+            with self.lock:
+                if entry in self.subscribers:
+                    self.subscribers.remove(entry)
+        return unsubscribe
+
+    def state(self, pod_id):
+        return self.states.get(pod_id)
+
+    def publish(self, pod_id, state, address=None):
+        with self.lock:
+            if self.states.get(pod_id) == state and self.addresses.get(pod_id) == address:
+                return
+            if state == TERMINATED:
+                self.states.pop(pod_id, None)
+                self.addresses.pop(pod_id, None)
+            else:
+                self.states[pod_id] = state
+                self.addresses[pod_id] = address
+            subscribers = list(self.subscribers)
+            self.published += 1
+            alive = any(s not in (STOPPED, TERMINATED) for s in self.states.values())
+        event = {"event": "POD_LIFECYCLE", "pod_id": pod_id, "state": state, "address": address}
+        logging.info(json.dumps(event))
+        for callback, loop in subscribers:
+            if loop is None:
+                callback(event)
+            elif not loop.is_closed():
+                try:
+                    loop.call_soon_threadsafe(callback, event)
+                except RuntimeError:
+                    pass        # El loop se cerró entre medias
+        if alive:
+            self._ensure_watcher()
+
+    def poll(self):
+        """Una consulta agrupada para todos los Pods vivos; publica los cambios. Devuelve cuántos."""
+        with self.lock:
+            watched = [pod_id for pod_id, state in self.states.items() if state not in (STOPPED, TERMINATED)]
+        if not watched:
+            return 0
+        pods = self.client.pods(watched)
+        changes = 0
+        for pod_id in watched:
+            pod = pods.get(pod_id)
+            state = lifecycle_state(pod)
+            address = pod_address(pod)
+            if state != self.states.get(pod_id) or address != self.addresses.get(pod_id):
+                self.publish(pod_id, state, address)
+                changes += 1
+        return changes
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_s + 1)
+
+    def _ensure_watcher(self):
+        with self.lock:
+            if self._thread is not None or self._stop.is_set():
+                return
+            self._thread = threading.Thread(target=self._watch, name="runpod-lifecycle", daemon=True)
+            self._thread.start()
+
+    def _watch(self):
+        try:
+            while not self._stop.wait(self.poll_s):
+                try:
+                    self.poll()
+                except Exception as e:
+                    # Ni un fallo de la API ni el de un suscriptor pueden dejar parado al vigilante
+                    print(f"⚠️ No se pudo consultar el estado de los Pods: {e}")
+                with self.lock:
+                    if not any(state not in (STOPPED, TERMINATED) for state in self.states.values()):
+                        return
+        finally:
+            with self.lock:
+                self._thread = None
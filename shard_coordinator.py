@@ -0,0 +1,65 @@
+import hashlib
+import json
+import logging
+
+from job_queue import shard_index
+
+# ==========================================
+# COORDINADOR DE SHARDS -> GRUPOS DE PODS
+# ==========================================
+# La cola pendiente se reparte en shards por hash del prompt (ShardedJobQueue). Aquí
+# se decide qué grupo de Pods "es dueño" de cada shard, con rendezvous hashing: cada
+# shard elige los SHARD_GROUP_SIZE Pods listos con mayor peso hash(shard, pod). Cuando
+# entra o sale un Pod solo cambian de grupo los shards que le tocaban a él.
+# El despachador prefiere el grupo dueño del lote y llena el lote de cada Pod primero con
+# jobs de sus shards (así un prompt que se repite vuelve al Pod que ya tiene su texto
+# codificado en la caché de nodos de ComfyUI). Es solo preferencia: si el grupo está
+# lleno o enfermo el lote sale por cualquier otro Pod.
+
+SHARD_GROUP_SIZE = 2         # Pods dueños de cada shard
+
+
+def _weight(shard, pod_id):
+    return int.from_bytes(hashlib.md5(f"{shard}:{pod_id}".encode()).digest()[:8], "big")
+
+
+class ShardCoordinator:
+    def __init__(self, shards, group_size=SHARD_GROUP_SIZE):
+        self.shards = shards
+        self.group_size = group_size
+        self.fleet = frozenset()
+        self.groups = [()] * shards    # shard -> Pods dueños
+        self.rebalances = 0
+
+    def rebalance(self, pod_ids):
+        """Reparte los shards entre los Pods listos. Devuelve cuántos shards cambiaron de grupo."""
+        fleet = frozenset(pod_ids)
+        if fleet == self.fleet:
+            return 0
+        groups = [
+            tuple(sorted(fleet, key=lambda pod_id: _weight(shard, pod_id), reverse=True)[:self.group_size])
+            for shard in range(self.shards)
+        ]
+        moved = sum(1 for old, new in zip(self.groups, groups) if set(old) != set(new))
+        self.fleet = fleet
+        self.groups = groups
+        self.rebalances += 1
+        logging.info(json.dumps({
+            "event": "SHARDS_REBALANCED",
+            "pods": len(fleet),
+            "shards": self.shards,
+            "moved": moved,
+        }))
+        return moved
+
+    def pods_for(self, prompt_hash):
+        """Grupo de Pods preferido para un prompt (vacío si aún no hay Pods listos)."""
+        return self.groups[shard_index(prompt_hash, self.shards)]
+
+    def shards_of(self, pod_id):
+        return [shard for shard, group in enumerate(self.groups) if pod_id in group]
+
+    def owned_by(self, pod_id):
+        """Predicado job -> ¿es de un shard de este Pod? (para llenar su lote con lo suyo primero)."""
+        shards = set(self.shards_of(pod_id))
+        return lambda job: shard_index(job.prompt_hash, self.shards) in shards
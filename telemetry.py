@@ -0,0 +1,325 @@
+import atexit
+import bisect
+import json
+import logging
+import logging.handlers
+import math
+import queue
+import time
+from collections import deque
+
+from aiohttp import web
+
+# ==========================================
+# TELEMETRÍA: MÉTRICAS, LOGS Y TRAZAS
+# ==========================================
+# Hasta ahora solo había prints y una escritura síncrona a production.log por evento.
+#  - Métricas estilo Prometheus (contadores, gauges e histogramas) servidas en
+#    http://127.0.0.1:METRICS_PORT/metrics. Incrementar u observar cuesta unos cientos
+#    de ns; los gauges que son "estado" (profundidad de cola, Pods, gasto) se leen
+#    solo cuando alguien consulta /metrics.
+#  - Logging a través de una QueueHandler: el hilo del orquestador solo encola el
+#    registro y un QueueListener en segundo plano escribe el fichero.
+#  - Trazas opcionales por job (submit -> cola -> execute_on_pod -> completado) en un
+#    buffer circular, exportables en formato Chrome Trace en /traces. Desactivadas,
+#    cada span es una comprobación de un booleano.
+
+METRICS_PORT = 9188           # Puerto local del endpoint /metrics
+METRICS_PREFIX = "orquestador_"
+TRACE_MAX_SPANS = 10_000      # Spans guardados (los más viejos se descartan)
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Buckets (segundos) pensados para tiempos de GPU de segundos a minutos
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+FAST_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{str(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+# ------------------------------------------
+# MÉTRICAS
+# ------------------------------------------
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self.value = 0
+        self.children = {}        # valores de etiquetas -> Counter
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.children[values] = Counter(self.name, self.help)
+        return child
+
+    def samples(self):
+        if self.label_names:
+            for values, child in self.children.items():
+                yield self.name, _format_labels(self.label_names, values), child.value
+        else:
+            yield self.name, "", self.value
+
+
+class Gauge:
+    kind = "gauge"
+
+    def __init__(self, name, help_text, fn=None):
+        self.name = name
+        self.help = help_text
+        self.fn = fn              # Si hay fn, el valor se calcula al consultar /metrics
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def samples(self):
+        yield self.name, "", self.fn() if self.fn else self.value
+
+
+class CallbackCounter(Gauge):
+    """Contador que ya lleva otro objeto (p. ej. WorkerPool.created): se lee al consultar."""
+    kind = "counter"
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)    # El último es +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        cumulative = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            cumulative += count
+            yield self.name + "_bucket", '{le="' + _format_value(bound) + '"}', cumulative
+        yield self.name + "_sum", "", self.sum
+        yield self.name + "_count", "", self.count
+
+
+class MetricsRegistry:
+    def __init__(self, prefix=METRICS_PREFIX):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(self.prefix + name, help_text, labels))
+
+    def gauge(self, name, help_text, fn=None):
+        return self._add(Gauge(self.prefix + name, help_text, fn))
+
+    def callback_counter(self, name, help_text, fn):
+        return self._add(CallbackCounter(self.prefix + name, help_text, fn))
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(self.prefix + name, help_text, buckets))
+
+    def render(self):
+        """Formato de texto de Prometheus (0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class OrchestratorMetrics:
+    """Las métricas del orquestador. Los gauges de estado leen directamente del QueueOrchestrator."""
+
+    def __init__(self, orch, registry=None):
+        r = self.registry = registry or MetricsRegistry()
+        # Flujo de jobs
+        self.submitted = r.counter("jobs_submitted_total", "Jobs aceptados en la cola")
+        self.rejected = r.counter("jobs_rejected_total", "Envíos rechazados", labels=("reason",))
+        self.coalesced = r.counter("jobs_coalesced_total", "Duplicados adjuntados a un job en vuelo")
+        self.cache_hits = r.counter("jobs_cache_hits_total", "Jobs servidos desde la caché de resultados")
+        self.completed = r.counter("jobs_completed_total", "Jobs terminados con éxito")
+        self.retries = r.counter("job_retries_total", "Reintentos programados")
+        self.dead = r.counter("jobs_dead_total", "Jobs enviados a la DLQ")
+        self.infra_requeues = r.counter("job_infra_requeues_total",
+                                        "Jobs devueltos a la cola por fallos del Pod/red (sin gastar reintentos)")
+        self.prompts = r.counter("comfy_prompts_total", "Prompts enviados a ComfyUI (un lote cuenta uno)")
+        # Latencias
+        self.dispatch_latency = r.histogram("dispatch_latency_seconds",
+                                            "Desde que se acepta el job hasta que se envía a ComfyUI")
+        self.first_gpu = r.histogram("time_to_first_gpu_seconds",
+                                     "Desde el envío a ComfyUI hasta execution_start (cola del Pod)")
+        self.render_time = r.histogram("render_seconds", "Tiempo de GPU por prompt (execution_start -> success)")
+        self.job_latency = r.histogram("job_latency_seconds", "Desde que se acepta el job hasta que termina")
+        self.submit_time = r.histogram("submit_seconds", "Coste de submit() (validación + encolado)", FAST_BUCKETS)
+        # Descarga de resultados (output_store.py)
+        self.output_files = r.counter("output_files_total", "Imágenes descargadas y guardadas")
+        self.output_bytes = r.counter("output_bytes_total", "Bytes de imágenes guardados")
+        self.output_fetch = r.histogram("output_fetch_seconds", "Descarga de las imágenes de un lote")
+        # Estado (se lee al consultar /metrics)
+        r.gauge("queue_depth", "Jobs pendientes (cola + lotes en formación)",
+                lambda: len(orch.pending_queue) + len(orch.batcher))
+        r.gauge("jobs_in_flight", "Jobs ejecutándose en algún Pod", lambda: len(orch.active_jobs) - orch.fetching_jobs)
+        r.gauge("jobs_fetching", "Jobs renderizados con imágenes aún descargándose", lambda: orch.fetching_jobs)
+        r.gauge("jobs_retry_wait", "Jobs esperando su backoff", lambda: len(orch.retry_scheduler))
+        r.gauge("dlq_size", "Jobs en la Dead Letter Queue", lambda: len(orch.dead_letter_queue))
+        r.gauge("pods", "Pods en la flota (arrancando, listos o drenando)", lambda: len(orch.pool.pods))
+        r.gauge("pods_warm", "Pods parados en la reserva caliente", lambda: len(orch.pool.warm))
+        r.callback_counter("pods_created_total", "Pods creados", lambda: orch.pool.created)
+        r.callback_counter("pods_resumed_total", "Pods reanudados desde la reserva", lambda: orch.pool.resumed)
+        r.callback_counter("model_swaps_total", "Cambios de checkpoint en VRAM", lambda: orch.pool.model_swaps)
+        r.gauge("pods_circuit_open", "Pods con el circuito abierto o a prueba", lambda: orch.pool.health.open_count())
+        r.callback_counter("pod_circuit_opens_total", "Aperturas del circuit breaker", lambda: orch.pool.health.opens)
+        r.callback_counter("pods_replaced_total", "Pods retirados por degradados", lambda: orch.pool.health.replaced)
+        r.callback_counter("pod_infra_failures_total", "Fallos de infraestructura registrados",
+                           lambda: orch.pool.health.infra_failures)
+        r.gauge("spend_usd", "Gasto medido del día ($)", lambda: round(orch.total_spent_today, 6))
+        r.gauge("budget_usd", "Presupuesto diario ($)", lambda: orch.budget)
+
+
+# ------------------------------------------
+# TRAZAS
+# ------------------------------------------
+class Tracer:
+    """Spans por job en un buffer circular. enabled=False -> span() no hace nada."""
+
+    def __init__(self, enabled=False, max_spans=TRACE_MAX_SPANS):
+        self.enabled = enabled
+        self.spans = deque(maxlen=max_spans)
+
+    def span(self, trace_id, name, start, end, **attrs):
+        if self.enabled:
+            self.spans.append((trace_id, name, start, end, attrs))
+
+    def export(self):
+        """Formato Chrome Trace (chrome://tracing, Perfetto): una fila por job."""
+        return {"traceEvents": [
+            {"name": name, "ph": "X", "ts": round(start * 1e6), "dur": round(max(0.0, end - start) * 1e6),
+             "pid": 1, "tid": trace_id, "args": attrs}
+            for trace_id, name, start, end, attrs in self.spans
+        ]}
+
+
+# ------------------------------------------
+# ENDPOINT HTTP
+# ------------------------------------------
+class MetricsServer:
+    """GET /metrics (Prometheus) y GET /traces (JSON) en el event loop del orquestador."""
+
+    def __init__(self, registry, tracer=None):
+        self.registry = registry
+        self.tracer = tracer
+        self.runner = None
+        self.url = None
+
+    async def start(self, host="127.0.0.1", port=METRICS_PORT):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        app.router.add_get("/traces", self.handle_traces)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        real_port = self.runner.addresses[0][1]     # El puerto real si se pidió el 0 (tests, demos)
+        self.url = f"http://{host}:{real_port}"
+        print(f"📈 Métricas en {self.url}/metrics")
+        return self.url
+
+    async def stop(self):
+        if self.runner:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def handle_metrics(self, request):
+        return web.Response(text=self.registry.render(), headers={"Content-Type": PROMETHEUS_CONTENT_TYPE})
+
+    async def handle_traces(self, request):
+        if self.tracer is None:
+            raise web.HTTPNotFound()
+        return web.json_response(self.tracer.export())
+
+
+# ------------------------------------------
+# LOGGING NO BLOQUEANTE
+# ------------------------------------------
+def setup_logging(filename, level=logging.INFO, fmt=LOG_FORMAT):
+    """
+    Como logging.basicConfig(filename=...) pero el fichero lo escribe un hilo aparte:
+    el llamador solo encola el registro. Si el logging ya estaba configurado, no toca nada.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    records = queue.SimpleQueue()
+    file_handler = logging.FileHandler(filename)
+    file_handler.setFormatter(logging.Formatter(fmt))
+    listener = logging.handlers.QueueListener(records, file_handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    listener.start()
+    atexit.register(listener.stop)      # Vacía la cola al salir
+    return listener
+
+
+# ==========================================
+# ZONA DE TEST
+# ==========================================
+if __name__ == "__main__":
+    # Coste por evento de cada primitiva (objetivo: pocos µs)
+    N = 200_000
+    registry = MetricsRegistry()
+    counter = registry.counter("demo_total", "demo")
+    histogram = registry.histogram("demo_seconds", "demo")
+    tracer_on, tracer_off = Tracer(enabled=True), Tracer(enabled=False)
+
+    def medir(nombre, fn):
+        start = time.perf_counter()
+        for i in range(N):
+            fn(i)
+        print(f"   {nombre:<28} {(time.perf_counter() - start) / N * 1e9:7.0f} ns/evento")
+
+    print(f"⏱️ Coste de instrumentación ({N:,} eventos)")
+    medir("Counter.inc", lambda i: counter.inc())
+    medir("Histogram.observe", lambda i: histogram.observe(i % 700 / 10))
+    medir("Tracer.span (desactivado)", lambda i: tracer_off.span(i, "job", 0.0, 1.0))
+    medir("Tracer.span (activado)", lambda i: tracer_on.span(i, "job", 0.0, 1.0, pod="POD-1"))
+    logger = logging.getLogger("demo")
+    logger.propagate = False
+    records = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    medir("logging vía QueueHandler", lambda i: logger.info(json.dumps({"event": "DEMO", "i": i})))
+    print(registry.render().splitlines()[0])
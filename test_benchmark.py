@@ -0,0 +1,65 @@
+import asyncio
+import csv
+import json
+
+import benchmark
+
+# ==========================================
+# TESTS: GENERADOR DE CARGA (benchmark.py)
+# ==========================================
+# Bucle cerrado y abierto contra un ComfyUI falso, resumen de latencias por percentil
+# y exportación JSON/CSV.
+
+
+def run_fake(**options):
+    options.setdefault("requests", 6)
+    options.setdefault("warmup", 1)
+    options.setdefault("poll_interval", 0.02)
+    return asyncio.run(benchmark.run_against_fake(0.05, **options))
+
+
+def test_bucle_cerrado_mide_todas_las_peticiones():
+    report = run_fake(mode="closed", clients=3)
+    summary = report["summary"]
+    assert summary["requests"] == 6
+    assert summary["warmup_excluded"] == 1
+    assert summary["errors"] == 0
+    assert summary["images"] >= 6
+    latency = summary["latency_s"]
+    assert 0 < latency["p50"] <= latency["p90"] <= latency["p99"] <= latency["max"]
+    assert len(report["requests"]) == 7               # Las de calentamiento se guardan, pero no cuentan
+
+
+def test_bucle_abierto_a_tasa_fija():
+    report = run_fake(mode="open", rate=20.0, arrivals="uniform", seed=1)
+    assert report["config"]["mode"] == "open"
+    assert report["summary"]["requests"] == 6
+    assert report["summary"]["errors"] == 0
+    assert report["summary"]["images_per_min"] > 0
+
+
+def test_resumen_excluye_calentamiento_y_errores():
+    results = [
+        {"index": 0, "warmup": True, "ok": True, "sent_at_s": 0.0, "finished_at_s": 9.0, "latency_s": 9.0,
+         "queue_s": None, "gpu_s": None, "overhead_s": None, "images": 1},
+        {"index": 1, "warmup": False, "ok": True, "sent_at_s": 1.0, "finished_at_s": 2.0, "latency_s": 1.0,
+         "queue_s": 0.1, "gpu_s": 0.8, "overhead_s": 0.1, "images": 1},
+        {"index": 2, "warmup": False, "ok": False, "sent_at_s": 1.5, "finished_at_s": 1.6, "latency_s": 0.1,
+         "queue_s": None, "gpu_s": None, "overhead_s": None, "images": 0},
+    ]
+    summary = benchmark.summarize(results, warmup=1)
+    assert summary["requests"] == 2
+    assert summary["errors"] == 1
+    assert summary["latency_s"]["max"] == 1.0
+    assert summary["window_s"] == 1.0
+
+
+def test_exporta_json_y_csv(tmp_path):
+    report = run_fake(mode="closed", clients=2, requests=3)
+    json_path, csv_path = tmp_path / "run.json", tmp_path / "run.csv"
+    benchmark.export(report, json_path=str(json_path), csv_path=str(csv_path))
+    assert json.loads(json_path.read_text())["summary"]["requests"] == 3
+    with open(csv_path, newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [int(row["index"]) for row in rows] == [0, 1, 2, 3]
+    benchmark.compare([str(json_path)])
@@ -0,0 +1,48 @@
+import asyncio
+import os
+import subprocess
+import sys
+
+import fake_comfyui
+
+# ==========================================
+# TESTS: ORQUESTADOR CONTRA EL COMFYUI FALSO
+# ==========================================
+# La demo de fake_comfyui.py de punta a punta: envío, micro-batching, WebSocket (o
+# polling de respaldo), descarga de las imágenes y cierre limpio del motor.
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def run_demo(num_jobs, **options):
+    options.setdefault("render_time", 0.05)
+    options.setdefault("failure_rate", 0.0)
+    options.setdefault("overhead", 0.01)
+    return asyncio.run(fake_comfyui.demo(num_jobs, **options))
+
+
+def test_demo_completa_todos_los_jobs(tmp_path):
+    sistema = run_demo(8, outputs_dir=str(tmp_path))
+    assert len(sistema.completed_jobs) == 8
+    assert not sistema.dead_letter_queue
+    assert not sistema.active_jobs
+    # Cada job tiene sus imágenes guardadas dentro del directorio de salida
+    for job in sistema.completed_jobs:
+        assert job.status == "COMPLETED"
+        assert job.result
+        for path in job.result:
+            assert os.path.isfile(path)
+            assert os.path.commonpath([str(tmp_path), path]) == str(tmp_path)
+
+
+def test_demo_sin_websocket_termina_por_polling():
+    sistema = run_demo(4, websocket=False)
+    assert len(sistema.completed_jobs) == 4
+    assert not sistema.dead_letter_queue
+
+
+def test_demo_por_linea_de_comandos():
+    result = subprocess.run([sys.executable, "fake_comfyui.py", "--demo", "6", "--render-time", "0.05"],
+                            cwd=_BASE_DIR, capture_output=True, text=True, timeout=120)
+    assert result.returncode == 0, result.stderr
+    assert "completados: 6, DLQ: 0" in result.stdout
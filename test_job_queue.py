@@ -0,0 +1,60 @@
+from types import SimpleNamespace
+
+import pytest
+
+from job_queue import PriorityJobQueue, PRIORIDAD_ALTA, PRIORIDAD_BAJA, PRIORIDAD_NORMAL
+
+# ==========================================
+# TESTS: COLA CON PRIORIDADES Y REPARTO JUSTO
+# ==========================================
+# La prioridad manda sobre el orden de llegada y, dentro de un nivel, los tenants se
+# turnan: una avalancha de un cliente no deja sin servicio a los demás.
+
+
+def job(name, tenant="default", priority=PRIORIDAD_NORMAL):
+    return SimpleNamespace(id=name, tenant=tenant, priority=priority)
+
+
+def drain(queue):
+    return [queue.pop().id for _ in range(len(queue))]
+
+
+def test_avalancha_de_un_tenant_no_bloquea_a_otro():
+    queue = PriorityJobQueue()
+    for i in range(1000):
+        queue.push(job(f"a{i}", tenant="a"))
+    queue.push(job("b0", tenant="b"))
+    queue.push(job("b1", tenant="b"))
+    first = [queue.pop().id for _ in range(4)]
+    assert first == ["a0", "b0", "a1", "b1"]          # Round-robin, no los 1000 de "a" antes
+    assert len(queue) == 998
+
+
+def test_fifo_dentro_de_cada_tenant():
+    queue = PriorityJobQueue()
+    for name, tenant in [("a0", "a"), ("a1", "a"), ("b0", "b"), ("a2", "a"), ("c0", "c")]:
+        queue.push(job(name, tenant=tenant))
+    assert drain(queue) == ["a0", "b0", "c0", "a1", "a2"]
+
+
+def test_prioridad_gana_al_orden_de_llegada():
+    queue = PriorityJobQueue()
+    queue.push(job("baja", priority=PRIORIDAD_BAJA))
+    queue.push(job("normal", priority=PRIORIDAD_NORMAL))
+    queue.push(job("alta", priority=PRIORIDAD_ALTA))
+    assert queue.head_priority() == PRIORIDAD_ALTA
+    assert drain(queue) == ["alta", "normal", "baja"]
+
+
+def test_push_front_conserva_el_turno_del_reintento():
+    queue = PriorityJobQueue()
+    queue.push(job("a0", tenant="a"))
+    queue.push_front(job("reintento", tenant="b"))
+    assert drain(queue) == ["reintento", "a0"]
+
+
+def test_pop_vacia():
+    queue = PriorityJobQueue()
+    assert not queue and queue.head_priority() is None
+    with pytest.raises(IndexError):
+        queue.pop()
@@ -0,0 +1,49 @@
+import os
+
+from fake_comfyui import LocalBackend
+from job_store import JobStore
+from queue_system import QueueOrchestrator
+
+# ==========================================
+# TESTS: ALMACÉN PERSISTENTE Y RECUPERACIÓN
+# ==========================================
+# Se encolan jobs, el proceso "muere" con uno en vuelo y otro terminado, y un
+# orquestador nuevo sobre el mismo jobs.db (WAL) retoma la cola.
+
+
+def orchestrator(path):
+    return QueueOrchestrator(backend=LocalBackend("127.0.0.1:1"), job_store=JobStore(path), budget=1e9)
+
+
+def test_reinicio_reencola_lo_que_estaba_en_vuelo_y_no_repite_lo_terminado(tmp_path):
+    path = os.path.join(tmp_path, "jobs.db")
+    sistema = orchestrator(path)
+    ids = [sistema.submit_job(prompt) for prompt in ("Un faro de noche", "Un bosque nevado", "Un velero")]
+    assert all(ids)
+
+    running = sistema.pending_queue.pop()
+    running.status = "PROCESSING"
+    sistema.active_jobs[running.id] = running
+    sistema._persist(running)
+
+    done = sistema.pending_queue.pop()
+    done.status = "PROCESSING"
+    sistema.active_jobs[done.id] = done
+    sistema.complete_job(done, ["RunPod_Result_00001_.png"])
+
+    waiting = sistema.pending_queue.pop()
+    # "Kill": lo encolado llega a disco, pero nadie cierra ordenadamente el orquestador
+    sistema.store.flush()
+
+    recovered = orchestrator(path)
+    try:
+        assert recovered.recover() == 2
+        pending = [recovered.pending_queue.pop() for _ in range(len(recovered.pending_queue))]
+        assert sorted(job.id for job in pending) == sorted([running.id, waiting.id])
+        assert all(job.status == "PENDING" for job in pending)
+        assert done.id not in {job.id for job in pending}               # COMPLETED no se vuelve a ejecutar
+        # Lo recuperado sigue deduplicando: repetir el prompt en vuelo no crea otro job
+        assert recovered.submit_job("Un faro de noche") == running.id
+    finally:
+        sistema.store.close()
+        recovered.store.close()
@@ -0,0 +1,82 @@
+from pod_health import (PodHealthMonitor, BREAKER_FAILURES, BREAKER_MAX_TRIPS, CLOSED, OPEN, HALF_OPEN)
+
+# ==========================================
+# TESTS: CIRCUIT BREAKER POR POD
+# ==========================================
+# CLOSED -> OPEN -> HALF_OPEN -> CLOSED con un reloj falso: el enfriamiento se
+# atraviesa moviendo el reloj, sin esperas reales.
+
+COOLDOWN_S = 30
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def monitor():
+    clock = FakeClock()
+    return PodHealthMonitor(clock=clock, cooldown_s=COOLDOWN_S), clock
+
+
+def trip(health, pod_id="pod-1"):
+    for _ in range(BREAKER_FAILURES):
+        health.record_failure(pod_id, "HTTP 503")
+
+
+def test_umbral_de_fallos_seguidos_abre_el_circuito():
+    health, _ = monitor()
+    for _ in range(BREAKER_FAILURES - 1):
+        health.record_failure("pod-1", "HTTP 503")
+    assert health.get("pod-1").state == CLOSED
+    assert health.allows("pod-1")
+    health.record_failure("pod-1", "HTTP 503")
+    assert health.get("pod-1").state == OPEN
+    assert not health.allows("pod-1")
+    assert health.opens == 1
+    assert health.allows("pod-2")                     # El resto de la flota no se ve afectado
+
+
+def test_ciclo_completo_open_half_open_closed():
+    health, clock = monitor()
+    trip(health)
+    clock.now = COOLDOWN_S - 1
+    assert not health.allows("pod-1")                 # Aún enfriándose
+    clock.now = COOLDOWN_S
+    assert health.allows("pod-1", outstanding=0)
+    assert health.get("pod-1").state == HALF_OPEN
+    assert not health.allows("pod-1", outstanding=1)  # Un único job de prueba a la vez
+    health.record_success("pod-1", latency_s=1.0)
+    state = health.get("pod-1")
+    assert state.state == CLOSED
+    assert state.trips == 0 and state.cooldown == COOLDOWN_S
+    assert health.allows("pod-1", outstanding=5)
+
+
+def test_prueba_fallida_reabre_con_el_doble_de_enfriamiento():
+    health, clock = monitor()
+    trip(health)
+    clock.now = COOLDOWN_S
+    assert health.allows("pod-1")
+    health.record_failure("pod-1", "timeout")
+    state = health.get("pod-1")
+    assert state.state == OPEN
+    assert state.cooldown == 2 * COOLDOWN_S
+    clock.now += COOLDOWN_S
+    assert not health.allows("pod-1")
+    clock.now += COOLDOWN_S
+    assert health.allows("pod-1")
+
+
+def test_demasiadas_aperturas_seguidas_piden_reemplazo():
+    health, clock = monitor()
+    trip(health)
+    for _ in range(BREAKER_MAX_TRIPS - 1):
+        assert health.needs_replacement() == []
+        clock.now += 10 * COOLDOWN_S * BREAKER_MAX_TRIPS
+        assert health.allows("pod-1")
+        health.record_failure("pod-1", "timeout")
+    assert health.needs_replacement() == ["pod-1"]
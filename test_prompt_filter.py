@@ -0,0 +1,77 @@
+import pytest
+
+from prompt_filter import PromptFilter, normalize
+
+# ==========================================
+# TESTS: FILTRO DE PROMPTS
+# ==========================================
+# Normalización (acentos, leetspeak, puntuación) y límites de palabra del regex compilado.
+
+TERMINOS = ["violencia", "sangre", "nsfw", "droga", "desnudo"]
+
+
+@pytest.fixture
+def prompt_filter():
+    return PromptFilter(TERMINOS)
+
+
+@pytest.mark.parametrize("prompt, term", [
+    ("Quiero droga!", "droga"),
+    ("violencia!", "violencia"),
+    ("NSFW!", "nsfw"),
+    ("mucha sangre!!", "sangre"),
+    ("¿sangre?", "sangre"),
+    ("droga.", "droga"),
+    ("(violencia)", "violencia"),
+])
+def test_puntuacion_al_final_no_oculta_el_termino(prompt_filter, prompt, term):
+    assert prompt_filter.check(prompt) == (False, term)
+
+
+@pytest.mark.parametrize("prompt, term", [
+    ("Violéncia en la calle", "violencia"),
+    ("SANGRE", "sangre"),
+    ("desnúdo", "desnudo"),
+])
+def test_acentos_y_mayusculas(prompt_filter, prompt, term):
+    assert prompt_filter.check(prompt) == (False, term)
+
+
+@pytest.mark.parametrize("prompt, term", [
+    ("s4ngr3", "sangre"),
+    ("v!olencia", "violencia"),
+    ("dr0g@s", "droga"),
+    ("de$nudo", "desnudo"),
+    ("n$fw", "nsfw"),
+])
+def test_leetspeak(prompt_filter, prompt, term):
+    assert prompt_filter.check(prompt) == (False, term)
+
+
+@pytest.mark.parametrize("prompt, term", [
+    ("nsfw_content", "nsfw"),
+    ("contenido_con_sangre", "sangre"),
+    ("drogas", "droga"),
+    ("drogaes", "droga"),
+])
+def test_separadores_y_plurales(prompt_filter, prompt, term):
+    assert prompt_filter.check(prompt) == (False, term)
+
+
+@pytest.mark.parametrize("prompt", [
+    "hidrogado",
+    "ensangrentado atardecer",
+    "un gato azul!",
+    "precio: 5$ por imagen",
+    "hola@ejemplo",
+])
+def test_limites_de_palabra(prompt_filter, prompt):
+    assert prompt_filter.check(prompt) == (True, None)
+
+
+def test_normalize_solo_cambia_simbolos_entre_letras():
+    assert normalize("¡Hola!  M@ría_$ol 4") == "¡hola! maria $ol a"
+
+
+def test_validate_many_mantiene_el_orden(prompt_filter):
+    assert prompt_filter.validate_many(["un gato", "sangre!", "nsfw_x"]) == [None, "sangre", "nsfw"]
@@ -0,0 +1,47 @@
+import asyncio
+
+import pytest
+
+from fake_comfyui import FakeComfyUI, LocalBackend
+from queue_system import QueueOrchestrator, JobFailedError
+
+# ==========================================
+# TESTS: SINGLE-FLIGHT DE PROMPTS DUPLICADOS
+# ==========================================
+# Dos envíos idénticos comparten job, future y render en el ComfyUI falso; si el job
+# acaba en la DLQ el error les llega a todos los que esperan.
+
+
+async def submit_twice_and_run(failure_rate):
+    fake = FakeComfyUI(render_time=0.02, failure_rate=failure_rate, seed=1, overhead=0.0)
+    await fake.start()
+    try:
+        sistema = QueueOrchestrator(backend=LocalBackend(fake.address), backoff_factor=0.01)
+        first = sistema.submit("Un faro en la tormenta")
+        second = sistema.submit("  un FARO en la tormenta ")     # Misma clave normalizada
+        await sistema.process_queue_async(stop_when_idle=True)
+        results = await asyncio.gather(first.wait(), second.wait(), return_exceptions=True)
+        return sistema, fake, first, second, results
+    finally:
+        await fake.stop()
+
+
+def test_duplicados_comparten_future_y_un_solo_render():
+    sistema, fake, first, second, results = asyncio.run(submit_twice_and_run(failure_rate=0.0))
+    assert second.coalesced and not first.coalesced
+    assert first.job is second.job
+    assert first.job.future() is second.job.future()
+    assert fake.prompts_received == 1
+    assert len(sistema.completed_jobs) == 1
+    assert results[0] == results[1] == first.job.result
+    assert sistema.coalesced_total == 1
+
+
+def test_fallo_definitivo_llega_a_todos_los_que_esperan():
+    sistema, fake, first, second, results = asyncio.run(submit_twice_and_run(failure_rate=1.0))
+    assert first.job is second.job
+    assert first.job.status == "DEAD"
+    assert all(isinstance(result, JobFailedError) for result in results)
+    assert fake.prompts_received == first.job.retries            # Un render por intento, no por duplicado
+    with pytest.raises(JobFailedError):
+        second.result(timeout=1)
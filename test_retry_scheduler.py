@@ -0,0 +1,57 @@
+import random
+
+from retry_scheduler import RetryScheduler
+
+# ==========================================
+# TESTS: PLANIFICADOR DE REINTENTOS
+# ==========================================
+# Orden del heap por instante de elegibilidad, límites del jitter y next_due_in,
+# con un reloj falso (sin esperas reales).
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_salen_por_instante_de_elegibilidad_no_por_orden_de_llegada():
+    clock = FakeClock()
+    scheduler = RetryScheduler(jitter=0, clock=clock)
+    scheduler.schedule("lento", 8)
+    scheduler.schedule("rapido", 1)
+    scheduler.schedule("medio", 4)
+    assert scheduler.pop_due() == []
+    clock.now = 4
+    assert scheduler.pop_due() == ["rapido", "medio"]
+    assert len(scheduler) == 1
+    clock.now = 100
+    assert scheduler.pop_due() == ["lento"]
+    assert not scheduler
+
+
+def test_mismo_instante_respeta_el_orden_fifo():
+    scheduler = RetryScheduler(jitter=0, clock=FakeClock())
+    for job in ["a", "b", "c"]:
+        scheduler.schedule(job, 2)
+    assert scheduler.pop_due(now=2) == ["a", "b", "c"]
+
+
+def test_jitter_dentro_de_sus_limites():
+    scheduler = RetryScheduler(jitter=0.2, clock=FakeClock(), rng=random.Random(7))
+    delays = [scheduler.schedule(i, 10) for i in range(500)]
+    assert all(8 <= delay <= 12 for delay in delays)
+    assert max(delays) - min(delays) > 2              # Realmente reparte, no es un retardo fijo
+
+
+def test_next_due_in():
+    clock = FakeClock()
+    scheduler = RetryScheduler(jitter=0, clock=clock)
+    assert scheduler.next_due_in() is None
+    scheduler.schedule("a", 5)
+    scheduler.schedule("b", 3)
+    assert scheduler.next_due_in() == 3
+    clock.now = 10
+    assert scheduler.next_due_in() == 0.0             # Vencido: nunca negativo
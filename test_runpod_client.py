@@ -0,0 +1,273 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+import runpod_client
+from fake_runpod import FakeRunPodAPI, SimulatedRunPod
+from runpod_client import (RunPodClient, RunPodAPIError, TokenBucket, PodEventStream, _StatusCoalescer,
+                           BOOTING, READY, TERMINATED)
+
+# ==========================================
+# TESTS: CLIENTE GRAPHQL DE RUNPOD
+# ==========================================
+# Reintentos y rate limit con respuestas preparadas (reloj y sleep falsos, sin esperas
+# reales), consultas agrupadas contra FakeRunPodAPI y el stream de ciclo de vida.
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class FakeResponse:
+    def __init__(self, status_code=200, body=None, text=None, headers=None):
+        self.status_code = status_code
+        self.body = body
+        self.text = text if text is not None else str(body)
+        self.headers = headers or {}
+
+    def json(self):
+        if self.body is None:
+            raise ValueError("No JSON object could be decoded")
+        return self.body
+
+
+class FakeSession:
+    """Devuelve (o lanza) las respuestas preparadas en orden y guarda lo enviado."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.headers = {}
+        self.payloads = []
+
+    def post(self, url, json=None, timeout=None):
+        self.payloads.append(json)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+def scripted_client(responses, **options):
+    fake_time = FakeTime()
+    client = RunPodClient("clave", clock=fake_time.clock, sleep=fake_time.sleep, **options)
+    client.http = FakeSession(responses)
+    return client, fake_time
+
+
+def ready_pod(pod_id, ip="10.0.0.1", port=40001):
+    return {"id": pod_id, "desiredStatus": "RUNNING",
+            "runtime": {"ports": [{"ip": ip, "isIpPublic": True, "privatePort": 8188, "publicPort": port}]}}
+
+
+MYSELF = {"data": {"myself": {"id": "user-1", "clientBalance": 10.0}}}
+
+
+# ------------------------------------------
+# REINTENTOS Y RATE LIMIT
+# ------------------------------------------
+def test_429_respeta_retry_after_y_frena_el_bucket():
+    client, fake_time = scripted_client([FakeResponse(429, text="slow down", headers={"Retry-After": "2"}),
+                                         FakeResponse(200, MYSELF)])
+    assert client.user()["clientBalance"] == 10.0
+    assert client.throttled == 1
+    assert client.retried == 1
+    assert fake_time.sleeps == [2.0]                  # Ni backoff propio ni jitter: lo que pide RunPod
+    assert client.bucket.blocked_until == 2.0
+
+
+def test_penalize_bloquea_a_todos_hasta_que_vence():
+    fake_time = FakeTime()
+    bucket = TokenBucket(rate=10, burst=5, clock=fake_time.clock, sleep=fake_time.sleep)
+    bucket.acquire()
+    bucket.penalize(3.0)
+    bucket.acquire()
+    assert fake_time.now >= 3.0
+    assert bucket.waited_s >= 3.0
+
+
+def test_5xx_agota_reintentos_con_backoff():
+    client, fake_time = scripted_client([FakeResponse(503, text="busy")] * 3, retries=2)
+    with pytest.raises(RunPodAPIError) as error:
+        client.user()
+    assert error.value.status == 503
+    assert client.requests == 3
+    assert len(fake_time.sleeps) == 2
+    assert fake_time.sleeps[1] > fake_time.sleeps[0] * 0.3   # Backoff exponencial con jitter ±50%
+
+
+def test_cortes_de_red_y_cuerpos_no_json_se_reintentan():
+    client, _ = scripted_client([requests.exceptions.ChunkedEncodingError("respuesta cortada"),
+                                 FakeResponse(200, None, text="<html>mantenimiento</html>"),
+                                 FakeResponse(200, MYSELF)])
+    assert client.user()["id"] == "user-1"
+    assert client.retried == 2
+
+
+def test_4xx_no_se_reintenta():
+    client, fake_time = scripted_client([FakeResponse(401, text="Unauthorized")])
+    with pytest.raises(RunPodAPIError) as error:
+        client.user()
+    assert error.value.status == 401
+    assert fake_time.sleeps == []
+
+
+def test_mutacion_sin_payload_es_error_de_la_api():
+    client, _ = scripted_client([FakeResponse(200, {"data": {"podFindAndDeployOnDemand": None}})])
+    with pytest.raises(RunPodAPIError):
+        client.create_pod(name="worker")
+
+
+def test_rate_limit_real_de_la_api_simulada():
+    api = FakeRunPodAPI(SimulatedRunPod([]), rate_limit=3)
+    client = RunPodClient(api.api_key, url=api.start(), rate=100, burst=100)
+    try:
+        for _ in range(8):
+            assert client.user()["id"] == "user-sim"
+    finally:
+        api.stop()
+    assert api.throttled > 0
+    assert client.throttled == api.throttled
+
+
+# ------------------------------------------
+# CONSULTAS AGRUPADAS
+# ------------------------------------------
+def test_pods_agrupa_en_una_consulta_con_alias(monkeypatch):
+    monkeypatch.setattr(runpod_client, "STATUS_BATCH_MAX", 2)
+    sim = SimulatedRunPod([f"10.0.0.{i}:8188" for i in range(5)], boot_time=0)
+    pod_ids = [sim.create_worker_pod() for _ in range(5)]
+    api = FakeRunPodAPI(sim)
+    client = RunPodClient(api.api_key, url=api.start())
+    try:
+        pods = client.pods(pod_ids + ["POD-INEXISTENTE"])
+    finally:
+        api.stop()
+    assert api.operations["PodStatus"] == 3
+    assert api.pods_per_status_query == [2, 2, 2]
+    assert runpod_client.pod_address(pods[pod_ids[0]]) == "10.0.0.0:8188"
+    assert pods["POD-INEXISTENTE"] is None
+    assert client.stats()["status_queries"] == 3
+
+
+def test_pods_manda_un_alias_por_pod():
+    client, _ = scripted_client([FakeResponse(200, {"data": {"p0": ready_pod("a"), "p1": None}})])
+    pods = client.pods(["a", "b", "a"])
+    payload = client.http.payloads[0]
+    assert payload["operationName"] == "PodStatus"
+    assert "p0: pod(input: $p0)" in payload["query"] and "p1: pod(input: $p1)" in payload["query"]
+    assert payload["variables"] == {"p0": {"podId": "a"}, "p1": {"podId": "b"}}
+    assert pods == {"a": ready_pod("a"), "b": None}
+
+
+def test_coalescer_reparte_el_error_a_todos_los_que_esperan():
+    calls = []
+    barrier = threading.Barrier(5)
+
+    def fetch_many(pod_ids):
+        calls.append(sorted(pod_ids))
+        raise RunPodAPIError("API caída")
+
+    coalescer = _StatusCoalescer(fetch_many, window_s=0.2, sleep=time.sleep)
+
+    def get(pod_id):
+        barrier.wait()
+        return coalescer.get(pod_id)
+
+    with ThreadPoolExecutor(5) as executor:
+        futures = [executor.submit(get, f"pod-{i}") for i in range(5)]
+        for future in futures:
+            with pytest.raises(RunPodAPIError, match="API caída"):
+                future.result()
+    assert calls == [[f"pod-{i}" for i in range(5)]]     # Una sola llamada para los cinco hilos
+
+
+def test_coalescer_reparte_cada_resultado_a_su_pod():
+    coalescer = _StatusCoalescer(lambda pod_ids: {pod_id: {"id": pod_id} for pod_id in pod_ids},
+                                 window_s=0.05, sleep=time.sleep)
+    with ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(coalescer.get, ["a", "b", "c", "a"]))
+    assert [pod["id"] for pod in results] == ["a", "b", "c", "a"]
+
+
+# ------------------------------------------
+# CICLO DE VIDA DE LOS PODS
+# ------------------------------------------
+class StubClient:
+    def __init__(self, fail_first=0):
+        self.state = {}
+        self.calls = 0
+        self.fail_first = fail_first
+
+    def pods(self, pod_ids):
+        self.calls += 1
+        if self.calls <= self.fail_first:
+            raise ValueError("fallo inesperado")
+        return {pod_id: self.state.get(pod_id) for pod_id in pod_ids}
+
+
+def test_poll_publica_ready_y_terminated():
+    client = StubClient()
+    stream = PodEventStream(client, poll_s=3600)
+    events = []
+    stream.subscribe(events.append)
+    try:
+        stream.publish("pod-1", BOOTING)
+        client.state["pod-1"] = {"id": "pod-1", "desiredStatus": "RUNNING", "runtime": None}
+        assert stream.poll() == 0                     # Sigue arrancando: nada que publicar
+        client.state["pod-1"] = ready_pod("pod-1", ip="1.2.3.4", port=40000)
+        assert stream.poll() == 1
+        assert events[-1] == {"event": "POD_LIFECYCLE", "pod_id": "pod-1", "state": READY,
+                              "address": "1.2.3.4:40000"}
+        client.state["pod-1"] = None                  # Eliminado fuera del orquestador
+        assert stream.poll() == 1
+        assert events[-1]["state"] == TERMINATED
+        assert stream.state("pod-1") is None
+        assert stream.poll() == 0                     # Ya no queda ningún Pod vigilado
+    finally:
+        stream.close()
+    assert [event["state"] for event in events] == [BOOTING, READY, TERMINATED]
+
+
+def test_eventos_llegan_al_event_loop_suscrito():
+    client = StubClient()
+    stream = PodEventStream(client, poll_s=3600)
+
+    async def main():
+        received = asyncio.Queue()
+        stream.subscribe(received.put_nowait, asyncio.get_running_loop())
+        stream.publish("pod-1", BOOTING)
+        client.state["pod-1"] = ready_pod("pod-1")
+        await asyncio.to_thread(stream.poll)           # Desde otro hilo, como el vigilante
+        return [(await received.get())["state"] for _ in range(2)]
+
+    try:
+        assert asyncio.run(main()) == [BOOTING, READY]
+    finally:
+        stream.close()
+
+
+def test_vigilante_sobrevive_a_un_fallo_y_sigue_consultando():
+    client = StubClient(fail_first=2)
+    stream = PodEventStream(client, poll_s=0.01)
+    ready = threading.Event()
+    stream.subscribe(lambda event: event["state"] == READY and ready.set())
+    client.state["pod-1"] = ready_pod("pod-1")
+    try:
+        stream.publish("pod-1", BOOTING)
+        assert ready.wait(5)
+        assert client.calls >= 3
+    finally:
+        stream.close()
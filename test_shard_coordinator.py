@@ -0,0 +1,63 @@
+import hashlib
+from types import SimpleNamespace
+
+from shard_coordinator import ShardCoordinator
+
+# ==========================================
+# TESTS: REPARTO DE SHARDS CON RENDEZVOUS HASHING
+# ==========================================
+# Al entrar o salir un Pod solo cambian de grupo los shards que le tocan a él, y
+# pods_for / owned_by dan siempre la misma respuesta para un mismo prompt.
+
+SHARDS = 64
+PODS = [f"pod-{i}" for i in range(6)]
+
+
+def coordinator(pods, group_size=2):
+    shards = ShardCoordinator(SHARDS, group_size=group_size)
+    shards.rebalance(pods)
+    return shards
+
+
+def test_entrar_un_pod_solo_mueve_los_shards_que_gana():
+    shards = coordinator(PODS)
+    before = list(shards.groups)
+    moved = shards.rebalance(PODS + ["pod-nuevo"])
+    assert 0 < moved < SHARDS
+    for old, new in zip(before, shards.groups):
+        if set(old) != set(new):
+            # El nuevo entra desplazando a un único dueño; el otro se queda
+            assert "pod-nuevo" in new
+            assert len(set(old) & set(new)) == len(new) - 1
+        else:
+            assert "pod-nuevo" not in new
+
+
+def test_salir_un_pod_solo_mueve_los_shards_que_tenia():
+    shards = coordinator(PODS)
+    before = list(shards.groups)
+    moved = shards.rebalance([pod for pod in PODS if pod != "pod-3"])
+    assert moved == sum(1 for group in before if "pod-3" in group)
+    for old, new in zip(before, shards.groups):
+        if "pod-3" in old:
+            assert set(old) - {"pod-3"} <= set(new)   # El resto del grupo conserva el shard
+        else:
+            assert new == old
+
+
+def test_mismo_conjunto_de_pods_no_reparte():
+    shards = coordinator(PODS)
+    assert shards.rebalance(reversed(PODS)) == 0
+    assert shards.rebalances == 1
+
+
+def test_pods_for_y_owned_by_coinciden():
+    shards = coordinator(PODS)
+    jobs = [SimpleNamespace(prompt_hash=hashlib.sha256(f"prompt {i}".encode()).hexdigest()) for i in range(500)]
+    for pod_id in PODS:
+        owns = shards.owned_by(pod_id)
+        for job in jobs:
+            assert owns(job) == (pod_id in shards.pods_for(job.prompt_hash))
+    # Cada shard tiene group_size dueños y cada Pod se reparte alguno
+    assert all(len(group) == 2 for group in shards.groups)
+    assert all(shards.shards_of(pod_id) for pod_id in PODS)
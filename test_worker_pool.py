@@ -0,0 +1,94 @@
+import asyncio
+
+import fake_runpod
+from fake_runpod import SimulatedRunPod
+from worker_pool import WorkerPool, BOOTING, READY
+
+# ==========================================
+# TESTS: POOL DE PODS CON AUTO-SCALING
+# ==========================================
+# fake_runpod.demo: varios "Pods" (ComfyUI falsos) detrás de un RunPod simulado, con
+# arranques de verdad, reparto entre Pods y apagado al vaciarse la cola. Los arranques
+# atascados se prueban directamente sobre WorkerPool con un reloj falso.
+
+
+def run_demo(num_pods, num_jobs, **options):
+    options.setdefault("render_time", 0.05)
+    options.setdefault("boot_time", 0.2)
+    return asyncio.run(fake_runpod.demo(num_pods, num_jobs, **options))
+
+
+def test_escala_varios_pods_y_los_apaga():
+    sistema = run_demo(3, 30)
+    backend = sistema.backend
+    assert len(sistema.completed_jobs) == 30
+    assert not sistema.dead_letter_queue
+    assert 2 <= backend.created <= 3                  # La cola pide más de un Pod, nunca más de max_pods
+    assert len({job.pod_id for job in sistema.completed_jobs}) >= 2
+    assert not backend.running_pods()                 # stop_all al terminar: nada sigue facturando
+
+
+def test_pod_enfermo_no_pierde_jobs():
+    sistema = run_demo(2, 12, sick=True)
+    assert len(sistema.completed_jobs) == 12
+    assert not sistema.dead_letter_queue
+    assert sistema.pool.health.infra_failures > 0     # Los 503 del Pod enfermo no gastan reintentos del job
+
+
+def test_shards_reparten_por_grupo_de_pods():
+    sistema = run_demo(3, 24, shards=4)
+    assert len(sistema.completed_jobs) == 24
+    assert sistema.shards.rebalances >= 1
+
+
+# ------------------------------------------
+# ARRANQUES CON EVENTOS PERDIDOS O ATASCADOS
+# ------------------------------------------
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class SilentEventsRunPod(SimulatedRunPod):
+    """Ofrece stream de ciclo de vida pero nunca publica nada (todos los READY se pierden)."""
+
+    def subscribe_pod_events(self, callback, loop=None):
+        return lambda: None
+
+
+def booting_pool(boot_time, **options):
+    clock = FakeClock()
+    backend = SilentEventsRunPod(["10.0.0.1:8188", "10.0.0.2:8188"], boot_time=boot_time, clock=clock)
+    pool = WorkerPool(backend, max_pods=1, warm_size=0, clock=clock, **options)
+    pool.attach_events(None)
+    return pool, backend, clock
+
+
+def test_ready_perdido_se_recupera_consultando_despacio():
+    pool, backend, clock = booting_pool(boot_time=10, boot_poll_s=60)
+    asyncio.run(pool.autoscale(backlog=1, in_flight=0))
+    [pod] = pool.pods.values()
+    clock.now = 30
+    asyncio.run(pool.autoscale(backlog=1, in_flight=0))
+    assert pod.status == BOOTING
+    assert pool.endpoints.lookups == 0                # Con stream no se pregunta a RunPod en cada tick
+    clock.now = 61
+    asyncio.run(pool.autoscale(backlog=1, in_flight=0))
+    assert pod.status == READY
+    assert pod.address == "10.0.0.1:8188"
+    assert pool.endpoints.lookups == 1
+
+
+def test_pod_que_no_arranca_se_elimina_y_se_repone():
+    pool, backend, clock = booting_pool(boot_time=10_000, boot_poll_s=60, max_boot_s=300)
+    asyncio.run(pool.autoscale(backlog=1, in_flight=0))
+    clock.now = 301
+    asyncio.run(pool.autoscale(backlog=1, in_flight=0))
+    assert pool.boot_timeouts == 1
+    assert backend.terminated == 1                    # Deja de facturar
+    assert backend.created == 2                       # Y el auto-scaling pide otro
+    assert list(pool.pods) == ["POD-SIM-2"]
+    assert pool.pods["POD-SIM-2"].status == BOOTING
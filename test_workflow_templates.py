@@ -0,0 +1,68 @@
+import json
+
+from workflow_templates import WorkflowTemplate, PLANTILLAS
+
+# ==========================================
+# TESTS: MICRO-BATCHING DE PLANTILLAS
+# ==========================================
+# render_batch pega las ramas precompiladas sin json.loads/dumps: aquí se parsea el
+# cuerpo resultante y se comprueba que es el grafo que esperaría ComfyUI.
+
+JOBS = 4
+
+
+def batch():
+    template = WorkflowTemplate.from_file("imagen", PLANTILLAS["imagen"])
+    values = [{"prompt": f"prompt número {i}", "seed": 1000 + i} for i in range(JOBS)]
+    body, outputs = template.render_batch(values, client_id="cliente-1")
+    return template, json.loads(body), outputs
+
+
+def node_id(base, index):
+    return base if index == 0 else f"{base}_b{index}"
+
+
+def test_cuerpo_es_json_valido_con_todas_las_ramas():
+    template, body, _ = batch()
+    graph = body["prompt"]
+    assert body["client_id"] == "cliente-1"
+    shared = set(template.graph) - template.branch
+    assert len(graph) == len(shared) + JOBS * len(template.branch)
+    for index in range(1, JOBS):
+        assert all(f"{node}_b{index}" in graph for node in template.branch)
+    assert not any(f"{node}_b" in key for node in shared for key in graph)   # Compartidos una sola vez
+
+
+def test_cada_rama_lleva_su_prompt_y_su_semilla():
+    template, body, _ = batch()
+    graph = body["prompt"]
+    [(prompt_node, prompt_input)] = template.roles["prompt"]
+    [(seed_node, seed_input)] = template.roles["seed"]
+    for index in range(JOBS):
+        assert graph[node_id(prompt_node, index)]["inputs"][prompt_input] == f"prompt número {index}"
+        assert graph[node_id(seed_node, index)]["inputs"][seed_input] == 1000 + index
+
+
+def test_enlaces_internos_apuntan_a_su_propia_rama():
+    template, body, _ = batch()
+    graph = body["prompt"]
+    for index in range(JOBS):
+        for base in template.branch:
+            for name, value in template.graph[base]["inputs"].items():
+                if not isinstance(value, list):
+                    continue
+                linked = graph[node_id(base, index)]["inputs"][name]
+                # Dentro de la rama: el nodo de la misma rama; fuera: el compartido
+                expected = node_id(value[0], index) if value[0] in template.branch else value[0]
+                assert linked == [expected, value[1]]
+
+
+def test_nodos_de_salida_coinciden_con_los_saveimage_de_cada_rama():
+    template, body, outputs = batch()
+    graph = body["prompt"]
+    assert len(outputs) == JOBS
+    for index, nodes in enumerate(outputs):
+        assert nodes == [node_id(node, index) for node in template.output_nodes]
+        assert all(graph[node]["class_type"] == "SaveImage" for node in nodes)
+    save_nodes = sorted(key for key, node in graph.items() if node["class_type"] == "SaveImage")
+    assert sorted(node for nodes in outputs for node in nodes) == save_nodes
@@ -0,0 +1,200 @@
+import argparse
+import json
+import math
+import random
+from types import SimpleNamespace
+
+from arrival_forecast import ArrivalForecaster
+from worker_pool import (WorkerPool, MAX_PODS, MAX_JOBS_POR_POD, SCALE_IN_COOLDOWN_S, WARM_POOL_SIZE,
+                         POD_BOOT_INICIAL_S, POD_RESUME_INICIAL_S)
+
+# ==========================================
+# SIMULADOR: RESERVA CALIENTE + PRE-ESCALADO
+# ==========================================
+# Reproduce una traza de llegadas (segundos desde el inicio) con un reloj virtual
+# de 1 s y compara políticas de escalado: espera en cola p50/p95 frente a dólares.
+# Usa las mismas piezas que producción para decidir (WorkerPool.desired_pods /
+# predicted_pods y ArrivalForecaster); solo el "RunPod" y la GPU son simulados.
+#
+# Políticas:
+#   reactiva           -> la de siempre: crear con cola, eliminar al vaciarse
+#   reserva            -> K Pods parados que se reanudan (arranque corto, pagan disco)
+#   reserva+previsión  -> además pre-escala con la tasa de llegadas prevista
+
+PRECIO_GPU_HORA = 0.29        # $/h (mismo que queue_system)
+PRECIO_DISCO_HORA = 0.011     # $/h de un Pod parado (40 GB a ~0.20 $/GB-mes)
+SERVICE_TIME_S = 10
+SCALE_THRESHOLD = 5
+TICK_S = 1.0
+
+
+def synthetic_trace(duration_s=4 * 3600, seed=7):
+    """Ráfagas de 3-8 min cada 15-40 min más un goteo de fondo (determinista con la semilla)."""
+    rng = random.Random(seed)
+    arrivals = []
+    t = rng.uniform(60, 600)
+    while t < duration_s:
+        burst_len = rng.uniform(180, 480)
+        rate = rng.uniform(0.05, 0.3)
+        s = t
+        while s < min(t + burst_len, duration_s):
+            arrivals.append(s)
+            s += rng.expovariate(rate)
+        t += burst_len + rng.uniform(900, 2400)
+    s = 0.0
+    while s < duration_s:
+        s += rng.expovariate(1 / 300)
+        arrivals.append(s)
+    return sorted(a for a in arrivals if a < duration_s)
+
+
+def load_trace(path):
+    """Un instante por línea (segundos) o JSONL con {"t": segundos}."""
+    arrivals = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                arrivals.append(float(json.loads(line)["t"]) if line.startswith("{") else float(line))
+    return sorted(arrivals)
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+class _SimPod:
+    __slots__ = ("pod_id", "ready_at", "draining", "busy_until")
+
+    def __init__(self, pod_id, ready_at):
+        self.pod_id = pod_id
+        self.ready_at = ready_at
+        self.draining = False
+        self.busy_until = []      # Fin de cada job en vuelo
+
+
+def simulate(arrivals, warm_size=0, forecast=False, max_pods=MAX_PODS, max_jobs_por_pod=MAX_JOBS_POR_POD,
+             service_time=SERVICE_TIME_S, boot_time=POD_BOOT_INICIAL_S, resume_time=POD_RESUME_INICIAL_S,
+             price_per_hour=PRECIO_GPU_HORA, disk_per_hour=PRECIO_DISCO_HORA):
+    clock = SimpleNamespace(now=0.0)
+    pool = WorkerPool(SimpleNamespace(get_pod_addr=lambda pod_id: None, gpu_type_for=lambda tipo: None), max_pods=max_pods,
+                      max_jobs_por_pod=max_jobs_por_pod, scale_threshold=SCALE_THRESHOLD,
+                      warm_size=warm_size, clock=lambda: clock.now)
+    pool.service_time = service_time
+    pool.boot_times = {"create": boot_time, "resume": resume_time}
+    forecaster = ArrivalForecaster(clock=lambda: clock.now)
+
+    pods, queue, waits = {}, [], []
+    stats = {"created": 0, "resumed": 0, "gpu_s": 0.0, "disk_s": 0.0}
+    next_arrival, next_id = 0, 0
+    last_scale_out = -math.inf
+    end = (arrivals[-1] if arrivals else 0) + 3600
+
+    while clock.now < end and (next_arrival < len(arrivals) or queue or pods):
+        now = clock.now
+        # 1. Llegadas
+        while next_arrival < len(arrivals) and arrivals[next_arrival] < now + TICK_S:
+            queue.append(arrivals[next_arrival])
+            forecaster.record()
+            next_arrival += 1
+
+        # 2. GPUs: fin de jobs y reparto FIFO a Pods listos
+        for pod in pods.values():
+            pod.busy_until = [t for t in pod.busy_until if t > now]
+        for pod in sorted(pods.values(), key=lambda p: len(p.busy_until)):
+            while queue and not pod.draining and pod.ready_at <= now and len(pod.busy_until) < max_jobs_por_pod:
+                waits.append(now - queue.pop(0))
+                pod.busy_until.append(now + service_time)
+
+        # 3. Escalado (misma decisión que WorkerPool.autoscale)
+        in_flight = sum(len(pod.busy_until) for pod in pods.values())
+        desired = pool.desired_pods(len(queue), in_flight)
+        if forecast:
+            desired = max(desired, pool.predicted_pods(forecaster.forecast(pool.boot_estimate_s)))
+        serving = [pod for pod in pods.values() if not pod.draining]
+        if desired > len(serving):
+            for pod in pods.values():
+                if desired > len(serving) and pod.draining:
+                    pod.draining = False
+                    serving.append(pod)
+            while desired > len(serving) and len(pods) < max_pods:
+                if pool.warm:
+                    pod_id, ready_at = pool.warm.pop(0), now + resume_time
+                    stats["resumed"] += 1
+                else:
+                    next_id += 1
+                    pod_id, ready_at = f"POD-{next_id}", now + boot_time
+                    stats["created"] += 1
+                pods[pod_id] = pod = _SimPod(pod_id, ready_at)
+                serving.append(pod)
+                last_scale_out = now
+        elif desired < len(serving) and (desired == 0 or now - last_scale_out >= SCALE_IN_COOLDOWN_S):
+            for pod in sorted(serving, key=lambda p: (p.ready_at <= now, len(p.busy_until)))[:len(serving) - desired]:
+                pod.draining = True
+        for pod in [p for p in pods.values() if p.draining and not p.busy_until]:
+            del pods[pod.pod_id]
+            if len(pool.warm) < warm_size:
+                pool.warm.append(pod.pod_id)
+
+        # 4. Facturación del segundo
+        stats["gpu_s"] += len(pods) * TICK_S
+        stats["disk_s"] += len(pool.warm) * TICK_S
+        clock.now += TICK_S
+
+    gpu_usd = stats["gpu_s"] / 3600 * price_per_hour
+    disk_usd = stats["disk_s"] / 3600 * disk_per_hour
+    return {
+        "jobs": len(waits),
+        "p50_wait_s": round(percentile(waits, 50), 1),
+        "p95_wait_s": round(percentile(waits, 95), 1),
+        "max_wait_s": round(max(waits, default=0.0), 1),
+        "gpu_usd": round(gpu_usd, 3),
+        "disk_usd": round(disk_usd, 3),
+        "total_usd": round(gpu_usd + disk_usd, 3),
+        "created": stats["created"],
+        "resumed": stats["resumed"],
+    }
+
+
+def compare(arrivals, warm_size=WARM_POOL_SIZE, **options):
+    policies = {
+        "reactiva": dict(warm_size=0, forecast=False),
+        "reserva": dict(warm_size=warm_size, forecast=False),
+        "reserva+previsión": dict(warm_size=warm_size, forecast=True),
+    }
+    return {name: simulate(arrivals, **policy, **options) for name, policy in policies.items()}
+
+
+def print_report(results, arrivals):
+    span_h = (arrivals[-1] - arrivals[0]) / 3600 if len(arrivals) > 1 else 0
+    print(f"📊 Traza: {len(arrivals)} llegadas en {span_h:.1f} h")
+    print(f"{'política':<20}{'p50 (s)':>9}{'p95 (s)':>9}{'máx (s)':>9}{'GPU $':>9}{'disco $':>9}{'total $':>9}"
+          f"{'creados':>9}{'reanud.':>9}")
+    for name, r in results.items():
+        print(f"{name:<20}{r['p50_wait_s']:>9}{r['p95_wait_s']:>9}{r['max_wait_s']:>9}{r['gpu_usd']:>9}"
+              f"{r['disk_usd']:>9}{r['total_usd']:>9}{r['created']:>9}{r['resumed']:>9}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Espera en cola vs coste con reserva caliente y pre-escalado")
+    parser.add_argument("--trace", help="Fichero de llegadas (segundos por línea o JSONL {\"t\": ...})")
+    parser.add_argument("--duration", type=float, default=4 * 3600, help="Duración de la traza sintética (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--warm", type=int, default=WARM_POOL_SIZE, help="Pods parados en reserva (K)")
+    parser.add_argument("--max-pods", type=int, default=MAX_PODS)
+    parser.add_argument("--service-time", type=float, default=SERVICE_TIME_S)
+    parser.add_argument("--boot-time", type=float, default=POD_BOOT_INICIAL_S)
+    parser.add_argument("--resume-time", type=float, default=POD_RESUME_INICIAL_S)
+    parser.add_argument("--json", action="store_true", help="Salida en JSON")
+    args = parser.parse_args()
+
+    trace = load_trace(args.trace) if args.trace else synthetic_trace(args.duration, args.seed)
+    results = compare(trace, warm_size=args.warm, max_pods=args.max_pods, service_time=args.service_time,
+                      boot_time=args.boot_time, resume_time=args.resume_time)
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_report(results, trace)
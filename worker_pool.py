@@ -0,0 +1,411 @@
+import asyncio
+import json
+import logging
+import math
+import time
+
+from pod_registry import PodEndpointRegistry
+from pod_health import PodHealthMonitor
+
+# ==========================================
+# POOL DE WORKERS (MULTI-POD) CON AUTO-SCALING
+# ==========================================
+# Gestiona N Pods sobre las funciones de main.py (create_worker_pod / stop_worker_pod).
+#  - Scale-out según profundidad de cola y tiempo de servicio medido por job (EWMA).
+#  - Reparto por "menos trabajo pendiente" entre los Pods listos.
+#  - Scale-in drenando: un Pod marcado DRAINING no recibe jobs nuevos y solo se
+#    apaga cuando termina los que tiene en vuelo.
+#  - Techo de Pods y de presupuesto diario. Con un CostMeter (cost_meter.py) cada
+#    arranque/parada abre/cierra la factura del Pod al precio de su tipo de GPU.
+#  - Afinidad de modelo: cada Pod recuerda qué checkpoint tiene cargado en VRAM y
+#    qué checkpoints tiene instalados; pick_pod prefiere el Pod que ya tiene el modelo
+#    del job y cada cambio de modelo en un Pod cuenta como "swap" (métrica MODEL_SWAP).
+#  - Reserva caliente: al sobrar, hasta warm_size Pods se PARAN (solo pagan disco) y
+#    el siguiente scale-out los reanuda en vez de crear uno nuevo (arranque mucho más
+#    corto: imagen descargada y modelos en disco). El resto se eliminan.
+#  - Un Pod solo pasa a READY cuando ComfyUI responde en el 8188 (readiness_probe),
+#    no cuando RunPod le asigna IP.
+#  - Pre-escalado: con la tasa de llegadas prevista para dentro de "lo que tarda un
+#    Pod en arrancar" se piden GPUs antes de que la cola crezca.
+#  - Un Pod con imágenes aún descargándose (output_store.py) no se para aunque ya no
+#    tenga jobs en la GPU: al pararlo se perderían.
+#  - Salud (pod_health.py): un Pod con el circuito abierto no recibe jobs, y si se
+#    abre demasiadas veces seguidas se retira (se elimina, nunca va a la reserva
+#    caliente) y el auto-scaling lo sustituye.
+#  - Si el backend publica el ciclo de vida de los Pods (main.subscribe_pod_events, ver
+#    runpod_client.py), los que arrancan no se consultan uno a uno: su dirección llega
+#    con el evento READY. Un Pod parado o eliminado desde fuera se retira.
+#  - Por si se pierde ese READY, un Pod que lleva más de BOOT_POLL_FALLBACK_S arrancando
+#    se consulta igualmente (como mucho una vez cada BOOT_POLL_FALLBACK_S). Si pasa de
+#    POD_MAX_BOOT_S sin estar listo se elimina y el auto-scaling pide otro.
+
+MAX_PODS = 4                  # Techo de Pods simultáneos
+MAX_JOBS_POR_POD = 2          # Concurrencia máxima por Pod (jobs en vuelo en la misma GPU)
+TARGET_DRAIN_S = 120          # Queremos vaciar la cola en ~2 min
+SERVICE_TIME_INICIAL_S = 10   # Estimación de segundos por job hasta tener medidas reales
+SERVICE_TIME_ALPHA = 0.2      # Peso de cada nueva medida en la EWMA
+SCALE_IN_COOLDOWN_S = 60      # No reducir flota hasta pasado este tiempo desde el último scale-out
+BUDGET_HORIZON_H = 0.25       # Horizonte (h) de gasto que reservamos por cada Pod encendido
+WARM_POOL_SIZE = 1            # Pods parados que guardamos para reanudar (K)
+POD_BOOT_INICIAL_S = 150      # Estimación de arranque de un Pod nuevo (test_infra.py: 2-3 min)
+POD_RESUME_INICIAL_S = 40     # Estimación de arranque reanudando un Pod parado
+BOOT_TIME_ALPHA = 0.3         # Peso de cada arranque medido en la EWMA
+PRESCALE_MIN_ARRIVALS = 1.0   # Solo pre-escalamos si esperamos al menos esto durante un arranque
+BOOT_POLL_FALLBACK_S = 60     # Con stream de eventos: consultar igualmente los Pods que tardan más que esto
+POD_MAX_BOOT_S = 900          # Un Pod que no está listo tras esto se elimina y se repone
+
+BOOTING = "BOOTING"
+READY = "READY"
+DRAINING = "DRAINING"
+
+
+class WorkerPod:
+    __slots__ = ("pod_id", "status", "outstanding", "fetching", "address", "created_at", "jobs_done",
+                 "loaded_model", "available_models", "model_swaps", "probed", "origin", "requested_at", "retired",
+                 "polled_at")
+
+    def __init__(self, pod_id, origin="create", requested_at=0.0):
+        self.pod_id = pod_id
+        self.status = BOOTING
+        self.origin = origin             # "create" (Pod nuevo) o "resume" (reserva caliente)
+        self.requested_at = requested_at  # Reloj del pool al pedirlo (para medir el arranque)
+        self.outstanding = 0       # Jobs en vuelo en este Pod
+        self.fetching = 0          # Lotes terminados cuyas imágenes aún se descargan
+        self.address = None
+        self.created_at = time.time()
+        self.jobs_done = 0
+        self.loaded_model = None       # Último checkpoint enviado (el que está en VRAM)
+        self.available_models = None   # Checkpoints instalados (/object_info); None = aún no sabemos
+        self.model_swaps = 0
+        self.probed = False
+        self.retired = False           # Degradado: se elimina al drenar y no vuelve a servir
+        self.polled_at = requested_at  # Última consulta a RunPod mientras arranca
+
+
+class WorkerPool:
+    def __init__(self, backend, max_pods=MAX_PODS, max_jobs_por_pod=MAX_JOBS_POR_POD,
+                 scale_threshold=5, price_per_hour=0.0, budget=math.inf, spent_fn=lambda: 0.0,
+                 target_drain_s=TARGET_DRAIN_S, scale_in_cooldown_s=SCALE_IN_COOLDOWN_S,
+                 tipo_trabajo="imagen", warm_size=WARM_POOL_SIZE, warm_pods=(), meter=None,
+                 boot_poll_s=BOOT_POLL_FALLBACK_S, max_boot_s=POD_MAX_BOOT_S, clock=time.monotonic):
+        self.backend = backend
+        self.max_pods = max_pods
+        self.max_jobs_por_pod = max_jobs_por_pod
+        self.scale_threshold = scale_threshold
+        self.price_per_hour = price_per_hour
+        self.budget = budget
+        self.spent_fn = spent_fn
+        self.target_drain_s = target_drain_s
+        self.scale_in_cooldown_s = scale_in_cooldown_s
+        self.tipo_trabajo = tipo_trabajo
+        self.boot_poll_s = boot_poll_s
+        self.max_boot_s = max_boot_s
+        self.gpu_type = backend.gpu_type_for(tipo_trabajo)
+        self.meter = meter                      # CostMeter opcional (facturación por Pod)
+        self.clock = clock
+        self.pods = {}                          # pod_id -> WorkerPod
+        self.endpoints = PodEndpointRegistry(backend.get_pod_addr, clock=clock)
+        self.health = PodHealthMonitor(clock=clock)   # Circuit breaker por Pod
+        self.service_time = SERVICE_TIME_INICIAL_S
+        self.last_scale_out = -math.inf
+        self.model_swaps = 0
+        self.warm_size = warm_size
+        self.warm = list(warm_pods)             # Pods parados listos para reanudar
+        self.on_warm_change = None              # Callback para persistir la reserva
+        self.readiness_probe = None             # async (address) -> bool; lo pone el motor de despacho
+        self._unsubscribe = None                # Baja del stream de eventos del backend (si lo tiene)
+        self.pod_events = 0
+        self.boot_times = {"create": POD_BOOT_INICIAL_S, "resume": POD_RESUME_INICIAL_S}
+        self.resumed = 0
+        self.created = 0
+        self.boot_timeouts = 0
+
+    def __len__(self):
+        return len(self.pods)
+
+    # --- MEDIDAS ---
+    def record_service_time(self, seconds):
+        """Actualiza la EWMA de segundos de GPU por job."""
+        self.service_time += SERVICE_TIME_ALPHA * (seconds - self.service_time)
+
+    def desired_pods(self, backlog, in_flight):
+        """Pods necesarios para vaciar backlog + en vuelo en ~target_drain_s."""
+        work = backlog + in_flight
+        if work == 0:
+            return 0
+        by_time = math.ceil(work * self.service_time / self.target_drain_s)
+        # AUTO_SCALE_THRESHOLD: no añadimos Pods extra por colas pequeñas
+        by_threshold = math.ceil(work / self.scale_threshold)
+        return max(1, min(by_time, by_threshold, self.max_pods))
+
+    def record_boot_time(self, origin, seconds):
+        self.boot_times[origin] += BOOT_TIME_ALPHA * (seconds - self.boot_times[origin])
+
+    @property
+    def boot_estimate_s(self):
+        """Lo que tardaría en estar listo el próximo Pod (reanudar si hay reserva, crear si no)."""
+        return self.boot_times["resume" if self.warm else "create"]
+
+    def predicted_pods(self, forecast_rate):
+        """Pods para atender la tasa de llegadas prevista (ley de Little: tasa x tiempo de servicio)."""
+        if forecast_rate * self.boot_estimate_s < PRESCALE_MIN_ARRIVALS:
+            return 0
+        busy_slots = forecast_rate * self.service_time
+        return min(self.max_pods, math.ceil(busy_slots / self.max_jobs_por_pod))
+
+    def can_afford(self, extra_pods=1):
+        """¿Cabe en el presupuesto diario mantener encendidos los Pods actuales + extra_pods?"""
+        price = self.meter.prices.price(self.gpu_type) if self.meter else self.price_per_hour
+        reserved = (len(self.pods) + extra_pods) * price * BUDGET_HORIZON_H
+        return self.spent_fn() + reserved <= self.budget
+
+    # --- REPARTO ---
+    def pick_pod(self, model=None, prefer=None):
+        """
+        Pod listo con hueco (None si no hay). Con model, por este orden: que tenga el
+        checkpoint instalado, que ya lo tenga cargado, que esté en prefer (grupo dueño del
+        shard, ver shard_coordinator.py) y, por último, menos trabajo pendiente.
+        """
+        best, best_score = None, None
+        for pod in self.pods.values():
+            if (pod.status == READY and pod.outstanding < self.max_jobs_por_pod
+                    and self.health.allows(pod.pod_id, pod.outstanding)):
+                score = (
+                    model is not None and pod.available_models is not None and model not in pod.available_models,
+                    model is not None and pod.loaded_model != model,
+                    bool(prefer) and pod.pod_id not in prefer,
+                    pod.outstanding,
+                )
+                if best is None or score < best_score:
+                    best, best_score = pod, score
+        return best
+
+    def acquire(self, pod, model=None):
+        pod.outstanding += 1
+        if model is None or model == pod.loaded_model:
+            return
+        if pod.loaded_model is not None:
+            pod.model_swaps += 1
+            self.model_swaps += 1
+            logging.info(json.dumps({"event": "MODEL_SWAP", "pod_id": pod.pod_id, "from": pod.loaded_model,
+                                     "to": model, "pod_swaps": pod.model_swaps, "total_swaps": self.model_swaps}))
+        pod.loaded_model = model
+
+    def release(self, pod, completed=0):
+        """Libera el hueco; completed = jobs terminados con éxito en él (un lote puede traer varios)."""
+        pod.outstanding -= 1
+        pod.jobs_done += completed
+
+    def begin_fetch(self, pod_id):
+        """Hay salidas del Pod pendientes de descargar: no se puede parar hasta end_fetch."""
+        pod = self.pods.get(pod_id)
+        if pod is not None:
+            pod.fetching += 1
+
+    def end_fetch(self, pod_id):
+        pod = self.pods.get(pod_id)
+        if pod is not None:
+            pod.fetching -= 1
+
+    # --- EVENTOS DE CICLO DE VIDA ---
+    def attach_events(self, loop):
+        """Se suscribe al stream de eventos del backend, si lo ofrece (entregados en loop)."""
+        subscribe = getattr(self.backend, "subscribe_pod_events", None)
+        if subscribe is not None and self._unsubscribe is None:
+            self._unsubscribe = subscribe(self._on_pod_event, loop=loop)
+
+    def detach_events(self):
+        if self._unsubscribe is not None:
+            self._unsubscribe()
+            self._unsubscribe = None
+
+    def _on_pod_event(self, event):
+        pod = self.pods.get(event["pod_id"])
+        if pod is None:
+            return
+        self.pod_events += 1
+        if event["state"] == "READY" and event["address"]:
+            self.endpoints.set(pod.pod_id, event["address"])
+        elif event["state"] in ("STOPPED", "TERMINATED") and pod.status != DRAINING:
+            # Parado desde fuera (consola, falta de saldo, máquina caída): sus jobs fallarán
+            # como infraestructura y volverán a la cola; el auto-scaling lo repone
+            pod.retired = True
+            pod.status = DRAINING
+            self.endpoints.forget(pod.pod_id)
+            logging.info(json.dumps({"event": "POD_LOST", "pod_id": pod.pod_id, "state": event["state"]}))
+            print(f"🚑 Pod {pod.pod_id} {event['state']} fuera del orquestador: se retira y se repone.")
+
+    # --- AUTO-SCALING ---
+    async def autoscale(self, backlog, in_flight, forecast_rate=0.0):
+        await self._refresh_booting()
+        self._retire_sick()
+        await self._stop_drained()
+
+        reactive = self.desired_pods(backlog, in_flight)
+        desired = max(reactive, self.predicted_pods(forecast_rate))
+        serving = [pod for pod in self.pods.values() if pod.status != DRAINING]
+
+        if desired > len(serving):
+            if reactive > len(serving):
+                reason = f"🚨 Cola detectada ({backlog} jobs)."
+            else:
+                reason = f"📈 Previsión: {forecast_rate * 60:.1f} jobs/min dentro de ~{self.boot_estimate_s:.0f}s."
+            await self._scale_out(desired - len(serving), reason)
+        elif desired < len(serving):
+            # Sin trabajo: apagamos ya (como antes). Con trabajo: respetamos el cooldown.
+            if desired == 0 or self.clock() - self.last_scale_out >= self.scale_in_cooldown_s:
+                self._drain(len(serving) - desired)
+
+    async def _scale_out(self, count, reason):
+        # Primero recuperamos Pods que estaban drenando (ya están pagados y calientes)
+        for pod in self.pods.values():
+            if count and pod.status == DRAINING and not pod.retired:
+                pod.status = READY if pod.address else BOOTING
+                count -= 1
+        count = min(count, self.max_pods - len(self.pods))
+        if count <= 0:
+            return
+        print(f"{reason} Solicitando {count} GPU(s)...")
+        for _ in range(count):
+            if not await asyncio.to_thread(self.can_afford):
+                print("💰 Presupuesto diario al límite: no se levantan más Pods.")
+                break
+            pod_id, origin = await self._resume_warm(), "resume"
+            if not pod_id:
+                pod_id, origin = await asyncio.to_thread(self.backend.create_worker_pod, tipo_trabajo=self.tipo_trabajo), "create"
+            if not pod_id:
+                break
+            self.pods[pod_id] = WorkerPod(pod_id, origin=origin, requested_at=self.clock())
+            if self.meter:
+                # RunPod factura desde que acepta el create/resume, no desde que está listo
+                await asyncio.to_thread(self.meter.pod_started, pod_id, self.gpu_type)
+            self.last_scale_out = self.clock()
+            if origin == "resume":
+                self.resumed += 1
+                print(f"♨️ Reanudando Pod de la reserva: {pod_id} ({len(self.pods)}/{self.max_pods} Pods)")
+            else:
+                self.created += 1
+                print(f"✅ Infraestructura solicitada: {pod_id} ({len(self.pods)}/{self.max_pods} Pods)")
+
+    async def _resume_warm(self):
+        """Reanuda un Pod parado de la reserva. None si no hay o ninguno pudo reanudarse."""
+        while self.warm:
+            pod_id = self.warm.pop(0)
+            self._warm_changed()
+            if await asyncio.to_thread(self.backend.resume_worker_pod, pod_id):
+                return pod_id
+            # Sin GPU libre en su máquina: ya no sirve como reserva, lo eliminamos para no pagar disco
+            print(f"⚠️ No se pudo reanudar {pod_id}; se elimina de la reserva.")
+            await asyncio.to_thread(self.backend.terminate_worker_pod, pod_id)
+        return None
+
+    def _warm_changed(self):
+        if self.on_warm_change:
+            self.on_warm_change(list(self.warm))
+
+    def _keep_warm(self, pod_id):
+        """¿Este Pod se queda parado en la reserva (True) o se elimina (False)?"""
+        if len(self.warm) < self.warm_size:
+            self.warm.append(pod_id)
+            self._warm_changed()
+            return True
+        return False
+
+    def _retire_sick(self):
+        """Pods cuyo circuito se ha abierto demasiadas veces: se drenan para eliminarlos y reponerlos."""
+        for pod_id in self.health.needs_replacement():
+            pod = self.pods.get(pod_id)
+            if pod is None or pod.retired:
+                continue
+            pod.retired = True
+            pod.status = DRAINING
+            self.health.replaced += 1
+            logging.info(json.dumps({"event": "POD_REPLACED", "pod_id": pod_id,
+                                     "reason": self.health.get(pod_id).reason}))
+            print(f"🚑 Pod {pod_id} degradado: se retira y el auto-scaling pedirá otro.")
+
+    def _drain(self, count):
+        # Drenamos primero los que arrancan y después los menos cargados
+        candidates = sorted(
+            (pod for pod in self.pods.values() if pod.status != DRAINING),
+            key=lambda pod: (pod.status == READY, pod.outstanding),
+        )
+        for pod in candidates[:count]:
+            pod.status = DRAINING
+            print(f"📉 Drenando Pod {pod.pod_id} ({pod.outstanding} jobs en vuelo).")
+
+    async def _refresh_booting(self):
+        booting = [pod for pod in self.pods.values() if pod.status == BOOTING]
+        if not booting:
+            return
+        for pod in [pod for pod in booting if self.clock() - pod.requested_at > self.max_boot_s]:
+            self._retire_stuck(pod)
+            booting.remove(pod)
+        # Única consulta a RunPod por Pod: al pasar a RUNNING queda cacheada en el registro
+        addresses = await asyncio.gather(*(self._booting_address(pod) for pod in booting))
+        for pod, address in zip(booting, addresses):
+            if address and pod.status == BOOTING:
+                pod.address = address
+                pod.status = READY
+                boot_s = self.clock() - pod.requested_at
+                self.record_boot_time(pod.origin, boot_s)
+                print(f"🟢 Pod {pod.pod_id} listo en {address} ({boot_s:.0f}s de arranque)")
+
+    def _retire_stuck(self, pod):
+        """Pod que no arranca: se drena (no tiene jobs) para eliminarlo y el auto-scaling lo repone."""
+        pod.retired = True
+        pod.status = DRAINING
+        self.boot_timeouts += 1
+        boot_s = self.clock() - pod.requested_at
+        logging.info(json.dumps({"event": "POD_BOOT_TIMEOUT", "pod_id": pod.pod_id, "boot_s": round(boot_s, 1)}))
+        print(f"🚑 Pod {pod.pod_id} lleva {boot_s:.0f}s arrancando: se elimina y se pide otro.")
+
+    async def _booting_address(self, pod):
+        """Dirección del Pod solo si además ComfyUI ya responde (readiness en el 8188)."""
+        address = self.endpoints.get(pod.pod_id)
+        now = self.clock()
+        # Sin stream de eventos preguntamos a RunPod en cada tick; con stream la dirección llega
+        # con READY, y solo se consulta (despacio) si tarda tanto que el evento pudo perderse
+        if address is None and (self._unsubscribe is None
+                                or (now - pod.requested_at > self.boot_poll_s
+                                    and now - pod.polled_at > self.boot_poll_s)):
+            pod.polled_at = now
+            address = await self.endpoints.fetch(pod.pod_id)
+        if address and self.readiness_probe and not await self.readiness_probe(address):
+            return None
+        return address
+
+    async def _stop_drained(self):
+        idle = [p for p in self.pods.values() if p.status == DRAINING and p.outstanding == 0 and p.fetching == 0]
+        for pod in idle:
+            del self.pods[pod.pod_id]
+            self.endpoints.forget(pod.pod_id)
+            self.health.forget(pod.pod_id)
+            if pod.retired:
+                print(f"🚑 Eliminando Pod degradado {pod.pod_id}.")
+                await asyncio.to_thread(self.backend.terminate_worker_pod, pod.pod_id)
+            elif self._keep_warm(pod.pod_id):
+                print(f"🛑 Parando Pod drenado {pod.pod_id} (queda en la reserva caliente).")
+                await asyncio.to_thread(self.backend.stop_worker_pod, pod.pod_id)
+            else:
+                print(f"🛑 Eliminando Pod drenado {pod.pod_id} para ahorrar dinero.")
+                await asyncio.to_thread(self.backend.terminate_worker_pod, pod.pod_id)
+            self._bill(pod.pod_id)
+
+    def stop_all(self):
+        """Apagado síncrono de toda la flota (Ctrl+C)."""
+        for pod_id in list(self.pods):
+            if not self.pods[pod_id].retired and self._keep_warm(pod_id):
+                print(f"🧹 Limpiando recursos: Parando Pod {pod_id} (reserva caliente)")
+                self.backend.stop_worker_pod(pod_id)
+            else:
+                print(f"🧹 Limpiando recursos: Eliminando Pod {pod_id}")
+                self.backend.terminate_worker_pod(pod_id)
+            del self.pods[pod_id]
+            self.endpoints.entries.pop(pod_id, None)
+            self._bill(pod_id)
+
+    def _bill(self, pod_id):
+        """Cierra la factura del Pod recién parado/eliminado (si hay medidor)."""
+        if self.meter:
+            self.meter.pod_stopped(pod_id)
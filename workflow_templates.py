@@ -0,0 +1,279 @@
+import json
+import logging
+import os
+import random
+import re
+import time
+
+# ==========================================
+# PLANTILLAS DE WORKFLOW PRECOMPILADAS
+# ==========================================
+# Antes: por cada job se abría workflow_api.json, json.load, se tocaban los nodos
+# "6"/"3" a mano y se volvía a serializar todo el grafo.
+# Ahora cada plantilla se carga y valida UNA vez:
+#   - los puntos de inyección se localizan por class_type/rol (el CLIPTextEncode
+#     conectado al "positive" del KSampler, la semilla del KSampler, etc.), no por ID,
+#   - el grafo se serializa a bytes partido en fragmentos alrededor de esos huecos,
+#   - por job solo se codifican los valores nuevos y se concatenan los fragmentos.
+# Si el fichero cambia en disco la plantilla se recarga sola.
+# Para micro-batching, render_batch junta varios jobs en un solo prompt de ComfyUI:
+# los nodos compartidos (checkpoint, latente vacío, negativo) aparecen una vez y la
+# "rama" de cada job (su CLIPTextEncode, KSampler, VAEDecode y SaveImage) se duplica.
+# La rama también va precompilada en fragmentos, con huecos para los valores del job y
+# para el sufijo de sus IDs (y de los enlaces entre sus nodos): tampoco hay json.loads/dumps por lote.
+
+_BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PLANTILLAS = {
+    "imagen": os.path.join(_BASE_DIR, "workflow_api.json"),
+    "video": os.path.join(_BASE_DIR, "workflow_video_api.json"),   # Opcional: solo si el fichero existe
+}
+PLANTILLA_POR_DEFECTO = "imagen"
+RELOAD_CHECK_S = 1.0      # Cada cuánto como máximo miramos el mtime del fichero
+
+SAMPLERS = ("KSampler", "KSamplerAdvanced")
+SEED_MAX = 1000000000
+
+_SLOT = "@@SLOT:{}@@"
+_SLOT_RE = re.compile(r'"@@SLOT:([a-z_]+)@@"')
+_INDEX = "@@INDEX@@"      # Hueco del nº de job en los IDs de las ramas copiadas ("9_b@@INDEX@@")
+
+
+class TemplateError(ValueError):
+    """Plantilla de workflow inválida o sin los nodos necesarios."""
+
+
+def find_injection_points(graph):
+    """Devuelve {rol: [(node_id, input_name), ...]} localizando los nodos por class_type."""
+    roles = {}
+
+    def add(role, node_id, input_name):
+        slots = roles.setdefault(role, [])
+        if (node_id, input_name) not in slots:
+            slots.append((node_id, input_name))
+
+    samplers = [node_id for node_id, node in graph.items() if node["class_type"] in SAMPLERS]
+    if not samplers:
+        raise TemplateError("La plantilla no tiene ningún KSampler")
+
+    for node_id in samplers:
+        inputs = graph[node_id]["inputs"]
+        add("seed", node_id, "seed" if "seed" in inputs else "noise_seed")
+        for role, link_name in (("prompt", "positive"), ("negative", "negative")):
+            link = inputs.get(link_name)
+            if isinstance(link, list) and graph[link[0]]["class_type"] == "CLIPTextEncode":
+                add(role, link[0], "text")
+
+    for node_id, node in graph.items():
+        class_type = node["class_type"]
+        if class_type == "EmptyLatentImage":
+            for input_name in ("width", "height", "batch_size"):
+                add(input_name, node_id, input_name)
+        elif class_type == "CheckpointLoaderSimple":
+            add("ckpt_name", node_id, "ckpt_name")
+        elif class_type == "SaveImage":
+            add("filename_prefix", node_id, "filename_prefix")
+
+    if "prompt" not in roles:
+        raise TemplateError("No hay CLIPTextEncode conectado al 'positive' del KSampler")
+    return roles
+
+
+def branch_nodes(graph, roots):
+    """Nodos que dependen (directa o indirectamente) de alguno de roots, incluidos ellos."""
+    consumers = {}
+    for node_id, node in graph.items():
+        for value in node["inputs"].values():
+            if isinstance(value, list) and len(value) == 2 and value[0] in graph:
+                consumers.setdefault(value[0], []).append(node_id)
+    found, stack = set(), list(roots)
+    while stack:
+        node_id = stack.pop()
+        if node_id not in found:
+            found.add(node_id)
+            stack.extend(consumers.get(node_id, ()))
+    return found
+
+
+def validate_graph(graph):
+    if not isinstance(graph, dict) or not graph:
+        raise TemplateError("El workflow debe ser un objeto JSON con nodos")
+    for node_id, node in graph.items():
+        if "class_type" not in node or not isinstance(node.get("inputs"), dict):
+            raise TemplateError(f"Nodo {node_id}: falta class_type o inputs")
+        for input_name, value in node["inputs"].items():
+            if isinstance(value, list) and len(value) == 2 and isinstance(value[0], str):
+                if value[0] not in graph:
+                    raise TemplateError(f"Nodo {node_id}.{input_name} apunta a un nodo inexistente ({value[0]})")
+
+
+class WorkflowTemplate:
+    def __init__(self, name, graph, path=None):
+        validate_graph(graph)
+        self.name = name
+        self.path = path
+        self.graph = graph
+        self.roles = find_injection_points(graph)
+        self.defaults = {
+            role: graph[node_id]["inputs"][input_name]
+            for role, slots in self.roles.items()
+            for node_id, input_name in slots[:1]
+        }
+        self._encoded_defaults = {role: json.dumps(value).encode() for role, value in self.defaults.items()}
+        # Rama por job para render_batch: todo lo que cuelga del prompt positivo y de la semilla
+        roots = [node_id for role in ("prompt", "seed") for node_id, _ in self.roles[role]]
+        self.branch = branch_nodes(graph, roots)
+        self.output_nodes = sorted(node_id for node_id in self.branch if graph[node_id]["class_type"] == "SaveImage")
+        self._compile()
+
+    @classmethod
+    def from_file(cls, name, path):
+        with open(path, "r") as f:
+            return cls(name, json.load(f), path=path)
+
+    def _compile(self):
+        """Serializa el grafo con marcadores en los huecos y lo parte en fragmentos de bytes."""
+        marked = json.loads(json.dumps(self.graph))
+        for role, slots in self.roles.items():
+            for node_id, input_name in slots:
+                marked[node_id]["inputs"][input_name] = _SLOT.format(role)
+        serialized = json.dumps({"prompt": marked})
+        pieces = _SLOT_RE.split(serialized)
+        # split con grupo: [frag, rol, frag, rol, ..., frag]
+        self._fragments = [piece.encode() for piece in pieces[0::2]]
+        self._slot_roles = pieces[1::2]
+        # Quitamos la "}" final para poder añadir client_id sin reserializar
+        self._fragments[-1] = self._fragments[-1][:-1]
+
+        # Rama de render_batch: sus nodos con el ID (y los enlaces internos) sufijados con
+        # "_b" + hueco del índice, serializados sin las llaves para pegarlos tras el grafo base
+        rename = {node_id: f"{node_id}_b{_INDEX}" for node_id in self.branch}
+        branch = {}
+        for node_id, node in marked.items():
+            if node_id not in rename:
+                continue
+            inputs = {
+                name: [rename[value[0]], value[1]]
+                if isinstance(value, list) and len(value) == 2 and value[0] in rename else value
+                for name, value in node["inputs"].items()
+            }
+            branch[rename[node_id]] = {**node, "inputs": inputs}
+        # [bytes | rol | None (índice)], en orden
+        self._branch_parts = []
+        for position, chunk in enumerate(json.dumps(branch)[1:-1].split(_INDEX)):
+            if position:
+                self._branch_parts.append(None)
+            pieces = _SLOT_RE.split(chunk)
+            for fragment, role in zip(pieces[0::2], pieces[1::2] + [None]):
+                self._branch_parts.append(fragment.encode())
+                if role is not None:
+                    self._branch_parts.append(role)
+
+    def _encode(self, values):
+        """Valores del job ya codificados en JSON por rol (semilla aleatoria si no la trae)."""
+        values = values or {}
+        encoded = self._encoded_defaults.copy()
+        for role, value in values.items():
+            if role not in encoded:
+                raise TemplateError(f"La plantilla '{self.name}' no tiene hueco para '{role}'")
+            encoded[role] = json.dumps(value).encode()
+        if "seed" not in values:
+            encoded["seed"] = str(random.randint(1, SEED_MAX)).encode()
+        return encoded
+
+    def _graph_parts(self, encoded):
+        """Fragmentos de {"prompt": {...grafo...} con los valores inyectados (sin la "}" final)."""
+        parts = []
+        for fragment, role in zip(self._fragments, self._slot_roles):
+            parts.append(fragment)
+            parts.append(encoded[role])
+        parts.append(self._fragments[-1])
+        return parts
+
+    def render(self, values=None, client_id=None):
+        """Cuerpo JSON listo para POST /prompt con los valores del job inyectados."""
+        parts = self._graph_parts(self._encode(values))
+        if client_id:
+            parts.append(b', "client_id": ' + json.dumps(client_id).encode())
+        parts.append(b"}")
+        return b"".join(parts)
+
+    def render_batch(self, values_list, client_id=None):
+        """
+        Un único prompt de ComfyUI con una rama por job. Los valores fuera de la rama
+        (resolución, modelo, negativo) se toman del primero: el lote debe ser compatible.
+        Devuelve (cuerpo JSON en bytes, [nodos SaveImage de cada job]) para repartir las salidas.
+        """
+        parts = self._graph_parts(self._encode(values_list[0]))
+        parts[-1] = parts[-1][:-1]      # Se reabre el grafo para añadir las ramas del resto
+        outputs = [list(self.output_nodes)]
+        for index in range(1, len(values_list)):
+            encoded = self._encode(values_list[index])
+            suffix = str(index).encode()
+            parts.append(b", ")
+            for part in self._branch_parts:
+                parts.append(suffix if part is None else encoded[part] if isinstance(part, str) else part)
+            outputs.append([f"{node_id}_b{index}" for node_id in self.output_nodes])
+        parts.append(b"}")
+        if client_id:
+            parts.append(b', "client_id": ' + json.dumps(client_id).encode())
+        parts.append(b"}")
+        return b"".join(parts), outputs
+
+    def build_graph(self, values=None):
+        """Versión dict (más lenta) del render, para depurar o modificar el grafo a mano."""
+        return json.loads(self.render(values))["prompt"]
+
+
+class TemplateRegistry:
+    """Plantillas con nombre, cargadas una vez y recargadas si cambia el fichero."""
+
+    def __init__(self, paths=None, clock=time.monotonic):
+        self.paths = dict(PLANTILLAS if paths is None else paths)
+        self.clock = clock
+        self.templates = {}     # nombre -> (WorkflowTemplate, mtime; None si el fichero dejó de estar accesible)
+        self._last_check = {}
+        self.reloads = 0
+
+    def names(self):
+        return [name for name, path in self.paths.items() if os.path.exists(path)]
+
+    def register(self, name, path):
+        self.paths[name] = path
+        self.templates.pop(name, None)
+
+    def get(self, name=PLANTILLA_POR_DEFECTO):
+        if name not in self.paths:
+            raise TemplateError(f"Plantilla desconocida: '{name}'")
+        cached = self.templates.get(name)
+        now = self.clock()
+        if cached and now - self._last_check.get(name, 0) < RELOAD_CHECK_S:
+            return cached[0]
+        self._last_check[name] = now
+
+        path = self.paths[name]
+        try:
+            mtime = os.stat(path).st_mtime
+            if cached and cached[1] == mtime:
+                return cached[0]
+            template = WorkflowTemplate.from_file(name, path)
+        except OSError as e:
+            # Fichero borrado o ilegible: los jobs ya aceptados siguen con la versión compilada
+            if cached:
+                if cached[1] is not None:
+                    print(f"⚠️ Plantilla '{name}' no accesible ({e}). Sigo con la versión anterior.")
+                    logging.warning(f"TEMPLATE UNAVAILABLE | {name} | {path} | {e}")
+                self.templates[name] = (cached[0], None)
+                return cached[0]
+            raise
+        except ValueError as e:
+            if cached:
+                print(f"⚠️ Plantilla '{name}' inválida tras el cambio ({e}). Sigo con la versión anterior.")
+                logging.warning(f"TEMPLATE INVALID | {name} | {path} | {e}")
+                self.templates[name] = (cached[0], mtime)
+                return cached[0]
+            raise
+        if cached:
+            self.reloads += 1
+            print(f"♻️ Plantilla '{name}' recargada desde {path}")
+        self.templates[name] = (template, mtime)
+        return template